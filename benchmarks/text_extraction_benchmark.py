@@ -0,0 +1,248 @@
+"""
+页面文本提取脚本基准测试
+
+对比旧版提取脚本（querySelectorAll('*') + 逐元素 getComputedStyle + indexOf 去重）
+与当前单次 TreeWalker 提取脚本在已下载的 Axure 页面上的耗时。
+
+样本页面来自 DATA_DIR/axure_extract_*/ 下已同步的 HTML（先用 lanhu_get_pages /
+lanhu_get_ai_analyze_page_result 下载过文档即可）；没有已同步的文档或指定 --fixtures 时，
+使用 benchmarks/fixtures/ 下自带的样例页面（表单、流程图、200 行表格、标注面板）。
+测试结果与两个脚本的预期输出差异见 benchmarks/README.md。
+
+用法：
+    python benchmarks/text_extraction_benchmark.py [--data-dir DIR] [--fixtures] [--runs N] [--limit N]
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from playwright.async_api import async_playwright
+
+from lanhu_mcp_server import (
+    AXURE_LOCAL_ORIGIN,
+    DATA_DIR,
+    RENDER_QUIET_MS,
+    RENDER_READY_TIMEOUT_MS,
+    VIEWPORT_HEIGHT,
+    VIEWPORT_WIDTH,
+    _DOM_MUTATION_TRACKER_JS,
+    _PAGE_TEXT_EXTRACTOR_JS,
+    _WAIT_FOR_READY_JS,
+    _format_page_sections,
+    _resource_route_handler,
+)
+
+# 自带的样例页面（Axure 风格的表单、流程图和脚本生成的大表格）
+FIXTURES_DIR = Path(__file__).parent / 'fixtures'
+
+
+# 旧版提取脚本（仅保留用于对比）
+LEGACY_TEXT_EXTRACTOR_JS = '''() => {
+    let sections = [];
+
+    // 1. Extract red annotation/warning text (product key notes)
+    const redTexts = Array.from(document.querySelectorAll('*')).filter(el => {
+        const style = window.getComputedStyle(el);
+        const color = style.color;
+        // Detect red text (rgb(255,0,0) or #ff0000, etc.)
+        return color && (
+            color.includes('rgb(255, 0, 0)') ||
+            color.includes('rgb(255,0,0)') ||
+            color === 'red'
+        );
+    });
+
+    if (redTexts.length > 0) {
+        const redContent = redTexts
+            .map(el => el.textContent.trim())
+            .filter(t => t.length > 0 && t.length < 200)
+            .filter((v, i, a) => a.indexOf(v) === i); // dedupe
+        if (redContent.length > 0) {
+            sections.push("[Important Tips/Warnings]\\n" + redContent.join("\\n"));
+        }
+    }
+
+    // 2. Extract Axure shape/flowchart node text
+    const axureShapes = document.querySelectorAll('[id^="u"], .ax_shape, .shape, [class*="shape"]');
+    const shapeTexts = [];
+    axureShapes.forEach(el => {
+        const text = el.textContent.trim();
+        // Only text with appropriate length (avoid overly long paragraphs)
+        if (text && text.length > 0 && text.length < 100) {
+            shapeTexts.push(text);
+        }
+    });
+
+    if (shapeTexts.length > 5) { // If many shape texts extracted, likely a flowchart
+        const uniqueShapes = [...new Set(shapeTexts)];
+        sections.push("[Flowchart/Component Text]\\n" + uniqueShapes.slice(0, 20).join(" | ")); // max 20
+    }
+
+    // 3. Extract all visible text (most complete content)
+    const bodyText = document.body.innerText || '';
+    if (bodyText.trim()) {
+        sections.push("[Full Page Text]\\n" + bodyText.trim());
+    }
+
+    // 4. If nothing extracted
+    if (sections.length === 0) {
+        return "⚠️ Page text is empty or cannot be extracted (please refer to visual output)";
+    }
+
+    return sections.join("\\n\\n");
+}'''
+
+
+def find_sample_pages(data_dir: Path, limit: int) -> list:
+    """收集已下载文档中的页面（跳过截图目录）"""
+    pages = []
+    for resource_dir in sorted(data_dir.glob('axure_extract_*')):
+        if not resource_dir.is_dir() or resource_dir.name.endswith('_screenshots'):
+            continue
+        for html_path in sorted(resource_dir.glob('*.html')):
+            if html_path.name in ('index.html', 'start.html'):
+                continue
+            pages.append(html_path)
+            if limit and len(pages) >= limit:
+                return pages
+    return pages
+
+
+def find_fixture_pages(limit: int) -> list:
+    """收集自带的样例页面"""
+    pages = sorted(FIXTURES_DIR.glob('*.html'))
+    return pages[:limit] if limit else pages
+
+
+def parse_sections(text: str) -> dict:
+    """把格式化的页面文本拆回分区（红色标注行、流程图节点），用于统计两个脚本的输出差异"""
+    sections = {'red': [], 'shapes': []}
+    for block in text.split('\n\n['):
+        header, _, body = block.lstrip('[').partition(']\n')
+        if header == 'Important Tips/Warnings':
+            sections['red'] = body.split('\n')
+        elif header == 'Flowchart/Component Text':
+            sections['shapes'] = body.split(' | ')
+    return sections
+
+
+def diff_sections(legacy_text: str, current_text: str) -> dict:
+    """各分区中只有旧脚本 / 只有新脚本输出的条目数"""
+    legacy, current = parse_sections(legacy_text), parse_sections(current_text)
+    return {
+        name: (len(set(legacy[name]) - set(current[name])), len(set(current[name]) - set(legacy[name])))
+        for name in ('red', 'shapes')
+    }
+
+
+async def time_script(page, script: str, runs: int) -> tuple:
+    """多次执行脚本，返回 (耗时中位数ms, 最后一次结果)"""
+    durations = []
+    output = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = await page.evaluate(script)
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations), output
+
+
+async def benchmark(pages: list, runs: int) -> list:
+    rows = []
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        context = await browser.new_context(viewport={'width': VIEWPORT_WIDTH, 'height': VIEWPORT_HEIGHT})
+        try:
+            for html_path in pages:
+                page = await context.new_page()
+                try:
+                    await page.add_init_script(_DOM_MUTATION_TRACKER_JS)
+                    await page.route(f"{AXURE_LOCAL_ORIGIN}/**", _resource_route_handler(html_path.parent))
+                    await page.goto(f"{AXURE_LOCAL_ORIGIN}/{html_path.name}", wait_until='load', timeout=30000)
+                    await page.evaluate(_WAIT_FOR_READY_JS, {
+                        'quietMs': RENDER_QUIET_MS,
+                        'ceilingMs': RENDER_READY_TIMEOUT_MS
+                    })
+                    element_count = await page.evaluate("() => document.querySelectorAll('*').length")
+
+                    legacy_ms, legacy_text = await time_script(page, LEGACY_TEXT_EXTRACTOR_JS, runs)
+                    current_ms, sections = await time_script(page, _PAGE_TEXT_EXTRACTOR_JS, runs)
+
+                    current_text = _format_page_sections(sections)
+                    rows.append({
+                        'page': f"{html_path.parent.name}/{html_path.name}",
+                        'elements': element_count,
+                        'legacy_ms': legacy_ms,
+                        'current_ms': current_ms,
+                        'same_output': legacy_text == current_text,
+                        'diff': diff_sections(legacy_text, current_text)
+                    })
+                except Exception as e:
+                    print(f"⚠️ Skipped {html_path}: {e}")
+                finally:
+                    await page.close()
+        finally:
+            await context.close()
+            await browser.close()
+    return rows
+
+
+def print_report(rows: list, runs: int):
+    print(f"\n{'Page':<60} {'Elements':>9} {'Legacy ms':>10} {'Current ms':>11} {'Speedup':>8}  Same")
+    for row in rows:
+        speedup = row['legacy_ms'] / row['current_ms'] if row['current_ms'] else float('inf')
+        print(f"{row['page'][:60]:<60} {row['elements']:>9} {row['legacy_ms']:>10.2f} "
+              f"{row['current_ms']:>11.2f} {speedup:>7.1f}x  {'yes' if row['same_output'] else 'no'}")
+
+    legacy_total = sum(row['legacy_ms'] for row in rows)
+    current_total = sum(row['current_ms'] for row in rows)
+    print(f"\nPages: {len(rows)}, median of {runs} runs each")
+    speedup = legacy_total / current_total if current_total else float('inf')
+    print(f"Total: legacy {legacy_total:.1f}ms, current {current_total:.1f}ms ({speedup:.1f}x faster)")
+    differing = [row for row in rows if not row['same_output']]
+    if differing:
+        # 预期差异见 benchmarks/README.md：红色容器不再重复输出整段文本，
+        # 流程图节点按去重后的数量判断且内层形状排在外层之前（前20条可能不同）
+        print(f"\nOutput differs on {len(differing)} page(s) (entries only in legacy / only in current):")
+        for row in differing:
+            red, shapes = row['diff']['red'], row['diff']['shapes']
+            print(f"  {row['page'][:60]:<60} red -{red[0]}/+{red[1]}  flowchart -{shapes[0]}/+{shapes[1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the in-page text extraction script")
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR, help="Directory holding axure_extract_* folders")
+    parser.add_argument('--fixtures', action='store_true', help="Use the bundled pages in benchmarks/fixtures")
+    parser.add_argument('--runs', type=int, default=5, help="Runs per script per page")
+    parser.add_argument('--limit', type=int, default=0, help="Max number of pages (0 = all)")
+    args = parser.parse_args()
+
+    pages = [] if args.fixtures else find_sample_pages(args.data_dir, args.limit)
+    source = args.data_dir
+    if not pages:
+        if not args.fixtures:
+            print(f"No synced pages found under {args.data_dir}/axure_extract_*/, using bundled fixtures")
+        pages = find_fixture_pages(args.limit)
+        source = FIXTURES_DIR
+    if not pages:
+        print(f"No sample pages found under {source}")
+        return 1
+
+    print(f"Benchmarking {len(pages)} page(s) from {source}")
+    rows = asyncio.run(benchmark(pages, max(1, args.runs)))
+    if not rows:
+        print("No page could be rendered")
+        return 1
+    print_report(rows, max(1, args.runs))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
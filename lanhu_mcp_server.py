@@ -9,6 +9,18 @@ import re
 import base64
 import json
 import hashlib
+import hmac
+import random
+import shutil
+import time
+import threading
+import uuid
+import weakref
+import contextvars
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
 from typing import Annotated, Optional, Union, List, Any
@@ -32,20 +44,63 @@ except ImportError:
 
 # 东八区时区（北京时间）
 CHINA_TZ = timezone(timedelta(hours=8))
-from urllib.parse import urlparse
-
-# 元数据缓存配置（基于版本号的永久缓存）
-_metadata_cache = {}  # {cache_key: {'data': {...}, 'version_id': str}}
+from urllib.parse import unquote, urlparse
 
 import httpx
 from fastmcp import Context
 from bs4 import BeautifulSoup
+from lxml import html as lxml_html
 from fastmcp import FastMCP
 from fastmcp.utilities.types import Image
 from playwright.async_api import async_playwright
 
+# 可选依赖：Pillow（截图转码/缩放，未安装时返回原始PNG）
+try:
+    from PIL import Image as PILImage, ImageChops, ImageFilter
+    PIL_AVAILABLE = True
+except ImportError:
+    PILImage = ImageChops = ImageFilter = None
+    PIL_AVAILABLE = False
+
+# lifespan 引用计数（兼容按会话进入 lifespan 的 FastMCP 版本）
+_lifespan_depth = 0
+
+
+@asynccontextmanager
+async def _server_lifespan(server: FastMCP):
+    """
+    服务器生命周期管理：启动时预热共享资源，关闭时统一释放
+
+    部分 FastMCP 版本会按会话进入 lifespan，这里用引用计数保证
+    只有最后一个使用者退出时才真正关闭共享资源
+    """
+    global _lifespan_depth
+    _lifespan_depth += 1
+    try:
+        get_http_client()
+        if BROWSER_WARMUP and _lifespan_depth == 1:
+            await _browser_pool.warmup()
+        yield
+    finally:
+        _lifespan_depth -= 1
+        if _lifespan_depth == 0:
+            # 后台分析任务不随客户端断开而结束：有任务运行时等最后一个任务结束后再释放
+            await _analysis_jobs.when_idle(_release_shared_resources)
+
+
+async def _release_shared_resources():
+    """释放共享资源（期间有新会话进入时跳过，资源继续使用）"""
+    if _lifespan_depth > 0:
+        return
+    await _browser_pool.close()
+    await close_http_client()
+    _metadata_cache.save()
+    _integrity.shutdown()
+    shutdown_html_fix_executor()
+
+
 # 创建FastMCP服务器
-mcp = FastMCP("Lanhu Axure Extractor")
+mcp = FastMCP("Lanhu Axure Extractor", lifespan=_server_lifespan)
 
 # 全局配置
 DEFAULT_COOKIE = "your_lanhu_cookie_here"  # 请替换为你的蓝湖Cookie，从浏览器开发者工具中获取
@@ -64,17 +119,87 @@ FEISHU_WEBHOOK_URL = os.getenv("FEISHU_WEBHOOK_URL", DEFAULT_FEISHU_WEBHOOK)
 DATA_DIR = Path(os.getenv("DATA_DIR", "./data"))
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
+# Axure CDN资源的全局内容寻址存储目录（按 sign_md5 去重，跨文档/版本共享）
+BLOB_STORE_DIR = Path(os.getenv("BLOB_STORE_DIR", str(DATA_DIR / "blobs")))
+# 文档资源目录的物化方式：hardlink（默认，失败时回退symlink）/ symlink / copy
+BLOB_LINK_MODE = os.getenv("BLOB_LINK_MODE", "hardlink").lower()
+
 # HTTP 请求超时时间（秒）
 HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
 
+# 元数据缓存配置（文档级基于版本号永久有效，项目级按 CACHE_TTL 过期）
+METADATA_CACHE_MAX_ENTRIES = int(os.getenv("METADATA_CACHE_MAX_ENTRIES", "2000"))
+# 无版本号的项目级缓存过期时间（秒），设为0则不过期
+CACHE_TTL = int(os.getenv("CACHE_TTL", "3600"))
+
+# 项目级mapping JSON缓存上限（按版本ID缓存解析结果，LRU淘汰）
+MAPPING_CACHE_MAX_ENTRIES = int(os.getenv("MAPPING_CACHE_MAX_ENTRIES", "256"))
+MAPPING_CACHE_MAX_MB = int(os.getenv("MAPPING_CACHE_MAX_MB", "64"))
+# 解析后的mapping（dict/list/str 对象）占用内存约为原始JSON字节数的倍数，用于估算缓存大小
+MAPPING_MEMORY_FACTOR = 8
+
+# 页面级下载流水线的全局并发上限（所有文档共享）
+PAGE_DOWNLOAD_CONCURRENCY = int(os.getenv("PAGE_DOWNLOAD_CONCURRENCY", "8"))
+
+# CDN下载引擎：每个主机的最大并发下载数
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv("MAX_CONCURRENT_DOWNLOADS", "16"))
+# 可重试错误（429/5xx/网络错误）的最大重试次数与退避参数（秒）
+DOWNLOAD_MAX_RETRIES = int(os.getenv("DOWNLOAD_MAX_RETRIES", "3"))
+DOWNLOAD_RETRY_BASE_DELAY = float(os.getenv("DOWNLOAD_RETRY_BASE_DELAY", "0.5"))
+DOWNLOAD_RETRY_MAX_DELAY = float(os.getenv("DOWNLOAD_RETRY_MAX_DELAY", "10"))
+# 流式下载：单次写盘的缓冲大小；不小于该大小的未完成文件保留 .part 以便 Range 续传
+DOWNLOAD_WRITE_BUFFER = 1024 * 1024
+DOWNLOAD_RESUME_MIN_BYTES = int(os.getenv("DOWNLOAD_RESUME_MIN_BYTES", str(1024 * 1024)))
+
+# 文件完整性校验的哈希线程数
+INTEGRITY_HASH_WORKERS = int(os.getenv("INTEGRITY_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# HTML修复：单次超过多少个页面时改用进程池并行处理，以及进程池大小
+HTML_FIX_PROCESS_THRESHOLD = int(os.getenv("HTML_FIX_PROCESS_THRESHOLD", "20"))
+HTML_FIX_WORKERS = int(os.getenv("HTML_FIX_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# HTTP 连接池配置（进程级共享，所有请求复用长连接）
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+# 启用 HTTP/2（需要安装 h2：pip install httpx[http2]）
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+
 # 浏览器视口尺寸（影响页面初始渲染，不影响全页截图）
 # 注意：截图使用 full_page=True，会自动截取完整页面，不受此限制
 VIEWPORT_WIDTH = int(os.getenv("VIEWPORT_WIDTH", "1920"))
 VIEWPORT_HEIGHT = int(os.getenv("VIEWPORT_HEIGHT", "1080"))
 
+# 浏览器池：常驻 Chromium 的预热上下文数量、单个上下文最多渲染次数（超过后回收重建）
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+BROWSER_CONTEXT_MAX_RENDERS = int(os.getenv("BROWSER_CONTEXT_MAX_RENDERS", "50"))
+# 服务启动时预热浏览器（关闭后在首次截图时再启动）
+BROWSER_WARMUP = os.getenv("BROWSER_WARMUP", "true").lower() == "true"
+
+# 返回给客户端的截图格式：webp / jpeg / png（需要安装 Pillow，png 表示不转码）
+SCREENSHOT_FORMAT = os.getenv("SCREENSHOT_FORMAT", "webp").lower()
+# 有损格式的压缩质量（1-100）
+SCREENSHOT_QUALITY = int(os.getenv("SCREENSHOT_QUALITY", "80"))
+# 图片最长边上限（像素，超过等比缩小；0 表示不缩放）
+# 默认不缩放：超长页面按最长边缩放会使文字不可读，超长页面请使用分块截图（max_tiles）
+SCREENSHOT_MAX_DIMENSION = int(os.getenv("SCREENSHOT_MAX_DIMENSION", "0"))
+
+# 分块截图模式下每块的高度（像素），用于超长页面按预算分批返回
+SCREENSHOT_TILE_HEIGHT = int(os.getenv("SCREENSHOT_TILE_HEIGHT", str(VIEWPORT_HEIGHT)))
+
+# 每个文档记录的版本数量（各版本的页面签名，用于 since_version 版本对比）
+VERSION_HISTORY_LIMIT = int(os.getenv("VERSION_HISTORY_LIMIT", "10"))
+
+# 后台分析任务结束后结果保留时间（秒）
+ANALYSIS_JOB_TTL = int(os.getenv("ANALYSIS_JOB_TTL", "3600"))
+
 # 调试模式
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 
+# 运行状态监控接口 GET /stats（默认关闭；设置 STATS_TOKEN 后需携带 Authorization: Bearer <token>）
+STATS_ENDPOINT_ENABLED = os.getenv("STATS_ENDPOINT_ENABLED", "false").lower() == "true"
+STATS_TOKEN = os.getenv("STATS_TOKEN", "")
+
 # 角色枚举（用于识别用户身份）
 VALID_ROLES = ["后端", "前端", "客户端", "开发", "运维", "产品", "项目经理"]
 
@@ -158,6 +283,222 @@ def normalize_role(role: str) -> str:
     return role
 
 
+# ============================================
+# 缓存工具
+# ============================================
+
+class LRUCache:
+    """
+    有界LRU缓存（按条目数和估算字节数双重限制，支持条目级TTL）
+
+    条目数或字节数任一超限时，从最久未使用的条目开始淘汰；上限为0表示不限制
+    """
+
+    def __init__(self, name: str, max_entries: int = 0, max_bytes: int = 0):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._data = OrderedDict()  # {key: (value, size, expires_at)}
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+    def get(self, key, default=None):
+        """获取缓存值（命中时刷新为最近使用），未命中或已过期返回default"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return default
+        value, size, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            self.pop(key)
+            self.stats['expired'] += 1
+            self.stats['misses'] += 1
+            return default
+        self._data.move_to_end(key)
+        self.stats['hits'] += 1
+        return value
+
+    def set(self, key, value, size: int = 1, ttl: float = None, expires_at: float = None):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+            size: 估算字节数（用于字节上限）
+            ttl: 过期秒数，None表示不过期
+            expires_at: 绝对过期时间戳（优先于ttl，用于从快照恢复）
+        """
+        if expires_at is None and ttl is not None:
+            expires_at = time.time() + ttl
+        self.pop(key)
+        self._data[key] = (value, size, expires_at)
+        self.total_bytes += size
+        self._evict()
+
+    def pop(self, key, default=None):
+        """删除条目，返回其值"""
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+        self.total_bytes -= entry[1]
+        return entry[0]
+
+    def _evict(self):
+        while self._data and (
+            (self.max_entries and len(self._data) > self.max_entries) or
+            (self.max_bytes and self.total_bytes > self.max_bytes)
+        ):
+            _, (_, size, _) = self._data.popitem(last=False)
+            self.total_bytes -= size
+            self.stats['evictions'] += 1
+
+    def entries(self) -> list:
+        """按从旧到新的顺序返回 [(key, value, size, expires_at)]"""
+        return [(k, v, size, exp) for k, (v, size, exp) in self._data.items()]
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def snapshot(self) -> dict:
+        """获取统计快照"""
+        return {**self.stats, 'entries': len(self._data), 'bytes': self.total_bytes}
+
+
+# 项目级mapping JSON缓存：{version_id: 解析后的mapping}
+# 同一版本的mapping不可变，get_pages_list 与 download_resources 共用
+_mapping_cache = LRUCache(
+    'mapping',
+    max_entries=MAPPING_CACHE_MAX_ENTRIES,
+    max_bytes=MAPPING_CACHE_MAX_MB * 1024 * 1024
+)
+
+
+class MetadataCache(LRUCache):
+    """
+    元数据缓存（_fetch_metadata_from_url 的输出）
+
+    - 文档级条目携带 version_id，版本不变即永久有效，版本变化时失效
+    - 项目级条目没有版本号，按 CACHE_TTL 过期
+    - 超过条目上限时按LRU淘汰
+    - 写入后延迟 FLUSH_DELAY 秒在线程中落盘快照（期间的多次写入合并为一次），关闭时再保存一次；
+      启动时重新加载，避免重新部署后集中回源
+    """
+
+    FLUSH_DELAY = 5
+
+    def __init__(self, snapshot_path: Path, max_entries: int, ttl: int):
+        super().__init__('metadata', max_entries=max_entries)
+        self.snapshot_path = snapshot_path
+        self.ttl = ttl or None
+        self.dirty = False
+        self._flush_task = None
+        self._write_lock = threading.Lock()  # 后台落盘与关闭时的保存不会同时写临时文件
+        self.load()
+
+    def get_metadata(self, cache_key: str, version_id: str = None) -> Optional[dict]:
+        """获取缓存的元数据（提供version_id时检查版本是否匹配）"""
+        cache_entry = self.get(cache_key)
+        if cache_entry is None:
+            return None
+
+        if version_id and cache_entry.get('version_id') != version_id:
+            # 版本不匹配，删除旧缓存
+            self.pop(cache_key)
+            return None
+
+        return cache_entry['data'].copy()
+
+    def set_metadata(self, cache_key: str, metadata: dict, version_id: str = None):
+        """写入元数据并安排落盘快照（无版本号的条目按TTL过期）"""
+        entry = {
+            'data': metadata.copy(),
+            'version_id': version_id  # 版本号作为缓存有效性标识
+        }
+        self.set(cache_key, entry, ttl=None if version_id else self.ttl)
+        self.dirty = True
+        if self._flush_task is None or self._flush_task.done():
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+            except RuntimeError:
+                # 没有事件循环（同步调用）时直接保存
+                self.save()
+
+    async def _flush_later(self):
+        """延迟合并写入：等待期间的新写入一起落盘，写盘在线程中执行"""
+        while self.dirty:
+            await asyncio.sleep(self.FLUSH_DELAY)
+            self.dirty = False
+            snapshot = self._snapshot()
+            await asyncio.to_thread(self._write_snapshot, snapshot)
+
+    def load(self):
+        """从快照文件恢复缓存（跳过已过期条目）"""
+        if not self.snapshot_path.exists():
+            return
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except Exception:
+            return
+
+        now = time.time()
+        entries = snapshot.get('entries', []) if isinstance(snapshot, dict) else []
+        for item in entries:
+            # 单个条目格式错误时跳过，不影响其余条目和服务启动
+            try:
+                expires_at = item.get('expires_at')
+                if expires_at is not None and expires_at <= now:
+                    continue
+                self.set(
+                    item['key'],
+                    {'data': item['data'], 'version_id': item.get('version_id')},
+                    expires_at=expires_at
+                )
+            except Exception:
+                continue
+
+    def _snapshot(self) -> dict:
+        """生成快照内容（按LRU顺序保存，恢复后淘汰顺序不变）"""
+        return {
+            'entries': [
+                {
+                    'key': key,
+                    'version_id': value.get('version_id'),
+                    'data': value['data'],
+                    'expires_at': expires_at
+                }
+                for key, value, _, expires_at in self.entries()
+            ]
+        }
+
+    def save(self):
+        """立即原子写入快照文件（服务关闭时调用）"""
+        self.dirty = False
+        self._write_snapshot(self._snapshot())
+
+    def _write_snapshot(self, snapshot: dict):
+        try:
+            tmp_path = self.snapshot_path.with_suffix('.tmp')
+            with self._write_lock:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False)
+                os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            print(f"⚠️ 元数据缓存快照保存失败: {e}")
+
+
+# 元数据缓存（启动时从 DATA_DIR 下的快照恢复）
+_metadata_cache = MetadataCache(
+    DATA_DIR / "metadata_cache.json",
+    max_entries=METADATA_CACHE_MAX_ENTRIES,
+    ttl=CACHE_TTL
+)
+
+
 def _get_metadata_cache_key(project_id: str, doc_id: str = None) -> str:
     """生成元数据缓存键（不含版本号，用于查找）"""
     if doc_id:
@@ -174,39 +515,21 @@ def _get_cached_metadata(cache_key: str, version_id: str = None) -> Optional[dic
         version_id: 文档版本ID，如果提供则检查版本是否匹配
     
     Returns:
-        缓存的元数据，如果未命中或版本不匹配则返回None
+        缓存的元数据，如果未命中、已过期或版本不匹配则返回None
     """
-    if cache_key in _metadata_cache:
-        cache_entry = _metadata_cache[cache_key]
-        
-        # 如果提供了version_id，检查版本是否匹配
-        if version_id:
-            if cache_entry.get('version_id') == version_id:
-                return cache_entry['data']
-            else:
-                # 版本不匹配，删除旧缓存
-                del _metadata_cache[cache_key]
-                return None
-        
-        # 没有version_id，直接返回缓存（用于项目级别缓存）
-        return cache_entry['data']
-    
-    return None
+    return _metadata_cache.get_metadata(cache_key, version_id)
 
 
 def _set_cached_metadata(cache_key: str, metadata: dict, version_id: str = None):
     """
-    设置缓存（基于版本号的永久缓存）
+    设置缓存
     
     Args:
         cache_key: 缓存键
         metadata: 元数据
-        version_id: 文档版本ID，存储后只要版本不变就永久有效
+        version_id: 文档版本ID，存储后只要版本不变就永久有效；为空时按 CACHE_TTL 过期
     """
-    _metadata_cache[cache_key] = {
-        'data': metadata.copy(),
-        'version_id': version_id  # 版本号作为缓存有效性标识
-    }
+    _metadata_cache.set_metadata(cache_key, metadata, version_id)
 
 
 # ============================================
@@ -782,6 +1105,12 @@ async def _fetch_metadata_from_url(url: str) -> dict:
         
         # 生成缓存键
         cache_key = _get_metadata_cache_key(project_id, doc_id)
+
+        # 项目级元数据（无doc_id）没有版本号，按TTL缓存
+        if not doc_id:
+            cached = _get_cached_metadata(cache_key)
+            if cached:
+                return cached
         
         # 如果有doc_id，获取文档信息和版本号
         version_id = None
@@ -822,23 +1151,10 @@ async def _fetch_metadata_from_url(url: str) -> dict:
         
         # 获取项目信息
         if project_id and team_id:
-            try:
-                response = await extractor.client.get(
-                    f"{BASE_URL}/api/project/multi_info",
-                    params={
-                        'project_id': project_id,
-                        'team_id': team_id,
-                        'doc_info': 1
-                    }
-                )
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('code') == '00000':
-                        project_info = data.get('result', {})
-                        metadata['project_name'] = project_info.get('name')
-                        metadata['folder_name'] = project_info.get('folder_name')
-            except Exception:
-                pass
+            project_info = await extractor.get_project_info(project_id, team_id)
+            if project_info:
+                metadata['project_name'] = project_info.get('name')
+                metadata['folder_name'] = project_info.get('folder_name')
         
         # 存入缓存（基于版本号）
         _set_cached_metadata(cache_key, metadata, version_id)
@@ -851,6 +1167,585 @@ async def _fetch_metadata_from_url(url: str) -> dict:
     return metadata
 
 
+# ============================================
+# HTTP 连接池（进程级共享）
+# ============================================
+
+LANHU_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36",
+    "Referer": "https://lanhuapp.com/web/",
+    "Accept": "application/json, text/plain, */*",
+    "Cookie": COOKIE,
+    "sec-ch-ua": '"Chromium";v="142", "Google Chrome";v="142", "Not_A Brand";v="99"',
+    "sec-ch-ua-mobile": "?0",
+    "sec-ch-ua-platform": '"macOS"',
+    "request-from": "web",
+    "real-path": "/item/project/product"
+}
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    获取进程级共享的HTTP客户端（懒加载）
+
+    所有 LanhuExtractor 实例共用同一个连接池，lanhuapp.com 与
+    axure-file.lanhuapp.com 的 TLS 连接在请求之间保持复用，
+    仅在服务器关闭时由 lifespan 统一释放
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        http2 = HTTP2_ENABLED
+        if http2:
+            import importlib.util
+            if importlib.util.find_spec('h2') is None:
+                print("⚠️ HTTP2_ENABLED=true 但未安装 h2，回退到 HTTP/1.1")
+                http2 = False
+        limits = httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+        _http_client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            headers=LANHU_HEADERS,
+            follow_redirects=True,
+            limits=limits,
+            http2=http2
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """关闭共享HTTP客户端（仅在服务器关闭时调用）"""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+# ============================================
+# 上游请求合并（single-flight）
+# ============================================
+
+class SingleFlight:
+    """
+    在途请求去重：相同key的并发调用共享同一次执行及其结果
+
+    第一个调用者（leader）发起执行，其余并发调用者（join）直接等待同一个任务；
+    任务结束后立即从在途表移除，这里只做合并不做缓存
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight = {}  # {key: asyncio.Task}
+        self.stats = {'calls': 0, 'leaders': 0, 'joins': 0, 'errors': 0, 'retries': 0}
+
+    async def do(self, key, func, cancel_with_leader: bool = False):
+        """
+        执行或加入一次调用
+
+        Args:
+            key: 合并键（需可哈希）
+            func: 无参协程函数，仅由leader执行
+            cancel_with_leader: 任务依赖leader持有的资源（如浏览器页面）时设为True：
+                                leader被取消时同时取消任务，等待者改为用自己的 func 重试
+
+        Returns:
+            func 的返回值（所有调用者共享同一对象，调用方不应修改）
+        """
+        self.stats['calls'] += 1
+        while True:
+            task = self._inflight.get(key)
+            is_leader = task is None
+            if is_leader:
+                self.stats['leaders'] += 1
+                task = asyncio.ensure_future(func())
+                self._inflight[key] = task
+                task.add_done_callback(lambda t, k=key: self._on_done(k, t))
+            else:
+                self.stats['joins'] += 1
+
+            # asyncio.wait：某个调用者被取消时不影响任务本身及其它等待者
+            try:
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                if is_leader and cancel_with_leader:
+                    task.cancel()
+                    # 等任务真正结束后再返回，调用方随后才释放任务使用的资源
+                    await asyncio.wait({task})
+                raise
+
+            if task.cancelled() and not is_leader and cancel_with_leader:
+                self.stats['retries'] += 1
+                continue
+            return task.result()
+
+    def _on_done(self, key, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 读取异常，避免所有等待者都已取消时出现 "exception was never retrieved"
+        if not task.cancelled() and task.exception() is not None:
+            self.stats['errors'] += 1
+
+    def snapshot(self) -> dict:
+        """获取统计快照"""
+        return {**self.stats, 'inflight': len(self._inflight)}
+
+
+def _request_key(method: str, url: str, params: dict = None) -> tuple:
+    """生成请求合并键（method + URL + 排序后的参数）"""
+    items = tuple(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+    return (method.upper(), url, items)
+
+
+# 蓝湖上游API请求合并器（文档信息、项目信息、mapping JSON）
+_upstream_flight = SingleFlight('upstream')
+
+# 文档级任务登记表：同一文档的资源同步、同一页面同一签名的渲染只执行一次，并发调用者直接加入
+_job_flight = SingleFlight('jobs')
+
+# 文档级写锁 {目录: asyncio.Lock}（无人持有时自动回收）
+_document_locks = weakref.WeakValueDictionary()
+
+
+def _document_lock(directory) -> asyncio.Lock:
+    """获取文档目录的写锁，保证同一文档目录的写入串行执行"""
+    key = str(Path(directory).resolve())
+    lock = _document_locks.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        _document_locks[key] = lock
+    return lock
+
+
+# ============================================
+# CDN 下载引擎（按主机限流 + 重试退避）
+# ============================================
+
+class DownloadEngine:
+    """
+    CDN下载引擎
+
+    - 每个主机一个信号量，限制同时进行的下载数
+    - 429/5xx 和网络错误按指数退避（全抖动）重试，优先遵循 Retry-After
+    - 重试耗尽后抛出异常，由调用方汇总为失败清单
+    """
+
+    RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, per_host: int, max_retries: int, base_delay: float, max_delay: float):
+        self.per_host = per_host
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphores = {}  # {host: asyncio.Semaphore}
+        self._flight = SingleFlight('download_to')  # 同一URL下载到同一文件的并发调用合并
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0, 'resumed': 0, 'restarted': 0}
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.per_host)
+        return semaphore
+
+    def _retry_delay(self, attempt: int, response: httpx.Response = None) -> float:
+        """计算第attempt次重试前的等待时间"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def get(self, client: httpx.AsyncClient, url: str, **kwargs) -> httpx.Response:
+        """
+        GET 请求（带主机限流与重试）
+
+        Returns:
+            状态码为2xx的响应
+
+        Raises:
+            httpx.HTTPStatusError / httpx.TransportError: 重试耗尽或不可重试的错误
+        """
+        attempt = 0
+        while True:
+            self.stats['requests'] += 1
+            response = None
+            try:
+                async with self._host_semaphore(url):
+                    response = await client.get(url, **kwargs)
+                if response.status_code not in self.RETRYABLE_STATUS or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    self.stats['failures'] += 1
+                    raise
+            except httpx.HTTPStatusError:
+                self.stats['failures'] += 1
+                raise
+
+            delay = self._retry_delay(attempt, response)
+            attempt += 1
+            self.stats['retries'] += 1
+            await asyncio.sleep(delay)
+
+    async def download_to(self, client: httpx.AsyncClient, url: str, dest: Path) -> int:
+        """
+        流式下载到文件（带主机限流与重试）
+
+        分块写入同目录的 .part 临时文件（按URL区分），完成并校验长度后原子重命名；
+        较大的文件中断后保留 .part，重试或下次调用时通过 Range + If-Range 请求续传，
+        服务端文件已变化时返回完整内容（200）并从头写入。
+        写盘在线程中进行，内存占用与文件大小无关
+
+        Returns:
+            文件总字节数
+        """
+        return await self._flight.do((url, str(dest)), lambda: self._download_to(client, url, dest))
+
+    async def _download_to(self, client: httpx.AsyncClient, url: str, dest: Path) -> int:
+        """download_to 的实际实现（同一URL与目标文件只有一个在途下载）"""
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tag = hashlib.md5(url.encode('utf-8')).hexdigest()[:12]
+        part_path = dest.with_name(f"{dest.name}.{tag}.part")
+        validator_path = dest.with_name(f"{dest.name}.{tag}.part.validator")
+        attempt = 0
+        while True:
+            self.stats['requests'] += 1
+            offset = part_path.stat().st_size if part_path.exists() else 0
+            validator = validator_path.read_text(encoding='utf-8') if validator_path.exists() else ''
+            headers = {}
+            if offset and validator:
+                # 续传时请求未压缩内容，保证字节偏移与已写入的（解压后）内容一致；
+                # If-Range：内容已变化时服务端返回完整的200响应
+                headers = {'Range': f'bytes={offset}-', 'If-Range': validator, 'Accept-Encoding': 'identity'}
+            retry_response = None
+            try:
+                async with self._host_semaphore(url):
+                    async with client.stream('GET', url, headers=headers) as response:
+                        if response.status_code == 416:
+                            # 续传起点无效（服务端文件已变化等），丢弃临时文件从头下载
+                            part_path.unlink(missing_ok=True)
+                            validator_path.unlink(missing_ok=True)
+                            raise httpx.HTTPStatusError(
+                                "Range not satisfiable", request=response.request, response=response
+                            )
+                        if response.status_code in self.RETRYABLE_STATUS and attempt < self.max_retries:
+                            retry_response = response
+                        else:
+                            response.raise_for_status()
+                            append = bool(headers) and response.status_code == 206
+                            if append and not self._range_matches(response, offset):
+                                # 续传响应的起点或总长与本地临时文件对不上，拼接会得到错误内容，从头下载
+                                part_path.unlink(missing_ok=True)
+                                validator_path.unlink(missing_ok=True)
+                                self.stats['restarted'] += 1
+                                continue
+                            if append:
+                                self.stats['resumed'] += 1
+                            else:
+                                if offset:
+                                    self.stats['restarted'] += 1
+                                await asyncio.to_thread(self._write_validator, validator_path, response)
+                            written = await self._write_stream(response, part_path, append)
+                            # 校验长度：有压缩编码时 Content-Length 对应接收的原始字节数
+                            expected = response.headers.get('Content-Length')
+                            encoded = response.headers.get('Content-Encoding', 'identity') != 'identity'
+                            received = response.num_bytes_downloaded if encoded else written
+                            if expected is not None and received != int(expected):
+                                raise httpx.ReadError("Incomplete download", request=response.request)
+                            await asyncio.to_thread(os.replace, part_path, dest)
+                            validator_path.unlink(missing_ok=True)
+                            return (offset if append else 0) + written
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    self.stats['failures'] += 1
+                    self._discard_small_part(part_path, validator_path)
+                    raise
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 416 and attempt < self.max_retries:
+                    retry_response = None
+                else:
+                    self.stats['failures'] += 1
+                    self._discard_small_part(part_path, validator_path)
+                    raise
+
+            delay = self._retry_delay(attempt, retry_response)
+            attempt += 1
+            self.stats['retries'] += 1
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    async def _write_stream(response: httpx.Response, part_path: Path, append: bool) -> int:
+        """把响应流按缓冲块写入文件（写盘在线程中执行，不阻塞事件循环），返回本次写入的字节数"""
+        f = await asyncio.to_thread(open, part_path, 'ab' if append else 'wb')
+        try:
+            written = 0
+            buffer = bytearray()
+            async for chunk in response.aiter_bytes():
+                buffer.extend(chunk)
+                if len(buffer) >= DOWNLOAD_WRITE_BUFFER:
+                    await asyncio.to_thread(f.write, bytes(buffer))
+                    written += len(buffer)
+                    buffer.clear()
+            if buffer:
+                await asyncio.to_thread(f.write, bytes(buffer))
+                written += len(buffer)
+            return written
+        finally:
+            await asyncio.to_thread(f.close)
+
+    @staticmethod
+    def _range_matches(response: httpx.Response, offset: int) -> bool:
+        """206响应的 Content-Range 是否从 offset 开始并一直到文件末尾"""
+        match = re.fullmatch(r'bytes\s+(\d+)-(\d+)/(\d+|\*)', response.headers.get('Content-Range', '').strip())
+        if not match:
+            return False
+        start, end, total = match.groups()
+        return int(start) == offset and (total == '*' or int(total) == int(end) + 1)
+
+    @staticmethod
+    def _write_validator(validator_path: Path, response: httpx.Response):
+        """记录完整响应的校验值（强 ETag 优先，其次 Last-Modified），续传时作为 If-Range 发送"""
+        etag = response.headers.get('ETag', '')
+        validator = etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified', '')
+        if validator:
+            validator_path.write_text(validator, encoding='utf-8')
+        else:
+            # 没有校验值无法安全续传，下次从头下载
+            validator_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _discard_small_part(part_path: Path, validator_path: Path):
+        """放弃下载时删除较小的临时文件（大文件保留以便续传）"""
+        if part_path.exists() and part_path.stat().st_size < DOWNLOAD_RESUME_MIN_BYTES:
+            part_path.unlink(missing_ok=True)
+            validator_path.unlink(missing_ok=True)
+
+    def snapshot(self) -> dict:
+        """获取统计快照"""
+        return dict(self.stats)
+
+
+_download_engine = DownloadEngine(
+    per_host=MAX_CONCURRENT_DOWNLOADS,
+    max_retries=DOWNLOAD_MAX_RETRIES,
+    base_delay=DOWNLOAD_RETRY_BASE_DELAY,
+    max_delay=DOWNLOAD_RETRY_MAX_DELAY
+)
+
+
+# ============================================
+# 内容寻址资源存储（Axure CDN 资源）
+# ============================================
+
+class BlobStore:
+    """
+    Axure CDN资源的内容寻址存储
+
+    CDN路径（sign_md5）本身就是内容哈希：同一个 sign_md5 全局只下载一次，
+    各文档的资源目录通过硬链接（或符号链接）从存储中物化出来
+    """
+
+    def __init__(self, root: Path, link_mode: str = 'hardlink'):
+        self.root = root
+        self.link_mode = link_mode
+        self._flight = SingleFlight('blob')
+        self.stats = {
+            'hits': 0,
+            'fetches': 0,
+            'bytes_fetched': 0,
+            'bytes_reused': 0,
+            'link_fallbacks': 0
+        }
+
+    def blob_path(self, sign_md5: str) -> Path:
+        """sign_md5 对应的存储路径（保留扩展名，按前两位分目录）"""
+        digest = hashlib.md5(sign_md5.encode('utf-8')).hexdigest()
+        suffix = Path(urlparse(sign_md5).path).suffix[:16]
+        return self.root / digest[:2] / f"{digest}{suffix}"
+
+    async def ensure(self, sign_md5: str, url: str, client: httpx.AsyncClient) -> Path:
+        """
+        确保资源已在存储中，不存在时下载（同一资源的并发请求只下载一次）
+
+        Returns:
+            blob 文件路径
+        """
+        path = self.blob_path(sign_md5)
+        if path.exists():
+            self.stats['hits'] += 1
+            self.stats['bytes_reused'] += path.stat().st_size
+            return path
+
+        async def fetch():
+            # 流式写入临时文件后原子重命名，不会读到半个文件
+            size = await _download_engine.download_to(client, url, path)
+            self.stats['fetches'] += 1
+            self.stats['bytes_fetched'] += size
+            return path
+
+        return await self._flight.do(path.name, fetch)
+
+    def materialize(self, blob: Path, dest: Path):
+        """把blob物化到文档资源目录（先删除旧文件，避免写穿共享的硬链接）"""
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if dest.exists() and os.path.samefile(dest, blob):
+            return
+        if dest.exists() or dest.is_symlink():
+            dest.unlink()
+
+        if self.link_mode == 'hardlink':
+            try:
+                os.link(blob, dest)
+                return
+            except OSError:
+                # 跨文件系统等情况无法硬链接，回退到符号链接
+                self.stats['link_fallbacks'] += 1
+        if self.link_mode in ('hardlink', 'symlink'):
+            try:
+                os.symlink(blob.resolve(), dest)
+                return
+            except OSError:
+                self.stats['link_fallbacks'] += 1
+        shutil.copyfile(blob, dest)
+
+    def discard(self, sign_md5: str):
+        """删除已损坏的blob（下次使用时重新下载）"""
+        self.blob_path(sign_md5).unlink(missing_ok=True)
+
+    def snapshot(self) -> dict:
+        """获取统计快照"""
+        return dict(self.stats)
+
+
+_blob_store = BlobStore(BLOB_STORE_DIR, link_mode=BLOB_LINK_MODE)
+
+
+# ============================================
+# 文件完整性校验（指纹缓存）
+# ============================================
+
+def _md5_file(path: Path) -> str:
+    """计算文件MD5（在线程池中执行）"""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IntegrityEngine:
+    """
+    文件完整性校验引擎
+
+    - 下载完成时记录文件指纹 [size, mtime_ns, md5]，保存在 .lanhu_cache.json
+    - 校验时 stat 未变化的文件直接信任指纹，变化的才在线程池中重新计算MD5
+    - 同一 inode 的哈希结果在进程内复用（硬链接到同一blob的文件只计算一次）
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor = None  # 首次使用时创建，关闭后可再次创建（lifespan 可能按会话多次进入/退出）
+        self._memo = LRUCache('file_hash', max_entries=50000)  # {(dev, ino, size, mtime_ns): md5}
+        self.stats = {'stat_hits': 0, 'hashed': 0, 'bytes_hashed': 0, 'corrupted': 0}
+
+    async def _hash(self, path: Path, st: os.stat_result) -> str:
+        memo_key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        md5 = self._memo.get(memo_key)
+        if md5 is None:
+            loop = asyncio.get_running_loop()
+            md5 = await loop.run_in_executor(self._get_executor(), _md5_file, path)
+            self._memo.set(memo_key, md5)
+            self.stats['hashed'] += 1
+            self.stats['bytes_hashed'] += st.st_size
+        return md5
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """获取哈希线程池（首次使用时创建）"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='lanhu-hash')
+        return self._executor
+
+    async def fingerprint(self, path: Path) -> list:
+        """计算文件指纹 [size, mtime_ns, md5]"""
+        st = path.stat()
+        return [st.st_size, st.st_mtime_ns, await self._hash(path, st)]
+
+    async def fingerprint_many(self, output_dir: Path, rel_paths: list) -> dict:
+        """批量计算指纹 {相对路径: 指纹}，不存在的文件跳过"""
+        rel_paths = [p for p in rel_paths if (output_dir / p).is_file()]
+        prints = await asyncio.gather(*(self.fingerprint(output_dir / p) for p in rel_paths))
+        return dict(zip(rel_paths, prints))
+
+    async def verify(self, output_dir: Path, expected_files: dict, fingerprints: dict) -> dict:
+        """
+        校验文件完整性
+
+        Args:
+            output_dir: 输出目录
+            expected_files: 期望的文件字典 {相对路径: md5签名}
+            fingerprints: 已记录的指纹 {相对路径: [size, mtime_ns, md5]}，
+                          校验中会就地更新（stat变化但内容未变的文件刷新指纹，无指纹的文件补录）
+
+        Returns:
+            {
+                'missing': [缺失的文件列表],
+                'corrupted': [损坏的文件列表],
+                'valid': [有效的文件列表]
+            }
+        """
+        result = {'missing': [], 'corrupted': [], 'valid': []}
+        to_hash = []
+
+        for rel_path in expected_files:
+            file_path = output_dir / rel_path
+            try:
+                st = file_path.stat()
+            except OSError:
+                result['missing'].append(rel_path)
+                continue
+
+            recorded = fingerprints.get(rel_path)
+            if file_path.is_dir():
+                result['valid'].append(rel_path)
+            elif recorded and recorded[0] == st.st_size and recorded[1] == st.st_mtime_ns:
+                self.stats['stat_hits'] += 1
+                result['valid'].append(rel_path)
+            else:
+                to_hash.append((rel_path, file_path, st, recorded))
+
+        hashes = await asyncio.gather(*(self._hash(file_path, st) for _, file_path, st, _ in to_hash))
+        for (rel_path, _, st, recorded), md5 in zip(to_hash, hashes):
+            if recorded and recorded[2] != md5:
+                # 内容与下载时记录的不一致（截断、损坏或被改写）
+                self.stats['corrupted'] += 1
+                result['corrupted'].append(rel_path)
+            else:
+                fingerprints[rel_path] = [st.st_size, st.st_mtime_ns, md5]
+                result['valid'].append(rel_path)
+
+        return result
+
+    def shutdown(self):
+        """关闭哈希线程池（之后再次使用时重新创建）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def snapshot(self) -> dict:
+        """获取统计快照"""
+        return {**self.stats, 'memo_entries': len(self._memo)}
+
+
+_integrity = IntegrityEngine(INTEGRITY_HASH_WORKERS)
+
+# 页面级下载流水线的全局并发控制（所有文档的下载共享）
+_page_download_semaphore = asyncio.Semaphore(PAGE_DOWNLOAD_CONCURRENCY)
+
 
 class LanhuExtractor:
     """蓝湖提取器"""
@@ -858,18 +1753,10 @@ class LanhuExtractor:
     CACHE_META_FILE = ".lanhu_cache.json"  # 缓存元数据文件名
 
     def __init__(self):
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36",
-            "Referer": "https://lanhuapp.com/web/",
-            "Accept": "application/json, text/plain, */*",
-            "Cookie": COOKIE,
-            "sec-ch-ua": '"Chromium";v="142", "Google Chrome";v="142", "Not_A Brand";v="99"',
-            "sec-ch-ua-mobile": "?0",
-            "sec-ch-ua-platform": '"macOS"',
-            "request-from": "web",
-            "real-path": "/item/project/product"
-        }
-        self.client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, headers=headers, follow_redirects=True)
+        # 借用进程级共享连接池，不再为每次调用单独建立连接
+        self.client = get_http_client()
+        # 单次调用内的文档信息备忘（同一工具调用内多次获取只请求一次）
+        self._doc_info_memo = {}
 
     def parse_url(self, url: str) -> dict:
         """
@@ -930,52 +1817,126 @@ class LanhuExtractor:
             'version_id': version_id
         }
 
+    async def _get_json(self, url: str, params: dict = None):
+        """
+        GET 请求并解析JSON
+
+        相同 URL+参数 的并发请求合并为一次上游往返，所有调用者共享解析结果
+        """
+        client = self.client
+
+        async def fetch():
+            response = await client.get(url, params=params)
+            response.raise_for_status()
+            return response.json()
+
+        return await _upstream_flight.do(_request_key('GET', url, params), fetch)
+
     async def get_document_info(self, project_id: str, doc_id: str) -> dict:
         """获取文档信息"""
+        memo_key = (project_id, doc_id)
+        if memo_key in self._doc_info_memo:
+            return self._doc_info_memo[memo_key]
+
         api_url = f"{BASE_URL}/api/project/image"
         params = {'pid': project_id, 'image_id': doc_id}
 
-        response = await self.client.get(api_url, params=params)
-        response.raise_for_status()
-
-        data = response.json()
+        data = await self._get_json(api_url, params=params)
         code = data.get('code')
         success = (code == 0 or code == '0' or code == '00000')
 
         if not success:
             raise Exception(f"API Error: {data.get('msg')} (code={code})")
 
-        return data.get('data') or data.get('result', {})
-
-    def _get_cache_meta_path(self, output_dir: Path) -> Path:
-        """获取缓存元数据文件路径"""
-        return output_dir / self.CACHE_META_FILE
-
-    def _load_cache_meta(self, output_dir: Path) -> dict:
-        """加载缓存元数据"""
-        meta_path = self._get_cache_meta_path(output_dir)
-        if meta_path.exists():
-            try:
-                with open(meta_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception:
-                return {}
-        return {}
-
-    def _save_cache_meta(self, output_dir: Path, meta_data: dict):
-        """保存缓存元数据"""
-        meta_path = self._get_cache_meta_path(output_dir)
-        output_dir.mkdir(parents=True, exist_ok=True)
-        with open(meta_path, 'w', encoding='utf-8') as f:
-            json.dump(meta_data, f, ensure_ascii=False, indent=2)
+        doc_info = data.get('data') or data.get('result', {})
+        self._doc_info_memo[memo_key] = doc_info
+        return doc_info
 
-    def _check_file_integrity(self, output_dir: Path, expected_files: dict) -> dict:
+    async def get_project_mapping(self, doc_info: dict) -> dict:
         """
-        检查文件完整性
+        获取最新版本的项目级mapping JSON（按版本ID缓存）
+
+        同一版本的mapping不可变：首次下载解析后放入LRU缓存，
+        同一请求内的后续调用及之后对未变更版本的调用都不再下载
 
         Args:
-            output_dir: 输出目录
-            expected_files: 期望的文件字典 {相对路径: md5签名}
+            doc_info: get_document_info 的返回值
+
+        Returns:
+            解析后的mapping（共享对象，调用方不应修改）
+        """
+        versions = doc_info.get('versions', [])
+        if not versions:
+            raise Exception("Document version info not found")
+
+        latest_version = versions[0]
+        json_url = latest_version.get('json_url')
+        if not json_url:
+            raise Exception("Mapping JSON URL not found")
+
+        cache_key = latest_version.get('id') or json_url
+        cached = _mapping_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        client = self.client
+
+        async def fetch():
+            response = await client.get(json_url)
+            response.raise_for_status()
+            mapping = response.json()
+            _mapping_cache.set(cache_key, mapping, size=len(response.content) * MAPPING_MEMORY_FACTOR)
+            return mapping
+
+        return await _upstream_flight.do(_request_key('GET', json_url), fetch)
+
+    async def get_project_info(self, project_id: str, team_id: str) -> Optional[dict]:
+        """获取项目详细信息（名称、文件夹、创建者等），失败返回None"""
+        try:
+            data = await self._get_json(
+                f"{BASE_URL}/api/project/multi_info",
+                params={
+                    'project_id': project_id,
+                    'team_id': team_id,
+                    'doc_info': 1
+                }
+            )
+            if data.get('code') == '00000':
+                return data.get('result', {})
+        except Exception:
+            pass
+        return None
+
+    def _get_cache_meta_path(self, output_dir: Path) -> Path:
+        """获取缓存元数据文件路径"""
+        return output_dir / self.CACHE_META_FILE
+
+    def _load_cache_meta(self, output_dir: Path) -> dict:
+        """加载缓存元数据"""
+        meta_path = self._get_cache_meta_path(output_dir)
+        if meta_path.exists():
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception:
+                return {}
+        return {}
+
+    def _save_cache_meta(self, output_dir: Path, meta_data: dict):
+        """保存缓存元数据"""
+        meta_path = self._get_cache_meta_path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta_data, f, ensure_ascii=False, indent=2)
+
+    async def _check_file_integrity(self, output_dir: Path, expected_files: dict, fingerprints: dict) -> dict:
+        """
+        检查文件完整性（基于指纹缓存，只对stat变化的文件重新计算MD5）
+
+        Args:
+            output_dir: 输出目录
+            expected_files: 期望的文件字典 {相对路径: md5签名}
+            fingerprints: 已记录的文件指纹，校验中会就地更新
 
         Returns:
             {
@@ -984,33 +1945,14 @@ class LanhuExtractor:
                 'valid': [有效的文件列表]
             }
         """
-        result = {
-            'missing': [],
-            'corrupted': [],
-            'valid': []
-        }
+        return await _integrity.verify(output_dir, expected_files, fingerprints)
 
-        for rel_path, expected_md5 in expected_files.items():
-            file_path = output_dir / rel_path
-
-            if not file_path.exists():
-                result['missing'].append(rel_path)
-            elif expected_md5:
-                # 如果有MD5签名，验证文件
-                # 注意：这里简化处理，只检查文件是否存在
-                # 完整的MD5验证会比较慢
-                result['valid'].append(rel_path)
-            else:
-                result['valid'].append(rel_path)
-
-        return result
-
-    def _should_update_cache(self, output_dir: Path, current_version_id: str, project_mapping: dict) -> tuple:
+    async def _should_update_cache(self, output_dir: Path, current_version_id: str, project_mapping: dict) -> tuple:
         """
         检查是否需要更新缓存
 
         Returns:
-            (需要更新, 缺失的文件列表)
+            (需要更新, 原因, 缺失或损坏的文件列表)
         """
         cache_meta = self._load_cache_meta(output_dir)
 
@@ -1019,6 +1961,10 @@ class LanhuExtractor:
         if cached_version != current_version_id:
             return (True, 'version_changed', [])
 
+        # 上次同步有失败的资源，缓存不完整
+        if cache_meta.get('complete') is False:
+            return (True, 'incomplete', [item['path'] for item in cache_meta.get('failed_assets', [])])
+
         # 检查文件完整性
         pages = project_mapping.get('pages', {})
         expected_files = {}
@@ -1027,11 +1973,34 @@ class LanhuExtractor:
         for html_filename in pages.keys():
             expected_files[html_filename] = None
 
+        # 上次同步记录的页面资源
+        cached_pages = cache_meta.get('pages')
+        if isinstance(cached_pages, dict):
+            for page_meta in cached_pages.values():
+                for local_path, sign_md5 in page_meta.get('assets', {}).items():
+                    expected_files[local_path] = sign_md5
+
         # 检查关键目录
         for key_dir in ['data', 'resources', 'files', 'images']:
             expected_files[key_dir] = None
 
-        integrity = self._check_file_integrity(output_dir, expected_files)
+        fingerprints = cache_meta.setdefault('fingerprints', {})
+        before = json.dumps(fingerprints, sort_keys=True)
+        integrity = await self._check_file_integrity(output_dir, expected_files, fingerprints)
+
+        if integrity['corrupted']:
+            # 删除损坏的文件（硬链接共享的blob也一并丢弃），增量同步时按缺失重新下载
+            for rel_path in integrity['corrupted']:
+                (output_dir / rel_path).unlink(missing_ok=True)
+                fingerprints.pop(rel_path, None)
+                if expected_files.get(rel_path):
+                    _blob_store.discard(expected_files[rel_path])
+            self._save_cache_meta(output_dir, cache_meta)
+            return (True, 'files_corrupted', integrity['corrupted'] + integrity['missing'])
+
+        # 补录或刷新了指纹时回写，下次校验只需 stat
+        if json.dumps(fingerprints, sort_keys=True) != before:
+            self._save_cache_meta(output_dir, cache_meta)
 
         if integrity['missing']:
             return (True, 'files_missing', integrity['missing'])
@@ -1043,37 +2012,13 @@ class LanhuExtractor:
         params = self.parse_url(url)
         doc_info = await self.get_document_info(params['project_id'], params['doc_id'])
 
-        # 获取项目详细信息（包含创建者等信息）
-        project_info = None
-        try:
-            response = await self.client.get(
-                f"{BASE_URL}/api/project/multi_info",
-                params={
-                    'project_id': params['project_id'],
-                    'team_id': params['team_id'],
-                    'doc_info': 1
-                }
-            )
-            response.raise_for_status()
-            data = response.json()
-            if data.get('code') == '00000':
-                project_info = data.get('result', {})
-        except Exception:
-            pass  # 如果获取失败，继续使用基本信息
+        # 获取项目详细信息（包含创建者等信息），失败时继续使用基本信息
+        project_info = await self.get_project_info(params['project_id'], params['team_id'])
 
-        # 获取项目级mapping JSON
+        # 获取项目级mapping JSON（按版本缓存）
+        project_mapping = await self.get_project_mapping(doc_info)
         versions = doc_info.get('versions', [])
-        if not versions:
-            raise Exception("Document version info not found")
-
         latest_version = versions[0]
-        json_url = latest_version.get('json_url')
-        if not json_url:
-            raise Exception("Mapping JSON URL not found")
-
-        response = await self.client.get(json_url)
-        response.raise_for_status()
-        project_mapping = response.json()
 
         # 从sitemap获取页面列表（只返回在导航中显示的页面）
         sitemap = project_mapping.get('sitemap', {})
@@ -1201,9 +2146,50 @@ class LanhuExtractor:
 
         return result
 
+    @staticmethod
+    def _build_page_index(project_mapping: dict) -> dict:
+        """
+        构建页面索引 {页面文件名(不含.html)或sitemap页面名: HTML文件名}
+
+        每个版本构建一次并保存在缓存元数据中，渲染时按名称直接查找
+        """
+        index = {}
+        for html_filename in project_mapping.get('pages', {}):
+            index[html_filename[:-5] if html_filename.endswith('.html') else html_filename] = html_filename
+
+        # sitemap中的显示名（重名时保留第一个）
+        nodes = list(project_mapping.get('sitemap', {}).get('rootNodes', []))
+        while nodes:
+            node = nodes.pop(0)
+            if node.get('pageName') and node.get('url'):
+                index.setdefault(node['pageName'], node['url'])
+            nodes[:0] = node.get('children', [])
+        return index
+
+    @staticmethod
+    def _record_version(versions: list, version_id: str, cache_meta: dict) -> list:
+        """
+        把当前版本的页面签名记入版本历史（最新在前，最多 VERSION_HISTORY_LIMIT 个）
+
+        旧格式缓存没有按页面的同步记录、算不出签名，此时不记录该版本（无法作为对比基线）
+        """
+        others = [v for v in versions if v.get('version_id') != version_id]
+        signatures = _page_render_signatures(cache_meta)
+        if not signatures:
+            return others[:VERSION_HISTORY_LIMIT]
+        current = {
+            'version_id': version_id,
+            'synced_at': datetime.now(CHINA_TZ).isoformat(),
+            'signatures': signatures
+        }
+        return ([current] + others)[:VERSION_HISTORY_LIMIT]
+
     async def download_resources(self, url: str, output_dir: str, force_update: bool = False) -> dict:
         """
-        下载所有Axure资源（支持智能缓存）
+        下载所有Axure资源（支持智能缓存与版本间增量同步）
+
+        按页面对比上次同步记录的 html.sign_md5 / mapping_md5 以及每个资源的 sign_md5，
+        只下载变化或缺失的页面与资源，并清理新版本中已删除的文件
 
         Args:
             url: 蓝湖文档URL
@@ -1215,84 +2201,194 @@ class LanhuExtractor:
                 'status': 'downloaded' | 'cached' | 'updated',
                 'version_id': 版本ID,
                 'reason': 更新原因,
-                'output_dir': 输出目录
+                'output_dir': 输出目录,
+                'sync': 同步统计（下载/复用/清理的文件数与字节数）,
+                'complete': 是否所有页面和资源都下载成功,
+                'failed_assets': 失败清单 [{'path', 'sign_md5', 'error'}],
+                'page_index': 页面索引 {页面名: HTML文件名}
             }
         """
+        key = ('download', str(Path(output_dir).resolve()), force_update)
+
+        async def run():
+            # 独立的提取器执行同步任务，发起者断开不影响其它等待者；共享文档信息缓存
+            job_extractor = LanhuExtractor()
+            job_extractor._doc_info_memo = self._doc_info_memo
+            async with _document_lock(output_dir):
+                return await job_extractor._download_resources(url, output_dir, force_update)
+
+        return await _job_flight.do(key, run)
+
+    async def _download_resources(self, url: str, output_dir: str, force_update: bool) -> dict:
+        """下载资源的实际实现（由 download_resources 按文档去重并加锁后调用）"""
         params = self.parse_url(url)
         doc_info = await self.get_document_info(params['project_id'], params['doc_id'])
 
-        # 获取项目级mapping JSON
-        versions = doc_info.get('versions', [])
-        version_info = versions[0]
+        # 获取项目级mapping JSON（按版本缓存）
+        project_mapping = await self.get_project_mapping(doc_info)
+        version_info = doc_info['versions'][0]
         version_id = version_info.get('id', '')  # 版本ID字段名是'id'
-        json_url = version_info.get('json_url')
-
-        response = await self.client.get(json_url)
-        response.raise_for_status()
-        project_mapping = response.json()
 
         # 创建输出目录
         output_path = Path(output_dir)
+        first_download = not output_path.exists()
+        reason = 'force_update' if force_update else 'first_download'
 
         # 检查是否需要更新
-        if not force_update and output_path.exists():
-            need_update, reason, missing_files = self._should_update_cache(
+        if not force_update and not first_download:
+            need_update, reason, missing_files = await self._should_update_cache(
                 output_path, version_id, project_mapping
             )
 
             if not need_update:
+                cache_meta = self._load_cache_meta(output_path)
+                if 'page_index' not in cache_meta or 'versions' not in cache_meta:
+                    # 旧缓存没有页面索引/版本历史，补建一次
+                    cache_meta.setdefault('page_index', self._build_page_index(project_mapping))
+                    cache_meta['versions'] = self._record_version([], version_id, cache_meta)
+                    self._save_cache_meta(output_path, cache_meta)
                 return {
                     'status': 'cached',
                     'version_id': version_id,
                     'reason': reason,
-                    'output_dir': output_dir
+                    'output_dir': output_dir,
+                    'page_index': cache_meta['page_index']
                 }
 
-            # 如果只是文件缺失，可以增量下载
-            if reason == 'files_missing' and missing_files:
-                # 这里可以实现增量下载逻辑
-                # 为了简化，暂时还是全量下载
-                pass
+        # 上次同步记录（旧格式的页面列表无法增量，按全量处理）
+        old_meta = {} if (force_update or first_download) else self._load_cache_meta(output_path)
+        old_pages = old_meta.get('pages') if isinstance(old_meta.get('pages'), dict) else {}
+        old_assets = {}
+        for page_meta in old_pages.values():
+            old_assets.update(page_meta.get('assets', {}))
+        fingerprints = dict(old_meta.get('fingerprints', {}))
 
         output_path.mkdir(parents=True, exist_ok=True)
 
-        # 下载每个页面的资源
-        pages = project_mapping.get('pages', {})
-        is_first_page = True
-
-        downloaded_files = []
-
-        for html_filename, page_info in pages.items():
+        sync_stats = {
+            'pages_fetched': 0,
+            'pages_reused': 0,
+            'pages_fixed': 0,
+            'files_downloaded': 0,
+            'files_reused': 0,
+            'files_pruned': 0,
+            'bytes_saved': 0
+        }
+        # 本次同步已处理的本地路径（多个页面共用的 data/document.js 等只处理一次，与页面完成顺序无关）
+        claimed = set()
+        # 下载失败的页面与资源（重试耗尽后汇总，缓存标记为不完整）
+        failed_assets = []
+        # 本次新下载的资源（完成后记录指纹）
+        downloaded_assets = []
+
+        async def sync_page(html_filename: str, page_info: dict) -> Optional[dict]:
             html_data = page_info.get('html', {})
             html_file_with_md5 = html_data.get('sign_md5', '')
             page_mapping_md5 = page_info.get('mapping_md5', '')
 
             if not html_file_with_md5:
-                continue
+                return None
 
-            # 下载HTML
-            html_url = f"{CDN_URL}/{html_file_with_md5}"
-            response = await self.client.get(html_url)
-            response.raise_for_status()
-            html_content = response.text
-
-            # 下载页面级mapping JSON
-            if page_mapping_md5:
-                mapping_url = f"{CDN_URL}/{page_mapping_md5}"
-                response = await self.client.get(mapping_url)
-                response.raise_for_status()
-                page_mapping = response.json()
-
-                # 下载所有依赖资源
-                await self._download_page_resources(
-                    page_mapping, output_path, skip_document_js=(not is_first_page)
+            html_path = output_path / html_filename
+            old_page = old_pages.get(html_filename)
+            page_unchanged = (
+                old_page is not None and
+                old_page.get('html') == html_file_with_md5 and
+                old_page.get('mapping') == page_mapping_md5 and
+                html_path.exists()
+            )
+
+            async with _page_download_semaphore:
+                if page_unchanged:
+                    # 页面未变化：复用HTML与资源清单，只补齐缺失的资源
+                    assets = old_page.get('assets', {})
+                    sync_stats['pages_reused'] += 1
+                    sync_stats['bytes_saved'] += html_path.stat().st_size
+                else:
+                    # 并发下载HTML与页面级mapping JSON
+                    try:
+                        html_content, assets = await asyncio.gather(
+                            self._fetch_page_html(html_file_with_md5),
+                            self._fetch_page_assets(page_mapping_md5)
+                        )
+                    except Exception as e:
+                        failed_assets.append({
+                            'path': html_filename,
+                            'sign_md5': html_file_with_md5,
+                            'error': str(e)
+                        })
+                        return None
+
+                    # 保存HTML（页面完成即写入，不等待其它页面）
+                    html_path.write_text(html_content, encoding='utf-8')
+                    sync_stats['pages_fetched'] += 1
+
+                # 只下载变化或缺失的资源
+                await self._sync_page_assets(
+                    assets, output_path, old_assets, claimed, sync_stats, failed_assets, downloaded_assets
                 )
-                is_first_page = False
 
-            # 保存HTML
-            html_path = output_path / html_filename
-            html_path.write_text(html_content, encoding='utf-8')
-            downloaded_files.append(html_filename)
+            return {
+                'html': html_file_with_md5,
+                'mapping': page_mapping_md5,
+                'assets': assets,
+                # 复用的页面沿用上次的修复状态，新下载的页面待修复
+                'fixed': bool(page_unchanged and old_page.get('fixed'))
+            }
+
+        # 所有页面并发处理（受全局并发上限约束），逐页上报进度
+        pages = project_mapping.get('pages', {})
+        pages_done = 0
+
+        async def sync_page_with_progress(html_filename: str, page_info: dict) -> Optional[dict]:
+            nonlocal pages_done
+            page_result = await sync_page(html_filename, page_info)
+            pages_done += 1
+            await _report_progress('download', pages_done, len(pages),
+                                   f"Synced {pages_done}/{len(pages)} pages "
+                                   f"({sync_stats['pages_reused']} unchanged, {sync_stats['pages_fetched']} downloaded)")
+            return page_result
+
+        page_results = await asyncio.gather(
+            *(sync_page_with_progress(html_filename, page_info) for html_filename, page_info in pages.items()),
+            return_exceptions=True
+        )
+        for page_result in page_results:
+            if isinstance(page_result, BaseException):
+                raise page_result
+
+        new_pages = {
+            html_filename: page_result
+            for html_filename, page_result in zip(pages.keys(), page_results)
+            if page_result is not None
+        }
+
+        # 所有页面都失败（如Cookie失效、网络不可用）时直接报错
+        if pages and not new_pages and failed_assets:
+            raise Exception(f"Failed to download pages: {failed_assets[0]['error']}")
+
+        # 只修复本次新下载（或旧缓存中未修复）的页面HTML
+        unfixed = [html_filename for html_filename, page_meta in new_pages.items() if not page_meta['fixed']]
+        await fix_html_pages([output_path / html_filename for html_filename in unfixed])
+        for html_filename in unfixed:
+            new_pages[html_filename]['fixed'] = True
+        sync_stats['pages_fixed'] = len(unfixed)
+
+        # 清理新版本中已删除的页面和资源（只删除上次同步记录过的文件）
+        keep_files = set(new_pages.keys()) | claimed
+        for rel_path in (set(old_pages.keys()) | set(old_assets.keys())) - keep_files:
+            stale_path = output_path / rel_path
+            if stale_path.is_file() or stale_path.is_symlink():
+                stale_path.unlink()
+                sync_stats['files_pruned'] += 1
+        sync_stats['files_saved'] = sync_stats['pages_reused'] + sync_stats['files_reused']
+
+        # 记录新下载资源与修复后HTML的指纹，移除已不存在文件的指纹
+        fingerprints.update(await _integrity.fingerprint_many(output_path, downloaded_assets + unfixed))
+        fingerprints = {
+            rel_path: fp for rel_path, fp in fingerprints.items()
+            if rel_path in claimed or rel_path in new_pages
+        }
 
         # 保存缓存元数据
         cache_meta = {
@@ -1300,57 +2396,92 @@ class LanhuExtractor:
             'document_id': params['doc_id'],
             'document_name': doc_info.get('name', 'Unknown'),
             'download_time': asyncio.get_event_loop().time(),
-            'pages': list(pages.keys()),
-            'total_files': len(downloaded_files)
+            'pages': new_pages,
+            'total_files': len(new_pages) + len(claimed),
+            'complete': not failed_assets,
+            'failed_assets': failed_assets,
+            'fingerprints': fingerprints,
+            'page_index': self._build_page_index(project_mapping)
         }
+        cache_meta['versions'] = self._record_version(
+            self._load_cache_meta(output_path).get('versions', []), version_id, cache_meta
+        )
         self._save_cache_meta(output_path, cache_meta)
 
+        if failed_assets:
+            print(f"⚠️ 文档 {params['doc_id']} 有 {len(failed_assets)} 个文件下载失败，缓存标记为不完整")
+
         return {
-            'status': 'downloaded',
+            'status': 'updated' if old_pages else 'downloaded',
             'version_id': version_id,
-            'reason': 'first_download' if not output_path.exists() else 'version_changed',
-            'output_dir': output_dir
+            'reason': reason,
+            'output_dir': output_dir,
+            'sync': sync_stats,
+            'complete': not failed_assets,
+            'failed_assets': failed_assets,
+            'page_index': cache_meta['page_index']
         }
 
-    async def _download_page_resources(self, page_mapping: dict, output_dir: Path, skip_document_js: bool = False):
-        """下载页面资源"""
-        tasks = []
-
-        # 下载CSS
-        for local_path, info in page_mapping.get('styles', {}).items():
-            sign_md5 = info.get('sign_md5', '')
-            if sign_md5:
-                url = sign_md5 if sign_md5.startswith('http') else f"{CDN_URL}/{sign_md5}"
-                tasks.append(self._download_file(url, output_dir / local_path))
+    async def _fetch_page_html(self, html_sign_md5: str) -> str:
+        """下载页面HTML"""
+        response = await _download_engine.get(self.client, f"{CDN_URL}/{html_sign_md5}")
+        return response.text
+
+    async def _fetch_page_assets(self, page_mapping_md5: str) -> dict:
+        """下载页面级mapping JSON并收集依赖资源（无mapping时返回空）"""
+        if not page_mapping_md5:
+            return {}
+        response = await _download_engine.get(self.client, f"{CDN_URL}/{page_mapping_md5}")
+        return self._collect_page_assets(response.json())
+
+    @staticmethod
+    def _collect_page_assets(page_mapping: dict) -> dict:
+        """从页面级mapping中收集依赖资源 {本地路径: sign_md5}"""
+        assets = {}
+        for category in ('styles', 'scripts', 'images'):
+            for local_path, info in page_mapping.get(category, {}).items():
+                sign_md5 = info.get('sign_md5', '')
+                if sign_md5:
+                    assets[local_path] = sign_md5
+        return assets
+
+    async def _sync_page_assets(self, assets: dict, output_dir: Path, old_assets: dict,
+                                claimed: set, sync_stats: dict, failed_assets: list, downloaded_assets: list):
+        """同步页面资源：sign_md5 未变且文件存在的直接复用，其余下载，失败的记入失败清单"""
+        pending = []
+        for local_path, sign_md5 in assets.items():
+            if local_path in claimed:
+                continue
+            claimed.add(local_path)
 
-        # 下载JS
-        for local_path, info in page_mapping.get('scripts', {}).items():
-            if skip_document_js and local_path == 'data/document.js':
+            local_file = output_dir / local_path
+            if old_assets.get(local_path) == sign_md5 and local_file.exists():
+                sync_stats['files_reused'] += 1
+                sync_stats['bytes_saved'] += local_file.stat().st_size
                 continue
-            sign_md5 = info.get('sign_md5', '')
-            if sign_md5:
-                url = sign_md5 if sign_md5.startswith('http') else f"{CDN_URL}/{sign_md5}"
-                tasks.append(self._download_file(url, output_dir / local_path))
-
-        # 下载图片
-        for local_path, info in page_mapping.get('images', {}).items():
-            sign_md5 = info.get('sign_md5', '')
-            if sign_md5:
-                url = sign_md5 if sign_md5.startswith('http') else f"{CDN_URL}/{sign_md5}"
-                tasks.append(self._download_file(url, output_dir / local_path))
-
-        if tasks:
-            await asyncio.gather(*tasks, return_exceptions=True)
-
-    async def _download_file(self, url: str, local_path: Path):
-        """下载单个文件"""
-        try:
-            local_path.parent.mkdir(parents=True, exist_ok=True)
-            response = await self.client.get(url)
-            response.raise_for_status()
-            local_path.write_bytes(response.content)
-        except Exception:
-            pass
+
+            pending.append((local_path, sign_md5))
+
+        results = await asyncio.gather(
+            *(self._download_asset(sign_md5, output_dir / local_path) for local_path, sign_md5 in pending),
+            return_exceptions=True
+        )
+        for (local_path, sign_md5), result in zip(pending, results):
+            if isinstance(result, BaseException):
+                failed_assets.append({'path': local_path, 'sign_md5': sign_md5, 'error': str(result)})
+                # 删除旧版本残留的文件，下次同步时按缺失重新下载
+                stale_file = output_dir / local_path
+                if stale_file.is_file() or stale_file.is_symlink():
+                    stale_file.unlink()
+            else:
+                sync_stats['files_downloaded'] += 1
+                downloaded_assets.append(local_path)
+
+    async def _download_asset(self, sign_md5: str, local_path: Path):
+        """下载单个资源（已在存储中的资源直接链接，不再重复下载）"""
+        url = sign_md5 if sign_md5.startswith('http') else f"{CDN_URL}/{sign_md5}"
+        blob = await _blob_store.ensure(sign_md5, url, self.client)
+        _blob_store.materialize(blob, local_path)
 
     async def get_design_slices_info(self, image_id: str, team_id: str, project_id: str,
                                      include_metadata: bool = True) -> dict:
@@ -1490,278 +2621,1440 @@ class LanhuExtractor:
         }
 
     async def close(self):
-        """关闭客户端"""
-        await self.client.aclose()
-
-
-def fix_html_files(directory: str):
-    """修复HTML文件"""
-    html_files = list(Path(directory).glob("*.html"))
-
-    for html_path in html_files:
-        with open(html_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-        soup = BeautifulSoup(content, 'html.parser')
-
-        # 替换data-src
-        for tag in soup.find_all(['img', 'script']):
-            if tag.has_attr('data-src'):
-                tag['src'] = tag['data-src']
-                del tag['data-src']
-
-        for tag in soup.find_all('link'):
-            if tag.has_attr('data-src'):
-                tag['href'] = tag['data-src']
-                del tag['data-src']
-
-        # 移除body隐藏样式
-        body = soup.find('body')
-        if body and body.has_attr('style'):
-            style = body['style']
-            style = re.sub(r'display\s*:\s*none\s*;?', '', style)
-            style = re.sub(r'opacity\s*:\s*0\s*;?', '', style)
-            style = style.strip()
-            if style:
-                body['style'] = style
-            else:
-                del body['style']
-
-        # 移除蓝湖脚本
-        for script in soup.find_all('script'):
-            if script.string and 'alistatic.lanhuapp.com' in script.string:
-                script.decompose()
-
-        # 添加映射函数
-        head = soup.find('head')
-        if head:
-            mapping_script = soup.new_tag('script')
-            mapping_script.string = '''
+        """归还客户端（共享连接池由服务器 lifespan 统一关闭，这里不释放连接）"""
+        self.client = None
+
+
+def fix_html_file(html_path: str) -> bool:
+    """
+    修复单个HTML文件（恢复 data-src、移除隐藏样式和蓝湖脚本、注入映射函数）
+
+    在进程池中执行时只传路径字符串；已修复过的页面直接跳过
+
+    Returns:
+        是否修改了文件
+    """
+    html_path = Path(html_path)
+    with open(html_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    # 已修复过的页面跳过，避免重复注入映射函数
+    if 'function lanhu_Axure_Mapping_Data' in content:
+        return False
+
+    soup = BeautifulSoup(content, 'lxml')
+
+    # 替换data-src
+    for tag in soup.find_all(['img', 'script']):
+        if tag.has_attr('data-src'):
+            tag['src'] = tag['data-src']
+            del tag['data-src']
+
+    for tag in soup.find_all('link'):
+        if tag.has_attr('data-src'):
+            tag['href'] = tag['data-src']
+            del tag['data-src']
+
+    # 移除body隐藏样式
+    body = soup.find('body')
+    if body and body.has_attr('style'):
+        style = body['style']
+        style = re.sub(r'display\s*:\s*none\s*;?', '', style)
+        style = re.sub(r'opacity\s*:\s*0\s*;?', '', style)
+        style = style.strip()
+        if style:
+            body['style'] = style
+        else:
+            del body['style']
+
+    # 移除蓝湖脚本
+    for script in soup.find_all('script'):
+        if script.string and 'alistatic.lanhuapp.com' in script.string:
+            script.decompose()
+
+    # 添加映射函数
+    head = soup.find('head')
+    if head:
+        mapping_script = soup.new_tag('script')
+        mapping_script.string = '''
 // 蓝湖Axure映射数据处理函数
 function lanhu_Axure_Mapping_Data(data) {
     return data;
 }
 '''
-            first_script = head.find('script')
-            if first_script:
-                first_script.insert_before(mapping_script)
-            else:
-                head.append(mapping_script)
+        first_script = head.find('script')
+        if first_script:
+            first_script.insert_before(mapping_script)
+        else:
+            head.append(mapping_script)
+
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(str(soup))
+    return True
+
+
+_html_fix_executor = None
+
+
+def _get_html_fix_executor() -> ProcessPoolExecutor:
+    """获取HTML修复进程池（首次使用时创建）"""
+    global _html_fix_executor
+    if _html_fix_executor is None:
+        # 此时进程内已有多个线程（哈希线程池、to_thread、Playwright），fork 出的子进程可能死锁；
+        # 改用 forkserver（不支持的平台用 spawn）
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        _html_fix_executor = ProcessPoolExecutor(max_workers=HTML_FIX_WORKERS,
+                                                 mp_context=multiprocessing.get_context(method))
+    return _html_fix_executor
+
+
+def shutdown_html_fix_executor():
+    """关闭HTML修复进程池"""
+    global _html_fix_executor
+    if _html_fix_executor is not None:
+        _html_fix_executor.shutdown(wait=False, cancel_futures=True)
+        _html_fix_executor = None
+
+
+async def fix_html_pages(html_paths: List[Path]) -> List[bool]:
+    """
+    修复一批页面HTML（不阻塞事件循环）
+
+    页面数超过 HTML_FIX_PROCESS_THRESHOLD 时使用进程池并行解析，否则在线程中依次处理
+    """
+    if not html_paths:
+        return []
+    if len(html_paths) > HTML_FIX_PROCESS_THRESHOLD:
+        loop = asyncio.get_running_loop()
+        executor = _get_html_fix_executor()
+        return list(await asyncio.gather(
+            *(loop.run_in_executor(executor, fix_html_file, str(path)) for path in html_paths)
+        ))
+    return await asyncio.to_thread(lambda: [fix_html_file(str(path)) for path in html_paths])
+
+
+# ============================================
+# 静态文本提取（不启动浏览器，用于 text_only 模式）
+# ============================================
+
+# 换行分隔的块级标签（近似浏览器 innerText 的换行规则）
+_BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'fieldset',
+    'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header',
+    'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'table', 'tr', 'ul'
+}
+_SKIP_TAGS = {'script', 'style', 'noscript', 'template'}
+_CSS_RULE_RE = re.compile(r'([^{}]+)\{([^{}]*)\}')
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+# 简单复合选择器：可选的标签名（或 *）后接若干 #id / .class
+_CSS_COMPOUND_RE = re.compile(r'(\*|[a-zA-Z][\w-]*)?((?:[#.][\w-]+)*)')
+_CSS_COLOR_RE = re.compile(r'(?:^|;)\s*color\s*:\s*([^;]+)', re.IGNORECASE)
+
+
+def _is_red_color(value: str) -> bool:
+    """判断CSS颜色值是否为纯红色（与浏览器计算样式 rgb(255, 0, 0) 对应）"""
+    value = value.lower().replace('!important', '').strip()
+    value = re.sub(r'\s+', '', value)
+    if value in ('red', '#f00', '#ff0000', '#ff0000ff'):
+        return True
+    match = re.fullmatch(r'rgba?\((\d+),(\d+),(\d+)(?:,([\d.]+))?\)', value)
+    return bool(match) and match.group(1, 2, 3) == ('255', '0', '0') and match.group(4) in (None, '1')
+
+
+def _own_color(style: str) -> Optional[bool]:
+    """解析内联样式中的颜色：红色返回True，其它颜色返回False，未设置返回None"""
+    match = _CSS_COLOR_RE.search(style or '')
+    if not match:
+        return None
+    return _is_red_color(match.group(1))
+
+
+class _StylesheetColors:
+    """
+    样式表中设置了 color 的简单选择器规则（外链样式表与 <style> 元素，按文档顺序添加）
+
+    只处理标签、#id、.class 及其组合（后代/子代选择器取最后一段近似匹配），
+    含伪类、属性选择器的规则无法静态判断，直接忽略；同一元素按优先级、其次按出现顺序取最后生效的规则
+    """
+
+    def __init__(self):
+        self._order = 0
+        self._by_id = {}
+        self._by_class = {}
+        self._by_tag = {}
+
+    def add(self, css_text: str):
+        for selectors, declarations in _CSS_RULE_RE.findall(_CSS_COMMENT_RE.sub('', css_text)):
+            is_red = _own_color(declarations.strip())
+            if is_red is None:
+                continue
+            for selector in selectors.split(','):
+                target = re.split(r'[\s>+~]+', selector.strip())[-1]
+                match = _CSS_COMPOUND_RE.fullmatch(target)
+                if not target or not match:
+                    continue
+                tag = match.group(1) if match.group(1) != '*' else None
+                parts = re.findall(r'[#.][\w-]+', match.group(2))
+                ids = [part[1:] for part in parts if part[0] == '#']
+                classes = frozenset(part[1:] for part in parts if part[0] == '.')
+                self._order += 1
+                rule = ((len(ids), len(classes), 1 if tag else 0, self._order),
+                        tag.lower() if tag else None, frozenset(ids), classes, is_red)
+                if ids:
+                    self._by_id.setdefault(ids[0], []).append(rule)
+                elif classes:
+                    self._by_class.setdefault(next(iter(classes)), []).append(rule)
+                else:
+                    self._by_tag.setdefault(rule[1], []).append(rule)
+
+    def color_of(self, el) -> Optional[bool]:
+        """元素自身匹配的样式表颜色：红色返回True，其它颜色返回False，无匹配规则返回None"""
+        el_id = el.get('id')
+        el_classes = set((el.get('class') or '').split())
+        candidates = list(self._by_tag.get(None, ())) + list(self._by_tag.get(el.tag, ()))
+        if el_id:
+            candidates += self._by_id.get(el_id, ())
+        for name in el_classes:
+            candidates += self._by_class.get(name, ())
+        best = None
+        for rule in candidates:
+            specificity, tag, ids, classes, _ = rule
+            if ((tag is None or tag == el.tag) and ids <= {el_id} and classes <= el_classes
+                    and (best is None or specificity > best[0])):
+                best = rule
+        return best[4] if best else None
+
+
+def _is_hidden(el) -> bool:
+    """内联样式隐藏或 Axure 默认隐藏的元素（不计入可见文本）"""
+    style = (el.get('style') or '').replace(' ', '').lower()
+    return ('display:none' in style or 'visibility:hidden' in style
+            or 'ax_default_hidden' in (el.get('class') or ''))
+
+
+def _visible_text(body) -> str:
+    """近似浏览器 innerText：跳过脚本与隐藏元素，块级元素换行"""
+    parts = []
+
+    def visit(el):
+        if isinstance(el.tag, str) and el.tag not in _SKIP_TAGS and not _is_hidden(el):
+            block = el.tag in _BLOCK_TAGS
+            if block:
+                parts.append('\n')
+            if el.text:
+                parts.append(el.text)
+            for child in el:
+                visit(child)
+                if child.tail:
+                    parts.append(child.tail)
+            if block:
+                parts.append('\n')
+
+    visit(body)
+    lines = (' '.join(line.split()) for line in ''.join(parts).split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+def extract_page_sections(html_path: Path) -> dict:
+    """
+    不启动浏览器，直接解析Axure页面HTML提取文本分区
+
+    Returns:
+        {
+            'red_texts': [红色标注/警告文本],
+            'shape_texts': [形状/流程图节点文本],
+            'full_text': 页面全部可见文本
+        }
+    """
+    resource_dir = html_path.parent
+    # 蓝湖导出的页面统一为UTF-8（部分页面缺少 charset 声明）；解析器不能跨线程共享，每次新建
+    doc = lxml_html.fromstring(html_path.read_bytes(), parser=lxml_html.HTMLParser(encoding='utf-8'))
+
+    # 页面引用的本地样式表与内联 <style> 中的颜色规则（按文档顺序）
+    css_colors = _StylesheetColors()
+    for el in doc.iter('link', 'style'):
+        if el.tag == 'style':
+            css_colors.add(el.text or '')
+            continue
+        href = el.get('href') or ''
+        if 'stylesheet' in (el.get('rel') or '') and href and '://' not in href:
+            css_path = resource_dir / unquote(href.split('?')[0])
+            if css_path.is_file():
+                css_colors.add(css_path.read_text(encoding='utf-8', errors='ignore'))
+
+    # 1. 红色标注文本（颜色沿DOM继承）
+    red_texts = []
+
+    def collect_red(el, inherited_red):
+        if not isinstance(el.tag, str) or el.tag in _SKIP_TAGS:
+            return
+        own = _own_color(el.get('style'))
+        if own is None:
+            own = css_colors.color_of(el)
+        is_red = inherited_red if own is None else own
+        if is_red:
+            text = el.text_content().strip()
+            if 0 < len(text) < 200:
+                red_texts.append(text)
+        for child in el:
+            collect_red(child, is_red)
+
+    collect_red(doc, False)
+
+    # 2. Axure 形状/流程图节点文本
+    shape_texts = []
+    for el in doc.iter():
+        if not isinstance(el.tag, str):
+            continue
+        if (el.get('id') or '').startswith('u') or 'shape' in (el.get('class') or ''):
+            text = el.text_content().strip()
+            if 0 < len(text) < 100:
+                shape_texts.append(text)
+
+    # 3. 全部可见文本
+    body = doc.find('body')
+    full_text = _visible_text(body if body is not None else doc)
+
+    return {
+        'red_texts': list(dict.fromkeys(red_texts)),
+        'shape_texts': list(dict.fromkeys(shape_texts)),
+        'full_text': full_text
+    }
+
+
+def _format_page_sections(sections: dict) -> str:
+    """把文本分区格式化为返回给AI的页面文本"""
+    parts = []
+
+    red_texts = sections.get('red_texts') or []
+    if red_texts:
+        parts.append("[Important Tips/Warnings]\n" + "\n".join(red_texts))
+
+    # 形状文本较多时才视为流程图（最多20条）
+    shape_texts = sections.get('shape_texts') or []
+    if len(shape_texts) > 5:
+        parts.append("[Flowchart/Component Text]\n" + " | ".join(shape_texts[:20]))
+
+    full_text = (sections.get('full_text') or '').strip()
+    if full_text:
+        parts.append("[Full Page Text]\n" + full_text)
+
+    if not parts:
+        return "⚠️ Page text is empty or cannot be extracted (please refer to visual output)"
+    return "\n\n".join(parts)
+
+
+def _resolve_page_file(resource_dir: str, page_name: str, page_index: dict) -> Optional[str]:
+    """按页面索引查找HTML文件名，文件不存在返回None"""
+    html_file = page_index.get(page_name)
+    if html_file and (Path(resource_dir) / html_file).is_file():
+        return html_file
+    return None
+
+
+async def extract_pages_text(resource_dir: str, page_names: List[str], page_index: dict = None,
+                             text_store: 'PageTextStore' = None, page_signatures: dict = None) -> List[dict]:
+    """
+    不启动浏览器批量提取页面文本（在线程中解析），按请求顺序返回
+
+    提供 text_store 时先按页面签名从文本存储读取，未命中的页面解析后写回存储
+    """
+    if page_index is None:
+        page_index = {f.stem: f.name for f in Path(resource_dir).glob("*.html")}
+    page_signatures = page_signatures or {}
+
+    async def extract(page_name: str) -> dict:
+        signature = page_signatures.get(page_name)
+        sections = text_store.get(page_name, signature) if text_store else None
+        if sections is not None:
+            return {
+                'page_name': page_name,
+                'success': True,
+                'page_text': _format_page_sections(sections),
+                'sections': sections,
+                'from_cache': True
+            }
+
+        html_file = _resolve_page_file(resource_dir, page_name, page_index)
+        if not html_file:
+            return {'page_name': page_name, 'success': False, 'error': f'Page {page_name} does not exist'}
+        try:
+            sections = await asyncio.to_thread(extract_page_sections, Path(resource_dir) / html_file)
+        except Exception as e:
+            return {'page_name': page_name, 'success': False, 'error': str(e)}
+        if text_store:
+            text_store.put(page_name, signature, sections, 'static')
+        return {
+            'page_name': page_name,
+            'success': True,
+            'page_text': _format_page_sections(sections),
+            'sections': sections,
+            'from_cache': False
+        }
+
+    pages_done = 0
+
+    async def extract_with_progress(page_name: str) -> dict:
+        nonlocal pages_done
+        result = await extract(page_name)
+        pages_done += 1
+        await _report_progress('text', pages_done, len(page_names),
+                               f"Extracted text of {pages_done}/{len(page_names)} pages")
+        return result
+
+    results = list(await asyncio.gather(*(extract_with_progress(name) for name in page_names)))
+    if text_store:
+        text_store.save()
+    return results
+
+
+# ============================================
+# 浏览器池（常驻 Chromium + 预热上下文）
+# ============================================
+
+class _ContextLease:
+    """浏览器上下文租约：记录渲染次数与是否需要丢弃"""
+
+    __slots__ = ('context', 'renders', 'broken')
+
+    def __init__(self, context):
+        self.context = context
+        self.renders = 0
+        self.broken = False
+
+
+class BrowserPool:
+    """
+    常驻浏览器池
+
+    - 进程内只启动一个 Chromium，随服务器 lifespan 启动/关闭
+    - 预热 size 个浏览器上下文，按请求借出、用完归还
+    - 上下文渲染次数达到 max_renders 或发生崩溃时关闭，并在后台补充新的预热上下文
+    - 归还时清除 Cookie 与页面存储，存储无法清空的上下文直接关闭重建
+    - 浏览器进程意外退出时在下一次借出时自动重新启动
+    """
+
+    def __init__(self, size: int, max_renders: int):
+        self.size = max(1, size)
+        self.max_renders = max_renders
+        self._playwright = None
+        self._browser = None
+        self._loop = None
+        self._idle: List[_ContextLease] = []
+        self._slots = None
+        self._start_lock = None
+        self._refills = set()
+        self.stats = {'launches': 0, 'crashes': 0, 'contexts_created': 0,
+                      'contexts_recycled': 0, 'acquires': 0, 'waits': 0, 'refills': 0}
+
+    def _bind_loop(self):
+        """绑定当前事件循环（Playwright 对象不能跨事件循环使用）"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._playwright = None
+            self._browser = None
+            self._idle = []
+            self._refills = set()
+            self._slots = asyncio.Semaphore(self.size)
+            self._start_lock = asyncio.Lock()
+
+    async def _ensure_browser(self):
+        self._bind_loop()
+        if self._browser and self._browser.is_connected():
+            return self._browser
+        async with self._start_lock:
+            if self._browser and self._browser.is_connected():
+                return self._browser
+            if self._browser is not None:
+                # 浏览器进程已退出，丢弃所有旧上下文
+                self.stats['crashes'] += 1
+                self._idle = []
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(headless=True)
+            self.stats['launches'] += 1
+        return self._browser
+
+    async def _new_lease(self) -> _ContextLease:
+        browser = await self._ensure_browser()
+        # viewport 只影响初始窗口大小，不影响 full_page=True 的截图范围
+        context = await browser.new_context(viewport={'width': VIEWPORT_WIDTH, 'height': VIEWPORT_HEIGHT})
+        self.stats['contexts_created'] += 1
+        return _ContextLease(context)
+
+    async def warmup(self):
+        """启动浏览器并预热上下文（失败只打印警告，首次使用时再重试）"""
+        try:
+            await self._ensure_browser()
+            while len(self._idle) < self.size:
+                self._idle.append(await self._new_lease())
+            print(f"🌐 Browser pool ready ({self.size} contexts)")
+        except Exception as e:
+            print(f"⚠️ Browser pool warmup failed: {e}")
+
+    @asynccontextmanager
+    async def lease(self):
+        """借出一个预热的浏览器上下文"""
+        self._bind_loop()
+        if self._slots.locked():
+            self.stats['waits'] += 1
+        async with self._slots:
+            self.stats['acquires'] += 1
+            lease = None
+            while self._idle:
+                candidate = self._idle.pop()
+                if candidate.context.browser and candidate.context.browser.is_connected():
+                    lease = candidate
+                    break
+            if lease is None:
+                lease = await self._new_lease()
+            try:
+                yield lease
+            finally:
+                await self._release(lease)
+
+    async def _release(self, lease: _ContextLease):
+        """归还上下文：超过渲染次数、已崩溃或无法清理则关闭，后台补充新的预热上下文"""
+        if not lease.broken and lease.renders < self.max_renders:
+            # 清理残留页面、Cookie 与存储，保证下一个租户拿到干净的上下文
+            try:
+                if await self._reset_context(lease.context) and len(self._idle) < self.size:
+                    self._idle.append(lease)
+                    return
+            except Exception:
+                lease.broken = True
+
+        if lease.broken:
+            self.stats['crashes'] += 1
+        else:
+            self.stats['contexts_recycled'] += 1
+        try:
+            await lease.context.close()
+        except Exception:
+            pass
+        self._schedule_refill()
+
+    @staticmethod
+    async def _reset_context(context) -> bool:
+        """清除上下文的页面、Cookie 与 localStorage/sessionStorage，存储仍有残留时返回False"""
+        for page in list(context.pages):
+            try:
+                await page.evaluate("() => { localStorage.clear(); sessionStorage.clear(); }")
+            except Exception:
+                pass
+            await page.close()
+        await context.clear_cookies()
+        # 已关闭页面留下的 localStorage 无法在页面外清除，有残留时交由调用方关闭重建
+        state = await context.storage_state()
+        return not any(origin.get('localStorage') for origin in state.get('origins', []))
+
+    def _schedule_refill(self):
+        """后台补充一个预热上下文（空闲数已满或浏览器未启动时跳过）"""
+        if self._browser is None or len(self._idle) + len(self._refills) >= self.size:
+            return
+        task = asyncio.create_task(self._refill())
+        self._refills.add(task)
+        task.add_done_callback(self._refills.discard)
+
+    async def _refill(self):
+        try:
+            lease = await self._new_lease()
+        except Exception as e:
+            print(f"⚠️ Browser context refill failed: {e}")
+            return
+        if len(self._idle) < self.size:
+            self._idle.append(lease)
+            self.stats['refills'] += 1
+        else:
+            await lease.context.close()
+
+    @asynccontextmanager
+    async def temporary_context(self, **context_options):
+        """在共享浏览器上创建一次性上下文（用于需要独立 Cookie 等状态的场景）"""
+        browser = await self._ensure_browser()
+        context = await browser.new_context(**context_options)
+        try:
+            yield context
+        finally:
+            await context.close()
+
+    async def close(self):
+        """关闭所有上下文和浏览器"""
+        if self._loop is not None and self._loop is not asyncio.get_running_loop():
+            return
+        refills, self._refills = self._refills, set()
+        for task in refills:
+            task.cancel()
+        await asyncio.gather(*refills, return_exceptions=True)
+        idle, self._idle = self._idle, []
+        for lease in idle:
+            try:
+                await lease.context.close()
+            except Exception:
+                pass
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception:
+                pass
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def snapshot(self) -> dict:
+        """获取统计快照"""
+        return {
+            **self.stats,
+            'size': self.size,
+            'idle': len(self._idle),
+            'connected': bool(self._browser and self._browser.is_connected()),
+        }
+
+
+_browser_pool = BrowserPool(BROWSER_POOL_SIZE, BROWSER_CONTEXT_MAX_RENDERS)
+
+
+def _default_render_concurrency() -> int:
+    """根据CPU核数与可用内存估算并发渲染页面数（每个页面约占 300MB）"""
+    cpu_count = os.cpu_count() or 1
+    limit = cpu_count
+    try:
+        available = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        limit = min(limit, available // (300 * 1024 * 1024))
+    except (ValueError, OSError, AttributeError):
+        pass
+    return max(1, min(8, limit))
+
+
+# 并发渲染页面数（进程级，跨请求共享）
+RENDER_CONCURRENCY = int(os.getenv("RENDER_CONCURRENCY", "0")) or _default_render_concurrency()
+_render_slots = asyncio.Semaphore(RENDER_CONCURRENCY)
+
+# 页面就绪检测：DOM 连续无变化多久视为布局完成、页面 load 之后最多等待多久
+RENDER_QUIET_MS = int(os.getenv("RENDER_QUIET_MS", "300"))
+RENDER_READY_TIMEOUT_MS = int(os.getenv("RENDER_READY_TIMEOUT_MS", "5000"))
+
+# 截图缓存中每个页面保留的历史截图数量（页面变化后用于版本对比）
+SCREENSHOT_HISTORY_LIMIT = int(os.getenv("SCREENSHOT_HISTORY_LIMIT", "3"))
+
+# 页面文本存储保留的文档版本数量
+TEXT_STORE_VERSION_LIMIT = int(os.getenv("TEXT_STORE_VERSION_LIMIT", "5"))
+# 进程内保留的文本存储实例数量（跨文档LRU淘汰，淘汰后下次访问从文件重新加载）
+TEXT_STORE_OPEN_LIMIT = int(os.getenv("TEXT_STORE_OPEN_LIMIT", "16"))
+
+# 就绪检测统计（按结束原因汇总等待时间，用于调优上面两个参数）
+_render_stats = {'pages': 0, 'ready_ms_total': 0, 'reasons': {}}
+
+# 在页面脚本执行前注入：记录最后一次 DOM 变化的时间
+_DOM_MUTATION_TRACKER_JS = '''(() => {
+    window.__lanhuLastMutation = performance.now();
+    new MutationObserver(() => { window.__lanhuLastMutation = performance.now(); })
+        .observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+})();'''
+
+# 等待页面就绪：字体加载完成 + Axure 运行时已加载 + DOM 静默，超过上限则放弃等待
+_WAIT_FOR_READY_JS = '''async ({quietMs, ceilingMs}) => {
+    const start = performance.now();
+    const deadline = start + ceilingMs;
+    const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+    const elapsed = () => Math.round(performance.now() - start);
+    const hasAxureRuntime = !!document.querySelector('script[src*="axure"]');
+
+    if (document.fonts && document.fonts.ready) {
+        await Promise.race([document.fonts.ready, sleep(ceilingMs)]);
+    }
+    while (performance.now() < deadline) {
+        const axureLoaded = !hasAxureRuntime || typeof window.$axure !== 'undefined';
+        const quietFor = performance.now() - (window.__lanhuLastMutation || 0);
+        if (axureLoaded && quietFor >= quietMs) {
+            return {reason: hasAxureRuntime ? 'axure_quiet' : 'dom_quiet', ms: elapsed()};
+        }
+        await sleep(Math.min(50, quietMs));
+    }
+    return {reason: 'timeout', ms: elapsed()};
+}'''
+
+# 页面文本提取脚本（针对Axure优化）
+# 单次 TreeWalker 遍历：只访问含文本的节点，样式只读取其父元素且按元素缓存，
+# 所有读取集中在一次遍历中完成（不穿插 DOM 写入，避免重复触发样式计算），用 Set 去重
+_PAGE_TEXT_EXTRACTOR_JS = '''() => {
+    const body = document.body;
+    if (!body) {
+        return {red_texts: [], shape_texts: [], full_text: ''};
+    }
+
+    const redTexts = new Set();
+    const shapeTexts = new Set();
+    const colorCache = new Map();
+    const visitedShapes = new Set();
+
+    const isRed = (el) => {
+        let red = colorCache.get(el);
+        if (red === undefined) {
+            const color = window.getComputedStyle(el).color || '';
+            red = color.includes('rgb(255, 0, 0)') || color.includes('rgb(255,0,0)') || color === 'red';
+            colorCache.set(el, red);
+        }
+        return red;
+    };
+
+    // Axure 形状/流程图节点：id 以 u 开头或 class 含 shape
+    const isShape = (el) => (el.id && el.id[0] === 'u') ||
+        (typeof el.className === 'string' && el.className.includes('shape'));
+
+    const walker = document.createTreeWalker(body, NodeFilter.SHOW_TEXT, {
+        acceptNode: (node) => node.nodeValue.trim()
+            ? NodeFilter.FILTER_ACCEPT
+            : NodeFilter.FILTER_REJECT
+    });
+
+    for (let node = walker.nextNode(); node; node = walker.nextNode()) {
+        const parent = node.parentElement;
+        if (!parent) continue;
+
+        // 1. 红色标注/警告文字（产品重点说明）
+        if (!colorCache.has(parent) && isRed(parent)) {
+            const text = parent.textContent.trim();
+            if (text.length > 0 && text.length < 200) redTexts.add(text);
+        }
+
+        // 2. 向上收集所在的形状节点；祖先已访问过时其上层也必然访问过，可提前结束
+        for (let el = parent; el && el !== body && !visitedShapes.has(el); el = el.parentElement) {
+            visitedShapes.add(el);
+            if (isShape(el)) {
+                const text = el.textContent.trim();
+                if (text.length > 0 && text.length < 100) shapeTexts.add(text);
+            }
+        }
+    }
+
+    // 3. 全部可见文本（最完整的内容）
+    return {
+        red_texts: [...redTexts],
+        shape_texts: [...shapeTexts],
+        full_text: (body.innerText || '').trim()
+    };
+}'''
+
+
+# 渲染时使用的虚拟源站：请求经 Playwright 路由拦截后直接读取本地资源目录
+AXURE_LOCAL_ORIGIN = "http://axure.local"
+
+
+def _resource_route_handler(resource_dir: str):
+    """
+    创建路由处理函数：把虚拟源站的请求映射到资源目录中的文件
+
+    资源文件可能是指向 BlobStore 的符号链接，因此按未解析链接的路径判断是否在资源目录内，
+    链接目标只允许位于资源目录或 BLOB_STORE_DIR 中
+    """
+    root = Path(resource_dir).resolve()
+    blob_root = BLOB_STORE_DIR.resolve()
+
+    async def handle(route):
+        rel_path = unquote(urlparse(route.request.url).path).lstrip('/')
+        # normpath 折叠 ".."，但不跟随符号链接
+        file_path = Path(os.path.normpath(root / rel_path))
+        target = file_path.resolve()
+        if (file_path.is_relative_to(root) and target.is_file() and
+                (target.is_relative_to(root) or target.is_relative_to(blob_root))):
+            await route.fulfill(path=str(target))
+        else:
+            await route.fulfill(status=404, body='Not Found')
+
+    return handle
+
+
+async def _render_page(page, base_url: str, html_file: str, page_name: str,
+                       output_path: Path, return_base64: bool, tile_height: int = 0) -> dict:
+    """
+    渲染单个页面：截图并提取文本
+
+    tile_height > 0 时按固定高度分块截图（clip），不生成整页大图
+    """
+    # 访问页面
+    url = f"{base_url}/{html_file}"
+    await page.goto(url, wait_until='load', timeout=30000)
+
+    # 自适应等待页面就绪（替代固定等待）
+    ready = await page.evaluate(_WAIT_FOR_READY_JS, {
+        'quietMs': RENDER_QUIET_MS,
+        'ceilingMs': RENDER_READY_TIMEOUT_MS
+    })
+    _render_stats['pages'] += 1
+    _render_stats['ready_ms_total'] += ready['ms']
+    _render_stats['reasons'][ready['reason']] = _render_stats['reasons'].get(ready['reason'], 0) + 1
+
+    # Extract page text content (optimized for Axure)
+    sections = await page.evaluate(_PAGE_TEXT_EXTRACTOR_JS)
+    page_text = _format_page_sections(sections)
+
+    # 截图
+    safe_name = re.sub(r'[^\w\s-]', '_', page_name)
+    screenshot_path = output_path / f"{safe_name}.png"
+    text_path = output_path / f"{safe_name}.txt"
+
+    # 保存文本到文件（用于缓存）
+    try:
+        text_path.write_text(page_text, encoding='utf-8')
+    except Exception:
+        pass
+
+    result = {
+        'page_name': page_name,
+        'success': True,
+        'text_path': str(text_path),
+        'page_text': page_text,
+        'sections': sections,
+        'from_cache': False,
+        'ready_ms': ready['ms'],
+        'ready_reason': ready['reason']
+    }
+
+    if tile_height:
+        # 分块截图：每块一个文件，超长页面无需编码整页大图
+        width, height = await page.evaluate(
+            '() => [document.documentElement.scrollWidth, document.documentElement.scrollHeight]'
+        )
+        tiles = []
+        total_bytes = 0
+        for tile_index, top in enumerate(range(0, max(height, 1), tile_height)):
+            clip = {'x': 0, 'y': top, 'width': width, 'height': min(tile_height, height - top) or 1}
+            tile_bytes = await page.screenshot(clip=clip, full_page=True)
+            tile_path = output_path / f"{safe_name}.tile{tile_height}-{tile_index:03d}.png"
+            tile_path.write_bytes(tile_bytes)
+            tiles.append(str(tile_path))
+            total_bytes += len(tile_bytes)
+        result.update(tiles=tiles, tile_height=tile_height, size=f"{total_bytes / 1024:.1f}KB")
+        return result
+
+    # 获取截图字节
+    screenshot_bytes = await page.screenshot(full_page=True)
+
+    # 保存截图到文件
+    screenshot_path.write_bytes(screenshot_bytes)
+
+    result.update(screenshot_path=str(screenshot_path), size=f"{len(screenshot_bytes) / 1024:.1f}KB")
+
+    # 如果需要返回base64
+    if return_base64:
+        result['base64'] = base64.b64encode(screenshot_bytes).decode('utf-8')
+        result['mime_type'] = 'image/png'
+
+    return result
+
+
+def _page_render_signatures(resource_meta: dict) -> dict:
+    """
+    根据资源缓存元数据计算每个页面的渲染签名 {页面文件名(不含.html): 签名}
+
+    签名覆盖页面HTML、页面级mapping、全部依赖资源和视口尺寸，
+    任何一项变化才需要重新渲染，与文档版本号无关
+    """
+    pages = resource_meta.get('pages')
+    if not isinstance(pages, dict):
+        return {}
+    signatures = {}
+    for html_filename, page_meta in pages.items():
+        payload = json.dumps({
+            'html': page_meta.get('html'),
+            'mapping': page_meta.get('mapping'),
+            'assets': page_meta.get('assets', {}),
+            'viewport': [VIEWPORT_WIDTH, VIEWPORT_HEIGHT]
+        }, sort_keys=True)
+        signatures[html_filename[:-5] if html_filename.endswith('.html') else html_filename] = \
+            hashlib.md5(payload.encode('utf-8')).hexdigest()
+    return signatures
+
+
+class RenderManifest:
+    """
+    截图缓存清单（.screenshot_cache.json）
+
+    按页面记录渲染签名与产物文件，页面签名不变即可跨版本复用截图；
+    签名变化时旧截图移入 history/ 并保留最近 SCREENSHOT_HISTORY_LIMIT 个，供版本对比使用
+    """
+
+    FILE_NAME = ".screenshot_cache.json"
+
+    # 进程内每个截图目录共用一个清单实例，并发请求的更新不会互相覆盖；
+    # 弱引用：没有请求在使用时释放，下次从磁盘重新加载
+    _instances = weakref.WeakValueDictionary()
+
+    @classmethod
+    def open(cls, output_path: Path) -> 'RenderManifest':
+        """获取截图目录对应的清单实例"""
+        key = str(output_path.resolve())
+        manifest = cls._instances.get(key)
+        if manifest is None:
+            manifest = cls(output_path)
+            cls._instances[key] = manifest
+        return manifest
+
+    def __init__(self, output_path: Path):
+        self.output_path = output_path
+        self.path = output_path / self.FILE_NAME
+        self.pages = {}
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                # 旧格式（整文档 version_id）无法按页面复用，直接丢弃
+                if isinstance(data.get('pages'), dict):
+                    self.pages = data['pages']
+            except Exception:
+                self.pages = {}
+
+    @staticmethod
+    def _entry_files(entry: dict) -> List[str]:
+        """条目引用的所有文件（整页截图、文本、分块截图）"""
+        files = [entry[key] for key in ('screenshot', 'text') if entry.get(key)]
+        return files + list(entry.get('tiles') or [])
+
+    def lookup(self, page_name: str, signature: Optional[str], tile_height: int = 0) -> Optional[dict]:
+        """签名一致且所需截图文件（整页或指定高度的分块）都存在时返回缓存条目"""
+        entry = self.pages.get(page_name)
+        if not signature or not entry or entry.get('signature') != signature:
+            return None
+        if tile_height:
+            required = entry.get('tiles') if entry.get('tile_height') == tile_height else None
+        else:
+            required = [entry['screenshot']] if entry.get('screenshot') else None
+        if not required or not all((self.output_path / name).exists() for name in required):
+            return None
+        return entry
+
+    def archive(self, page_name: str, signature: Optional[str]):
+        """
+        页面即将以新签名重新渲染：把当前截图移入历史目录并立即落盘
+
+        当前条目不再引用已移走的文件，渲染失败时清单与磁盘上的文件仍然一致
+        """
+        entry = self.pages.get(page_name)
+        if not entry or not entry.get('signature') or entry.get('signature') == signature:
+            return
+        if not any((self.output_path / name).exists() for name in self._entry_files(entry)):
+            return
+
+        history_dir = self.output_path / 'history'
+        history_dir.mkdir(exist_ok=True)
+        archived = {
+            'signature': entry['signature'],
+            'version_id': entry.get('version_id'),
+            'rendered_at': entry.get('rendered_at')
+        }
+
+        # 历史文件名后缀（签名可能含有文件名不允许的字符，统一取哈希）
+        tag = hashlib.md5(entry['signature'].encode('utf-8')).hexdigest()[:12]
+
+        def move(name: str) -> Optional[str]:
+            src = self.output_path / name
+            if not src.exists():
+                return None
+            dest = history_dir / f"{src.stem}.{tag}{src.suffix}"
+            os.replace(src, dest)
+            return str(dest.relative_to(self.output_path))
+
+        for key in ('screenshot', 'text'):
+            if entry.get(key):
+                archived[key] = move(entry[key])
+        if entry.get('tiles'):
+            archived['tiles'] = [name for name in map(move, entry['tiles']) if name]
+            archived['tile_height'] = entry.get('tile_height')
+
+        history = [archived] + entry.get('history', [])
+        for stale in history[SCREENSHOT_HISTORY_LIMIT:]:
+            for name in self._entry_files(stale):
+                (self.output_path / name).unlink(missing_ok=True)
+        entry['history'] = history[:SCREENSHOT_HISTORY_LIMIT]
+        for key in ('screenshot', 'text', 'tiles', 'tile_height'):
+            entry.pop(key, None)
+        self.save()
+
+    def record(self, page_name: str, signature: Optional[str], version_id: Optional[str], result: dict):
+        """
+        记录页面渲染结果并立即落盘（原子替换，单个页面完成即生效）
+
+        同一签名下先后生成的整页截图与分块截图合并保存
+        """
+        previous = self.pages.get(page_name, {})
+        entry = dict(previous) if previous.get('signature') == signature else {'history': previous.get('history', [])}
+        entry.update({
+            'signature': signature,
+            'version_id': version_id,
+            'text': Path(result['text_path']).name,
+            'rendered_at': datetime.now(CHINA_TZ).isoformat()
+        })
+        if result.get('screenshot_path'):
+            entry['screenshot'] = Path(result['screenshot_path']).name
+        if result.get('tiles'):
+            entry['tiles'] = [Path(tile).name for tile in result['tiles']]
+            entry['tile_height'] = result['tile_height']
+        self.pages[page_name] = entry
+        self.save()
+
+    def save(self):
+        tmp_path = self.path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'format': 2, 'pages': self.pages}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"⚠️ Failed to save screenshot manifest: {e}")
+
+
+class PageTextStore:
+    """
+    按文档版本的页面文本存储（{版本}.json）
+
+    每个版本一个紧凑文件，保存全部页面的文本分区，一次读取即可加载；
+    与截图缓存相互独立，截图被清理或从未生成时 text_only 仍可直接命中。
+    只保留最近 TEXT_STORE_VERSION_LIMIT 个版本的文件
+    """
+
+    # 浏览器渲染得到的文本（含计算样式）优先于静态解析结果
+    SOURCE_PRIORITY = {'static': 0, 'render': 1}
+
+    _instances = LRUCache('page_text', max_entries=TEXT_STORE_OPEN_LIMIT)
+    stats = {'loads': 0, 'hits': 0, 'misses': 0, 'saves': 0}
+
+    @classmethod
+    def open(cls, store_dir: Path, version_id: Optional[str]) -> 'PageTextStore':
+        """获取文档版本对应的文本存储实例（进程内共用，最多保留 TEXT_STORE_OPEN_LIMIT 个）"""
+        name = re.sub(r'[^\w.-]', '_', version_id) if version_id else 'latest'
+        path = (store_dir / f"{name}.json").resolve()
+        store = cls._instances.get(str(path))
+        if store is None:
+            store = cls(path)
+            cls._instances.set(str(path), store)
+        return store
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.pages = {}
+        self.dirty = False
+        if path.exists():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.pages = json.load(f).get('pages', {})
+                PageTextStore.stats['loads'] += 1
+            except Exception:
+                self.pages = {}
+
+    def get(self, page_name: str, signature: Optional[str]) -> Optional[dict]:
+        """签名一致时返回页面文本分区"""
+        entry = self.pages.get(page_name)
+        if entry and signature and entry.get('signature') == signature:
+            PageTextStore.stats['hits'] += 1
+            return entry['sections']
+        PageTextStore.stats['misses'] += 1
+        return None
+
+    def put(self, page_name: str, signature: Optional[str], sections: dict, source: str):
+        """写入页面文本分区（同一签名下不会用静态解析结果覆盖渲染结果）"""
+        if not signature:
+            return
+        entry = self.pages.get(page_name)
+        if (entry and entry.get('signature') == signature and
+                self.SOURCE_PRIORITY.get(entry.get('source'), 0) > self.SOURCE_PRIORITY[source]):
+            return
+        self.pages[page_name] = {'signature': signature, 'source': source, 'sections': sections}
+        self.dirty = True
+
+    def save(self):
+        """有变更时原子写入，并清理超出数量限制的旧版本文件"""
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'format': 1, 'pages': self.pages}, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+            PageTextStore.stats['saves'] += 1
+        except Exception as e:
+            print(f"⚠️ Failed to save page text store: {e}")
+            return
 
-        with open(html_path, 'w', encoding='utf-8') as f:
-            f.write(str(soup))
+        versions = sorted(self.path.parent.glob('*.json'), key=lambda p: p.stat().st_mtime, reverse=True)
+        for stale in versions[TEXT_STORE_VERSION_LIMIT:]:
+            if stale != self.path:
+                stale.unlink(missing_ok=True)
+                PageTextStore._instances.pop(str(stale.resolve()), None)
 
 
 async def screenshot_page_internal(resource_dir: str, page_names: List[str], output_dir: str,
-                                   return_base64: bool = True, version_id: str = None) -> List[dict]:
-    """内部截图函数（同时提取页面文本），支持智能缓存"""
-    import http.server
-    import socketserver
-    import threading
-    import time
+                                   return_base64: bool = True, version_id: str = None,
+                                   page_signatures: dict = None, page_index: dict = None,
+                                   tile_height: int = 0, text_store: PageTextStore = None) -> List[dict]:
+    """
+    内部截图函数（同时提取页面文本），支持按页面签名的智能缓存
 
+    Args:
+        page_signatures: 页面渲染签名 {页面文件名: 签名}（见 _page_render_signatures），
+                         未提供时退化为按 version_id 缓存
+        page_index: 页面索引 {页面名: HTML文件名}（download_resources 返回），
+                    未提供时扫描一次资源目录
+        tile_height: 大于0时按该高度分块截图，结果中返回 tiles 列表而不是整页截图
+        text_store: 文档版本的文本存储，缓存命中时优先从中读取文本，渲染结果写回其中
+    """
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
     
-    # 缓存元数据文件
-    cache_meta_path = output_path / ".screenshot_cache.json"
-    cache_meta = {}
-    if cache_meta_path.exists():
-        try:
-            with open(cache_meta_path, 'r', encoding='utf-8') as f:
-                cache_meta = json.load(f)
-        except Exception:
-            cache_meta = {}
+    # 按页面的截图缓存清单
+    manifest = RenderManifest.open(output_path)
+    page_signatures = page_signatures or {}
+
+    def signature_of(page_name: str) -> Optional[str]:
+        signature = page_signatures.get(page_name)
+        if not signature and version_id:
+            signature = f"version:{version_id}"
+        return signature
     
     # 检查哪些页面需要重新截图
-    cached_version = cache_meta.get('version_id')
-    pages_to_render = []
-    cached_results = []
+    results = [None] * len(page_names)  # 按调用方请求的顺序返回
+    pending = []
     
-    for page_name in page_names:
-        safe_name = re.sub(r'[^\w\s-]', '_', page_name)
-        screenshot_file = output_path / f"{safe_name}.png"
-        text_file = output_path / f"{safe_name}.txt"
+    for index, page_name in enumerate(page_names):
+        entry = manifest.lookup(page_name, signature_of(page_name), tile_height)
         
-        # 如果版本相同且文件存在，复用缓存
-        if (version_id and cached_version == version_id and 
-            screenshot_file.exists()):
-            # 读取缓存的文本内容
+        # 页面签名未变化且文件存在，复用缓存
+        if entry:
+            text_file = output_path / entry['text']
+            # 读取缓存的文本内容（文本存储中没有时再读取单独的文本文件）
             page_text = ""
-            if text_file.exists():
+            sections = text_store.get(page_name, entry['signature']) if text_store else None
+            if sections is not None:
+                page_text = _format_page_sections(sections)
+            elif text_file.exists():
                 try:
                     page_text = text_file.read_text(encoding='utf-8')
                 except Exception:
                     page_text = "(Cached - text not available)"
             
-            cached_results.append({
+            results[index] = {
                 'page_name': page_name,
                 'success': True,
-                'screenshot_path': str(screenshot_file),
                 'page_text': page_text if page_text else "(Cached result)",
-                'size': f"{screenshot_file.stat().st_size / 1024:.1f}KB",
-                'from_cache': True
-            })
+                'from_cache': True,
+                'signature': entry['signature']
+            }
+            if tile_height:
+                tiles = [output_path / name for name in entry['tiles']]
+                results[index].update(tiles=[str(tile) for tile in tiles], tile_height=tile_height,
+                                      size=f"{sum(tile.stat().st_size for tile in tiles) / 1024:.1f}KB")
+            else:
+                screenshot_file = output_path / entry['screenshot']
+                results[index].update(screenshot_path=str(screenshot_file),
+                                      size=f"{screenshot_file.stat().st_size / 1024:.1f}KB")
         else:
-            pages_to_render.append(page_name)
-    
-    results = list(cached_results)
+            pending.append(index)
+
+    cached_pages = len(page_names) - len(pending)
+
+    async def report_render_progress():
+        done = sum(1 for result in results if result is not None)
+        await _report_progress('render', done, len(page_names),
+                               f"Rendered {done}/{len(page_names)} pages ({cached_pages} from cache)")
+
+    await report_render_progress()
     
     # 如果所有页面都有缓存，直接返回
-    if not pages_to_render:
+    if not pending:
         return results
     
-    # 启动HTTP服务器（只有需要渲染时才启动）
-    import random
-    port = random.randint(8800, 8900)
-    abs_dir = os.path.abspath(resource_dir)
-    handler = lambda *args, **kwargs: http.server.SimpleHTTPRequestHandler(
-        *args, directory=abs_dir, **kwargs
-    )
-    httpd = socketserver.TCPServer(("", port), handler)
-    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
-    thread.start()
-    time.sleep(1)
+    if page_index is None:
+        page_index = {f.stem: f.name for f in Path(resource_dir).glob("*.html")}
+    serve_resources = _resource_route_handler(resource_dir)
+    queue = asyncio.Queue()
+    for index in pending:
+        queue.put_nowait(index)
+
+    async with _browser_pool.lease() as lease:
+
+        async def open_page():
+            page = await lease.context.new_page()
+            page.on('crash', lambda _: setattr(lease, 'broken', True))
+            await page.add_init_script(_DOM_MUTATION_TRACKER_JS)
+            await page.route(f"{AXURE_LOCAL_ORIGIN}/**", serve_resources)
+            return page
+
+        async def render_worker():
+            """从队列取页面渲染，单个页面失败不影响其他页面"""
+            page = await open_page()
+            try:
+                while not queue.empty():
+                    index = queue.get_nowait()
+                    page_name = page_names[index]
+                    html_file = _resolve_page_file(resource_dir, page_name, page_index)
+                    if not html_file:
+                        results[index] = {
+                            'page_name': page_name,
+                            'success': False,
+                            'error': f'Page {page_name} does not exist'
+                        }
+                        continue
+                    signature = signature_of(page_name)
+
+                    async def render_once():
+                        manifest.archive(page_name, signature)
+                        async with _render_slots:
+                            result = await _render_page(
+                                page, AXURE_LOCAL_ORIGIN, html_file, page_name, output_path,
+                                return_base64, tile_height
+                            )
+                        lease.renders += 1
+                        result['signature'] = signature
+                        manifest.record(page_name, signature, version_id, result)
+                        if text_store:
+                            text_store.put(page_name, signature, result['sections'], 'render')
+                        return result
+
+                    try:
+                        # 其它请求正在渲染同一页面同一签名时直接等待其结果
+                        key = ('render', str(output_path.resolve()), page_name, signature,
+                               return_base64, tile_height)
+                        # 渲染使用本worker的页面与上下文：本请求被取消时一并取消，其它等待者自行重试
+                        results[index] = dict(await _job_flight.do(key, render_once, cancel_with_leader=True))
+                    except Exception as e:
+                        results[index] = {
+                            'page_name': page_name,
+                            'success': False,
+                            'error': str(e)
+                        }
+                        if page.is_closed():
+                            # 页面崩溃：上下文归还时丢弃，换新页面继续渲染
+                            lease.broken = True
+                            page = await open_page()
+                    await report_render_progress()
+            finally:
+                if not page.is_closed():
+                    await page.close()
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        # viewport 只影响初始窗口大小，不影响 full_page=True 的截图范围
-        page = await browser.new_page(viewport={'width': VIEWPORT_WIDTH, 'height': VIEWPORT_HEIGHT})
+        workers = min(RENDER_CONCURRENCY, len(pending))
+        worker_errors = await asyncio.gather(
+            *(render_worker() for _ in range(workers)), return_exceptions=True
+        )
 
-        for page_name in pages_to_render:
-            try:
-                # 查找HTML文件
-                html_file = None
-                for f in Path(resource_dir).glob("*.html"):
-                    if f.stem == page_name:
-                        html_file = f.name
-                        break
-
-                if not html_file:
-                    results.append({
-                        'page_name': page_name,
-                        'success': False,
-                        'error': f'Page {page_name} does not exist'
-                    })
-                    continue
+    # 上下文整体失效时，未完成的页面单独标记失败
+    worker_error = next((e for e in worker_errors if isinstance(e, Exception)), None)
+    for index in pending:
+        if results[index] is None:
+            results[index] = {
+                'page_name': page_names[index],
+                'success': False,
+                'error': str(worker_error) if worker_error else 'Render aborted'
+            }
 
-                # 访问页面
-                url = f"http://localhost:{port}/{html_file}"
-                await page.goto(url, wait_until='networkidle', timeout=30000)
-                await page.wait_for_timeout(2000)
-
-                # Extract page text content (optimized for Axure)
-                page_text = await page.evaluate('''() => {
-                    let sections = [];
-
-                    // 1. Extract red annotation/warning text (product key notes)
-                    const redTexts = Array.from(document.querySelectorAll('*')).filter(el => {
-                        const style = window.getComputedStyle(el);
-                        const color = style.color;
-                        // Detect red text (rgb(255,0,0) or #ff0000, etc.)
-                        return color && (
-                            color.includes('rgb(255, 0, 0)') || 
-                            color.includes('rgb(255,0,0)') ||
-                            color === 'red'
-                        );
-                    });
-
-                    if (redTexts.length > 0) {
-                        const redContent = redTexts
-                            .map(el => el.textContent.trim())
-                            .filter(t => t.length > 0 && t.length < 200)
-                            .filter((v, i, a) => a.indexOf(v) === i); // dedupe
-                        if (redContent.length > 0) {
-                            sections.push("[Important Tips/Warnings]\\n" + redContent.join("\\n"));
-                        }
-                    }
+    if text_store:
+        text_store.save()
+    return results
 
-                    // 2. Extract Axure shape/flowchart node text
-                    const axureShapes = document.querySelectorAll('[id^="u"], .ax_shape, .shape, [class*="shape"]');
-                    const shapeTexts = [];
-                    axureShapes.forEach(el => {
-                        const text = el.textContent.trim();
-                        // Only text with appropriate length (avoid overly long paragraphs)
-                        if (text && text.length > 0 && text.length < 100) {
-                            shapeTexts.push(text);
-                        }
-                    });
 
-                    if (shapeTexts.length > 5) { // If many shape texts extracted, likely a flowchart
-                        const uniqueShapes = [...new Set(shapeTexts)];
-                        sections.push("[Flowchart/Component Text]\\n" + uniqueShapes.slice(0, 20).join(" | ")); // max 20
-                    }
+# ============================================
+# 截图输出压缩（返回给客户端前转码/缩放）
+# ============================================
 
-                    // 3. Extract all visible text (most complete content)
-                    const bodyText = document.body.innerText || '';
-                    if (bodyText.trim()) {
-                        sections.push("[Full Page Text]\\n" + bodyText.trim());
-                    }
+# WebP 单边最大像素，超过时改用 JPEG
+WEBP_MAX_DIMENSION = 16383
+
+_image_stats = {'variants_created': 0, 'variants_reused': 0, 'webp_fallbacks': 0,
+                'original_bytes': 0, 'output_bytes': 0}
+
+
+def _encode_image_variant(src: Path, dest_base: str) -> Path:
+    """按配置转码/缩放图片，写入 dest_base + 扩展名（在线程中执行）"""
+    image_format = SCREENSHOT_FORMAT
+    with PILImage.open(src) as img:
+        img.load()
+        if SCREENSHOT_MAX_DIMENSION and max(img.size) > SCREENSHOT_MAX_DIMENSION:
+            scale = SCREENSHOT_MAX_DIMENSION / max(img.size)
+            img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                             PILImage.LANCZOS)
+        if image_format == 'webp' and max(img.size) > WEBP_MAX_DIMENSION:
+            image_format = 'jpeg'
+            _image_stats['webp_fallbacks'] += 1
+        if image_format == 'jpeg' and img.mode not in ('RGB', 'L'):
+            # JPEG 不支持透明通道
+            img = img.convert('RGB')
+
+        suffix = {'webp': '.webp', 'jpeg': '.jpg'}.get(image_format, '.png')
+        dest = src.with_name(dest_base + suffix)
+        tmp_path = dest.with_name(dest.name + '.tmp')
+        if image_format == 'png':
+            img.save(tmp_path, format='PNG', optimize=True)
+        else:
+            img.save(tmp_path, format=image_format.upper(), quality=SCREENSHOT_QUALITY)
+    os.replace(tmp_path, dest)
+    return dest
 
-                    // 4. If nothing extracted
-                    if (sections.length === 0) {
-                        return "⚠️ Page text is empty or cannot be extracted (please refer to visual output)";
-                    }
 
-                    return sections.join("\\n\\n");
-                }''')
+async def prepare_client_image(src_path: str) -> dict:
+    """
+    生成返回给客户端的图片版本（缓存在原图旁，原图更新后自动重新生成）
+
+    未安装 Pillow 或转码失败时返回原图
 
-                # 截图
-                safe_name = re.sub(r'[^\w\s-]', '_', page_name)
-                screenshot_path = output_path / f"{safe_name}.png"
-                text_path = output_path / f"{safe_name}.txt"
+    Returns:
+        {'path': 返回的图片路径, 'original_bytes': 原图大小, 'output_bytes': 返回图片大小}
+    """
+    src = Path(src_path)
+    src_stat = src.stat()
+    result = {'path': str(src), 'original_bytes': src_stat.st_size, 'output_bytes': src_stat.st_size}
+    if not PIL_AVAILABLE or (SCREENSHOT_FORMAT == 'png' and not SCREENSHOT_MAX_DIMENSION):
+        return result
 
-                # 获取截图字节
-                screenshot_bytes = await page.screenshot(full_page=True)
+    dest_base = f"{src.stem}.{SCREENSHOT_FORMAT}-q{SCREENSHOT_QUALITY}-{SCREENSHOT_MAX_DIMENSION}"
+    variant = None
+    for suffix in ('.webp', '.jpg', '.png'):
+        candidate = src.with_name(dest_base + suffix)
+        if candidate.exists() and candidate.stat().st_mtime_ns >= src_stat.st_mtime_ns:
+            variant = candidate
+            _image_stats['variants_reused'] += 1
+            break
 
-                # 保存截图到文件
-                screenshot_path.write_bytes(screenshot_bytes)
-                
-                # 保存文本到文件（用于缓存）
-                try:
-                    text_path.write_text(page_text, encoding='utf-8')
-                except Exception:
-                    pass
+    if variant is None:
+        try:
+            variant = await asyncio.to_thread(_encode_image_variant, src, dest_base)
+            _image_stats['variants_created'] += 1
+        except Exception as e:
+            print(f"⚠️ Image conversion failed for {src.name}: {e}")
+            return result
+
+    result.update(path=str(variant), output_bytes=variant.stat().st_size)
+    _image_stats['original_bytes'] += result['original_bytes']
+    _image_stats['output_bytes'] += result['output_bytes']
+    return result
 
-                result = {
-                    'page_name': page_name,
-                    'success': True,
-                    'screenshot_path': str(screenshot_path),
-                    'page_text': page_text,
-                    'size': f"{len(screenshot_bytes) / 1024:.1f}KB",
-                    'from_cache': False
-                }
 
-                # 如果需要返回base64
-                if return_base64:
-                    result['base64'] = base64.b64encode(screenshot_bytes).decode('utf-8')
-                    result['mime_type'] = 'image/png'
+def _format_bytes(size: int) -> str:
+    """格式化字节数（KB/MB）"""
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f}MB"
+    return f"{size / 1024:.0f}KB"
 
-                results.append(result)
-            except Exception as e:
-                results.append({
-                    'page_name': page_name,
-                    'success': False,
-                    'error': str(e)
-                })
 
-        await browser.close()
+def _format_image_savings(images: List[dict]) -> str:
+    """汇总图片压缩效果，如 '12.3MB → 1.8MB (-85%)'"""
+    original = sum(image['original_bytes'] for image in images)
+    output = sum(image['output_bytes'] for image in images)
+    change = (output / original - 1) * 100 if original else 0
+    return f"{_format_bytes(original)} → {_format_bytes(output)} ({change:+.0f}%)"
 
-    # 停止服务器
-    httpd.shutdown()
-    httpd.server_close()
-    
-    # 更新缓存元数据
-    if version_id:
-        cache_meta['version_id'] = version_id
-        cache_meta['cached_pages'] = page_names
+
+# ============================================
+# 版本对比（页面签名分类 + 截图像素差异热力图）
+# ============================================
+
+# 像素差异阈值（RGB 通道差的最大值，低于该值视为抗锯齿等渲染噪声）
+_DIFF_PIXEL_THRESHOLD = 32
+
+# 同时生成的热力图数量（每张超长页面需要载入新旧两张整页画布，内存占用较大）
+_diff_slots = asyncio.Semaphore(2)
+
+
+def _find_version(resource_meta: dict, version_id: str) -> Optional[dict]:
+    """在资源缓存的版本历史中查找版本（支持唯一的版本号前缀）"""
+    versions = resource_meta.get('versions') or []
+    for version in versions:
+        if version.get('version_id') == version_id:
+            return version
+    matches = [v for v in versions if version_id and str(v.get('version_id', '')).startswith(version_id)]
+    return matches[0] if len(matches) == 1 else None
+
+
+def diff_page_signatures(old_signatures: dict, new_signatures: dict) -> dict:
+    """
+    按页面签名对比两个版本
+
+    Returns:
+        {'added', 'removed', 'changed', 'unchanged'}: 页面文件名列表（新增/未变按新版本顺序，删除按旧版本顺序）
+    """
+    diff = {'added': [], 'removed': [], 'changed': [], 'unchanged': []}
+    for page_name, signature in new_signatures.items():
+        if page_name not in old_signatures:
+            diff['added'].append(page_name)
+        elif old_signatures[page_name] != signature:
+            diff['changed'].append(page_name)
+        else:
+            diff['unchanged'].append(page_name)
+    diff['removed'] = [page_name for page_name in old_signatures if page_name not in new_signatures]
+    return diff
+
+
+def _render_diff_heatmap(old_path: Path, new_path: Path, dest: Path) -> dict:
+    """对比新旧截图，生成差异热力图（新截图淡化为底图，变化像素标红）"""
+    with PILImage.open(old_path) as old_image, PILImage.open(new_path) as new_image:
+        size = (max(old_image.width, new_image.width), max(old_image.height, new_image.height))
+        # 页面高度变化时以白色补齐，超出部分计为变化
+        old_canvas = PILImage.new('RGB', size, 'white')
+        old_canvas.paste(old_image.convert('RGB'))
+        new_canvas = PILImage.new('RGB', size, 'white')
+        new_canvas.paste(new_image.convert('RGB'))
+
+    # 取三个通道中差异最大的值
+    red, green, blue = ImageChops.difference(old_canvas, new_canvas).split()
+    delta = ImageChops.lighter(ImageChops.lighter(red, green), blue)
+    mask = delta.point(lambda v: 255 if v > _DIFF_PIXEL_THRESHOLD else 0)
+    changed_pixels = mask.histogram()[255]
+
+    heatmap = PILImage.blend(new_canvas.convert('L').convert('RGB'), PILImage.new('RGB', size, 'white'), 0.6)
+    # 扩张变化区域，细小改动在缩放后的图片中也能看到
+    highlight = mask.filter(ImageFilter.MaxFilter(9)).point(lambda v: 160 if v else 0)
+    heatmap.paste(PILImage.new('RGB', size, (255, 0, 0)), mask=highlight)
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dest.with_name(dest.name + '.tmp')
+    heatmap.save(tmp_path, format='PNG')
+    os.replace(tmp_path, dest)
+    return {
+        'path': str(dest),
+        'changed_ratio': changed_pixels / (size[0] * size[1]),
+        'bbox': mask.getbbox()
+    }
+
+
+async def build_diff_heatmaps(output_dir: str, page_names: List[str],
+                              old_signatures: dict, new_signatures: dict) -> dict:
+    """
+    为变化的页面生成截图差异热力图
+
+    旧截图取自截图缓存的 history/（页面以旧签名渲染过整页截图才有基线）
+
+    Returns:
+        {页面文件名: {'path', 'changed_ratio', 'bbox'} 或 {'error'}}
+    """
+    if not PIL_AVAILABLE:
+        return {page_name: {'error': 'Pillow is not installed'} for page_name in page_names}
+
+    output_path = Path(output_dir)
+    manifest = RenderManifest.open(output_path)
+
+    async def build(page_name: str) -> dict:
+        old_signature, new_signature = old_signatures.get(page_name), new_signatures.get(page_name)
+        entry = manifest.pages.get(page_name) or {}
+        if entry.get('signature') != new_signature or not entry.get('screenshot'):
+            return {'error': 'current version has no full-page screenshot'}
+        baseline = next((h for h in entry.get('history', [])
+                         if h.get('signature') == old_signature and h.get('screenshot')), None)
+        if not baseline or not (output_path / baseline['screenshot']).exists():
+            return {'error': 'no screenshot of the earlier version (it was never rendered in full mode)'}
+
+        tag = hashlib.md5(f"{old_signature}:{new_signature}".encode('utf-8')).hexdigest()[:12]
+        safe_name = re.sub(r'[^\w\s-]', '_', page_name)
+        dest = output_path / 'diffs' / f"{safe_name}.{tag}.png"
         try:
-            with open(cache_meta_path, 'w', encoding='utf-8') as f:
-                json.dump(cache_meta, f, ensure_ascii=False, indent=2)
-        except Exception:
-            pass
+            async with _diff_slots:
+                return await asyncio.to_thread(_render_diff_heatmap, output_path / baseline['screenshot'],
+                                               output_path / entry['screenshot'], dest)
+        except Exception as e:
+            return {'error': str(e)}
 
-    return results
+    heatmaps = await asyncio.gather(*(build(page_name) for page_name in page_names))
+    return dict(zip(page_names, heatmaps))
 
 
 @mcp.tool()
@@ -1791,11 +4084,8 @@ async def lanhu_resolve_invite_link(
                     'path': '/'
                 })
         
-        # 使用playwright来处理前端重定向
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context()
-            
+        # 使用共享浏览器的一次性上下文处理前端重定向（Cookie 不污染池中的上下文）
+        async with _browser_pool.temporary_context() as context:
             # 添加cookies
             if cookies:
                 await context.add_cookies(cookies)
@@ -1811,8 +4101,6 @@ async def lanhu_resolve_invite_link(
             # 获取最终URL
             final_url = page.url
             
-            await browser.close()
-            
             # 解析最终URL
             extractor = LanhuExtractor()
             try:
@@ -2544,42 +4832,211 @@ def _get_analysis_mode_prompt(analysis_mode: str) -> dict:
         }
 
 
-@mcp.tool()
-async def lanhu_get_ai_analyze_page_result(
-        url: Annotated[str, "Lanhu URL with docId parameter (indicates PRD/prototype document). Example: https://lanhuapp.com/web/#/item/project/product?tid=xxx&pid=xxx&docId=xxx. If you have an invite link, use lanhu_resolve_invite_link first!"],
-        page_names: Annotated[Union[str, List[str]], "Page name(s) to analyze. Use 'all' for all pages, single name like '退款流程', or list like ['退款流程', '用户中心']. Get exact names from lanhu_get_pages first!"],
-        mode: Annotated[str, "Analysis mode: 'text_only' (fast global scan, text only for overview) or 'full' (detailed analysis with images+text). Default: 'full'"] = "full",
-        analysis_mode: Annotated[str, "Analysis perspective (MUST be chosen by user after STAGE 1): 'developer' (detailed for coding), 'tester' (test scenarios/validation), 'explorer' (quick overview for review). Default: 'developer'"] = "developer",
-        ctx: Context = None
-) -> List[Union[str, Image]]:
+def _tile_token_key(version_id: str, target_pages: List[str]) -> str:
+    """续传令牌绑定的请求标识（文档版本 + 页面列表）"""
+    payload = json.dumps([version_id, target_pages], ensure_ascii=False)
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def _encode_tile_token(version_id: str, target_pages: List[str], page_pos: int, tile_pos: int) -> str:
+    """生成分块截图的续传令牌（记录下一块所在的页面与分块位置）"""
+    payload = json.dumps({'k': _tile_token_key(version_id, target_pages), 'p': page_pos, 't': tile_pos})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_tile_token(token: str, version_id: str, target_pages: List[str]) -> tuple:
+    """解析续传令牌，返回 (页面位置, 分块位置)；令牌无效或与当前请求不匹配时抛出 ValueError"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        page_pos, tile_pos = int(data['p']), int(data['t'])
+    except Exception:
+        raise ValueError("Invalid continuation_token")
+    if data.get('k') != _tile_token_key(version_id, target_pages) or not 0 <= page_pos < len(target_pages):
+        raise ValueError("continuation_token does not match this document version or page selection, "
+                         "please call again without it")
+    return page_pos, tile_pos
+
+
+async def _select_client_tiles(results: List[dict], version_id: str, target_pages: List[str],
+                               start_page: int, start_tile: int, max_tiles: int, max_image_bytes: int) -> tuple:
     """
-    [PRD/Requirement Document] Analyze Lanhu Axure prototype pages - GET VISUAL CONTENT
-    
-    USE THIS WHEN user says: 需求文档, 需求, PRD, 产品文档, 原型, 交互稿, Axure, 看看需求, 帮我看需求, 分析需求, 需求分析
-    DO NOT USE for: UI设计图, 设计稿, 视觉设计, 切图 (use lanhu_get_ai_analyze_design_result instead)
-    
-    FOUR-STAGE WORKFLOW (ZERO OMISSION):
-    1. STAGE 1: Call with mode="text_only" and page_names="all" for global text scan
-       - Purpose: Build god's view, understand structure, design grouping strategy
-       - Output: Text only (fast)
-       - ⚠️ IMPORTANT: After STAGE 1, MUST ask user to choose analysis_mode!
-    
-    2. STAGE 2: Call with mode="full" for each group (output format varies by analysis_mode)
-       - developer: Extract ALL details (fields, rules, flows) - for coding
-       - tester: Extract test scenarios, validation points, field rules - for test cases
-       - explorer: Extract core functions only (3-5 points) - for requirement review
-    
-    3. STAGE 3: Reverse validation (format varies by analysis_mode)
-    
-    4. STAGE 4: Generate deliverable (format varies by analysis_mode)
-       - developer: Detailed requirement doc + global flowchart
-       - tester: Test plan + test case list + field validation table
-       - explorer: Review PPT-style doc + module table + dependency diagram
-    
+    按预算依次选取分块，超出预算的部分生成续传令牌（每次至少返回一块）
+
+    Args:
+        results: 从 target_pages[start_page] 开始的页面渲染结果，选中的分块写入各结果的 client_tiles
+        start_tile: 第一个页面从第几块开始
+
     Returns:
-        - mode="text_only": Text content only (for fast global scan)
-        - mode="full": Visual + text (format determined by analysis_mode)
+        (选中的客户端图片列表, 续传令牌；全部返回完时为None)
+    """
+    client_images = []
+    used_bytes = 0
+    for pos, r in enumerate(results):
+        if not r['success']:
+            continue
+        r['client_tiles'] = []
+        for tile_pos in range(start_tile if pos == 0 else 0, len(r['tiles'])):
+            image = await prepare_client_image(r['tiles'][tile_pos])
+            if client_images and ((max_tiles and len(client_images) >= max_tiles) or
+                                  (max_image_bytes and used_bytes + image['output_bytes'] > max_image_bytes)):
+                return client_images, _encode_tile_token(version_id, target_pages, start_page + pos, tile_pos)
+            r['client_tiles'].append({**image, 'tile': tile_pos + 1, 'total': len(r['tiles'])})
+            client_images.append(image)
+            used_bytes += image['output_bytes']
+    return client_images, None
+
+
+# ============================================
+# 后台分析任务与进度上报
+# ============================================
+
+# 当前调用的进度回调（由分析工具按调用设置，下载/渲染过程中逐页上报）
+_progress_callback = contextvars.ContextVar('lanhu_progress_callback', default=None)
+
+
+async def _report_progress(stage: str, done: int, total: int, message: str):
+    """上报当前调用的进度（未设置回调时忽略，上报失败不影响主流程）"""
+    callback = _progress_callback.get()
+    if callback is None:
+        return
+    try:
+        await callback(stage, done, total, message)
+    except Exception:
+        pass
+
+
+class _ProgressTracker:
+    """
+    进度回调：把各阶段（下载、渲染/文本提取）的进度合并为单调递增的整体进度，
+    记录到后台任务并通过 ctx.report_progress 转发给客户端
+    """
+
+    def __init__(self, ctx: Optional[Context] = None):
+        self.ctx = ctx
+        self.job = None
+        self.stage = None
+        self.base = 0
+        self.stage_total = 0
+
+    async def __call__(self, stage: str, done: int, total: int, message: str):
+        if stage != self.stage:
+            if self.stage is not None:
+                self.base += self.stage_total
+            self.stage = stage
+        self.stage_total = total
+        progress, overall = self.base + done, self.base + total
+
+        if self.job is not None:
+            self.job['progress'] = {'stage': stage, 'done': done, 'total': total, 'message': message}
+        if self.ctx is not None:
+            try:
+                await self.ctx.report_progress(progress, overall, message)
+            except Exception:
+                # 客户端已断开：后续只记录到任务，不再转发
+                self.ctx = None
+
+
+class AnalysisJobManager:
     """
+    后台分析任务
+
+    任务在独立的 asyncio.Task 中执行，发起调用的客户端断开（包括按会话退出 lifespan）不影响执行，
+    进程退出时随事件循环一起取消；结束后的结果保留 ANALYSIS_JOB_TTL 秒，过期任务在下次访问时清理
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._jobs = {}
+        self._idle_callbacks = []
+        self.stats = {'started': 0, 'completed': 0, 'failed': 0, 'expired': 0}
+
+    def _prune(self):
+        now = time.monotonic()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['finished'] is not None and now - job['finished'] > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+        self.stats['expired'] += len(expired)
+
+    def start(self, description: str, tracker: _ProgressTracker, run) -> dict:
+        """
+        启动后台任务
+
+        Args:
+            description: 任务说明
+            tracker: 进度回调（任务内的下载/渲染进度记录到任务上）
+            run: 无参协程函数，返回值作为任务结果
+        """
+        self._prune()
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'description': description,
+            'status': 'running',
+            'created_at': datetime.now(CHINA_TZ).isoformat(),
+            'started': time.monotonic(),
+            'finished': None,
+            'progress': None,
+            'result': None,
+            'error': None
+        }
+        tracker.job = job
+        self._jobs[job['id']] = job
+        self.stats['started'] += 1
+        job['task'] = asyncio.create_task(self._run(job, tracker, run))
+        return job
+
+    async def _run(self, job: dict, tracker: _ProgressTracker, run):
+        # 任务拥有独立的上下文副本，进度回调只作用于本任务
+        _progress_callback.set(tracker)
+        try:
+            job['result'] = await run()
+            job['status'] = 'completed'
+            self.stats['completed'] += 1
+        except asyncio.CancelledError:
+            job['status'], job['error'] = 'failed', 'Cancelled (server shutting down)'
+            self.stats['failed'] += 1
+            self._idle_callbacks.clear()  # 进程退出，不再执行延后的清理
+            raise
+        except Exception as e:
+            job['status'], job['error'] = 'failed', str(e)
+            self.stats['failed'] += 1
+        finally:
+            job['finished'] = time.monotonic()
+            if not self.running():
+                callbacks, self._idle_callbacks = self._idle_callbacks, []
+                for callback in callbacks:
+                    try:
+                        await callback()
+                    except Exception as e:
+                        print(f"⚠️ Deferred cleanup failed: {e}")
+
+    def get(self, job_id: str) -> Optional[dict]:
+        self._prune()
+        return self._jobs.get(job_id)
+
+    def running(self) -> int:
+        """运行中的任务数"""
+        return sum(1 for job in self._jobs.values() if job['status'] == 'running')
+
+    async def when_idle(self, callback):
+        """没有运行中的任务时立即执行 callback（无参协程函数），否则在最后一个任务结束后执行"""
+        if self.running():
+            self._idle_callbacks.append(callback)
+        else:
+            await callback()
+
+    def snapshot(self) -> dict:
+        """获取统计快照"""
+        return {**self.stats, 'running': self.running(), 'retained': len(self._jobs)}
+
+
+_analysis_jobs = AnalysisJobManager(ANALYSIS_JOB_TTL)
+
+
+async def _analyze_pages_internal(url: str, page_names: Union[str, List[str]], mode: str, analysis_mode: str,
+                                  max_tiles: int, max_image_bytes: int, continuation_token: str,
+                                  since_version: str, ctx: Optional[Context]) -> List[Union[str, Image]]:
+    """分析原型页面的实际实现（前台调用或后台任务中执行，参数见 lanhu_get_ai_analyze_page_result）"""
     extractor = LanhuExtractor()
 
     try:
@@ -2598,13 +5055,9 @@ async def lanhu_get_ai_analyze_page_result(
         resource_dir = str(DATA_DIR / f"axure_extract_{doc_id[:8]}")
         output_dir = str(DATA_DIR / f"axure_extract_{doc_id[:8]}_screenshots")
 
-        # 下载资源（支持智能缓存）
+        # 下载资源（支持智能缓存，变化的页面在下载时完成HTML修复）
         download_result = await extractor.download_resources(url, resource_dir)
 
-        # 如果是新下载或更新，修复HTML
-        if download_result['status'] in ['downloaded', 'updated']:
-            fix_html_files(resource_dir)
-
         # 获取页面列表
         pages_info = await extractor.get_pages_list(url)
         all_pages = pages_info['pages']
@@ -2640,12 +5093,58 @@ async def lanhu_get_ai_analyze_page_result(
         # 截图（不需要返回base64了，直接保存文件）
         # 传入version_id用于智能缓存
         version_id = download_result.get('version_id', '')
-        results = await screenshot_page_internal(resource_dir, target_pages, output_dir, return_base64=False, version_id=version_id)
+        resource_meta = extractor._load_cache_meta(Path(resource_dir))
+        page_signatures = _page_render_signatures(resource_meta)
+
+        # 版本对比：只保留自指定版本以来新增/变化的页面
+        version_diff = None
+        if since_version:
+            base_version = _find_version(resource_meta, since_version)
+            if not base_version:
+                known = ", ".join(str(v.get('version_id', ''))[:8] for v in resource_meta.get('versions', []))
+                return [f"⚠️ Version {since_version} is not in the local version history (known: {known or 'none'}). "
+                        f"A version is recorded each time it is synced by this server."]
+            if not base_version.get('signatures'):
+                # 基线版本没有页面签名（旧格式缓存补录），无法区分新增与变化
+                return [f"⚠️ Page signatures of version {since_version} are unknown, cannot compare versions. "
+                        f"Call again without since_version to analyze all pages."]
+            version_diff = diff_page_signatures(base_version['signatures'], page_signatures)
+            version_diff.update(since=base_version['version_id'], base_signatures=base_version['signatures'])
+            changed_pages = set(version_diff['added'] + version_diff['changed'])
+            target_pages = [p for p in target_pages if p in changed_pages]
+            if not target_pages:
+                removed = ", ".join(version_diff['removed']) or "none"
+                return [f"✓ No requested pages were added or changed since version {version_diff['since'][:8]}... "
+                        f"(current: {version_id[:8]}...). Removed pages: {removed}"]
+
+        # 分块模式：按图片数量/字节预算分批返回，续传令牌记录下一块的位置
+        tiled = mode != "text_only" and (max_tiles > 0 or max_image_bytes > 0 or bool(continuation_token))
+        start_page, start_tile = 0, 0
+        if tiled and continuation_token:
+            try:
+                start_page, start_tile = _decode_tile_token(continuation_token, version_id, target_pages)
+            except ValueError as e:
+                return [f"⚠️ {e}"]
+
+        # 按版本的页面文本存储（独立于截图缓存）
+        text_store = PageTextStore.open(DATA_DIR / f"axure_extract_{doc_id[:8]}_text", version_id)
+
+        if mode == "text_only":
+            # 纯文本模式优先读取文本存储，未命中的页面直接解析HTML，不启动浏览器
+            results = await extract_pages_text(resource_dir, target_pages, download_result.get('page_index'),
+                                               text_store=text_store, page_signatures=page_signatures)
+        else:
+            results = await screenshot_page_internal(resource_dir, target_pages[start_page:], output_dir,
+                                                     return_base64=False, version_id=version_id,
+                                                     page_signatures=page_signatures,
+                                                     page_index=download_result.get('page_index'),
+                                                     tile_height=SCREENSHOT_TILE_HEIGHT if tiled else 0,
+                                                     text_store=text_store)
 
         # 构建响应
         cached_count = sum(1 for r in results if r.get('from_cache'))
         summary = {
-            'total_requested': len(target_pages),
+            'total_requested': len(results),
             'successful': sum(1 for r in results if r['success']),
             'failed': sum(1 for r in results if not r['success']),
         }
@@ -2653,11 +5152,37 @@ async def lanhu_get_ai_analyze_page_result(
         # 提取成功的结果
         success_results = [r for r in results if r['success']]
 
+        # FULL模式：生成压缩后的客户端图片版本
+        client_images = []
+        next_token = None
+        if tiled:
+            client_images, next_token = await _select_client_tiles(
+                results, version_id, target_pages, start_page, start_tile, max_tiles, max_image_bytes
+            )
+            success_results = [r for r in success_results if r.get('client_tiles')]
+        elif mode != "text_only":
+            for r in success_results:
+                if 'screenshot_path' in r:
+                    r['client_image'] = await prepare_client_image(r['screenshot_path'])
+                    client_images.append(r['client_image'])
+
+        # 版本对比：为变化的页面生成差异热力图（排在全部截图之后）
+        diff_images = []
+        if version_diff and mode != "text_only" and not tiled:
+            changed_results = [r for r in success_results if r['page_name'] in version_diff['changed']]
+            heatmaps = await build_diff_heatmaps(output_dir, [r['page_name'] for r in changed_results],
+                                                 version_diff['base_signatures'], page_signatures)
+            for r in changed_results:
+                r['heatmap'] = heatmaps[r['page_name']]
+                if 'path' in r['heatmap']:
+                    r['heatmap']['client_image'] = await prepare_client_image(r['heatmap']['path'])
+                    diff_images.append(r)
+
         # 构建返回内容列表（图文穿插）
         content = []
 
         # Add summary header - 简化显示，只告知是否命中缓存
-        all_from_cache = cached_count == len(target_pages) and cached_count > 0
+        all_from_cache = cached_count == len(results) and cached_count > 0
         cache_hint = "⚡" if all_from_cache else "✓"
 
         # Build reverse mapping from filename to display name
@@ -2668,7 +5193,21 @@ async def lanhu_get_ai_analyze_page_result(
         mode_indicator = "📝 TEXT_ONLY MODE" if is_text_only else "📸 FULL MODE"
         
         header_text = f"{cache_hint} {mode_indicator} | Version: {download_result['version_id'][:8]}...\n"
-        header_text += f"📊 Total {summary['successful']}/{summary['total_requested']} pages\n\n"
+        header_text += f"📊 Total {summary['successful']}/{summary['total_requested']} pages\n"
+        failed_assets = download_result.get('failed_assets') or []
+        if failed_assets:
+            header_text += f"⚠️ {len(failed_assets)} resource files failed to download, affected pages may render incompletely (will retry on next call)\n"
+        if client_images:
+            header_text += f"🖼️ Images: {_format_image_savings(client_images)}\n"
+        if version_diff:
+            header_text += (f"🔀 Since version {version_diff['since'][:8]}...: {len(version_diff['added'])} added, "
+                            f"{len(version_diff['changed'])} changed, {len(version_diff['removed'])} removed, "
+                            f"{len(version_diff['unchanged'])} unchanged (only added/changed pages are returned)\n")
+            for label, key in (("➕ Added", 'added'), ("✏️ Changed", 'changed'), ("➖ Removed", 'removed')):
+                if version_diff[key]:
+                    names = [filename_to_display.get(p, p) for p in version_diff[key]]
+                    header_text += f"  {label}: {', '.join(names)}\n"
+        header_text += "\n"
         
         if is_text_only:
             # TEXT_ONLY模式的提示（STAGE 1全局扫描）
@@ -2717,20 +5256,34 @@ async def lanhu_get_ai_analyze_page_result(
         header_text += "  1️⃣ [ABOVE] All visual outputs displayed in page order (top to bottom)\n"
         header_text += "  2️⃣ [BELOW] Corresponding document text content (top to bottom)\n\n"
         header_text += "📌 Image-Text Mapping:\n"
-        if success_results:
+        if tiled:
+            image_no = 0
+            for r in success_results:
+                display_name = filename_to_display.get(r['page_name'], r['page_name'])
+                for tile in r['client_tiles']:
+                    image_no += 1
+                    header_text += f"  • Image {image_no} ↔ {display_name} (tile {tile['tile']}/{tile['total']})\n"
+            if next_token:
+                header_text += f"\n➡️ More tiles remain. Call again with the same url/page_names/mode and continuation_token=\"{next_token}\"\n"
+        elif success_results:
             display_name = filename_to_display.get(success_results[0]['page_name'], success_results[0]['page_name'])
             header_text += f"  • Image 1 ↔ Page 1 text: {display_name}\n"
-        if len(success_results) > 1:
+        if len(success_results) > 1 and not tiled:
             display_name = filename_to_display.get(success_results[1]['page_name'], success_results[1]['page_name'])
             header_text += f"  • Image 2 ↔ Page 2 text: {display_name}\n"
-        if len(success_results) > 2:
+        if len(success_results) > 2 and not tiled:
             display_name = filename_to_display.get(success_results[2]['page_name'], success_results[2]['page_name'])
             header_text += f"  • Image 3 ↔ Page 3 text: {display_name}\n"
-        if len(success_results) > 3:
+        if len(success_results) > 3 and not tiled:
             display_name = filename_to_display.get(success_results[3]['page_name'], success_results[3]['page_name'])
             header_text += f"  • Image 4 ↔ Page 4 text: {display_name}\n"
-        if len(success_results) > 4:
+        if len(success_results) > 4 and not tiled:
             header_text += f"  • ... Total {len(success_results)} pages, and so on\n"
+        if diff_images:
+            header_text += "  🔥 Diff heatmaps follow the screenshots (red = changed since the earlier version):\n"
+            for image_no, r in enumerate(diff_images, len(client_images) + 1):
+                display_name = filename_to_display.get(r['page_name'], r['page_name'])
+                header_text += f"  • Image {image_no} ↔ {display_name} diff ({r['heatmap']['changed_ratio']:.1%} of pixels changed)\n"
         header_text += "\n💡 Please match visual outputs above with text below to understand each page's requirements\n"
         header_text += "=" * 60 + "\n"
         
@@ -2768,8 +5321,12 @@ async def lanhu_get_ai_analyze_page_result(
         if not is_text_only:
             # FULL模式：先添加所有截图
             for r in success_results:
-                if 'screenshot_path' in r:
-                    content.append(Image(path=r['screenshot_path']))
+                for tile in r.get('client_tiles', []):
+                    content.append(Image(path=tile['path']))
+                if 'client_image' in r:
+                    content.append(Image(path=r['client_image']['path']))
+            for r in diff_images:
+                content.append(Image(path=r['heatmap']['client_image']['path']))
 
         # Add all text content (格式根据mode不同)
         if is_text_only:
@@ -2798,6 +5355,24 @@ async def lanhu_get_ai_analyze_page_result(
             page_text += f"📄 Page {idx}: {display_name}\n"
             page_text += f"{'─' * 60}\n"
 
+            if 'client_image' in r:
+                page_text += f"🖼️ Image {idx}: {_format_image_savings([r['client_image']])}\n"
+            if version_diff:
+                status = 'Added' if r['page_name'] in version_diff['added'] else 'Changed'
+                page_text += f"🔀 {status} since version {version_diff['since'][:8]}...\n"
+            heatmap = r.get('heatmap')
+            if heatmap and 'error' in heatmap:
+                page_text += f"🔥 Diff heatmap unavailable: {heatmap['error']}\n"
+            elif heatmap:
+                page_text += f"🔥 Changed pixels: {heatmap['changed_ratio']:.1%}, region (left, top, right, bottom): {heatmap['bbox']}\n"
+            if r.get('client_tiles'):
+                tiles = r['client_tiles']
+                page_text += f"🧩 Tiles {tiles[0]['tile']}-{tiles[-1]['tile']}/{tiles[0]['total']}: {_format_image_savings(tiles)}\n"
+                if tiles[0]['tile'] > 1:
+                    # 续传的页面文本已在上一批返回
+                    content.append(page_text + "(Page text was returned with the previous tiles)\n")
+                    continue
+
             if 'page_text' in r and r['page_text']:
                 page_text += r['page_text'] + "\n"
             else:
@@ -2819,6 +5394,114 @@ async def lanhu_get_ai_analyze_page_result(
         await extractor.close()
 
 
+@mcp.tool()
+async def lanhu_get_ai_analyze_page_result(
+        url: Annotated[str, "Lanhu URL with docId parameter (indicates PRD/prototype document). Example: https://lanhuapp.com/web/#/item/project/product?tid=xxx&pid=xxx&docId=xxx. If you have an invite link, use lanhu_resolve_invite_link first!"],
+        page_names: Annotated[Union[str, List[str]], "Page name(s) to analyze. Use 'all' for all pages, single name like '退款流程', or list like ['退款流程', '用户中心']. Get exact names from lanhu_get_pages first!"],
+        mode: Annotated[str, "Analysis mode: 'text_only' (fast global scan, text only for overview) or 'full' (detailed analysis with images+text). Default: 'full'"] = "full",
+        analysis_mode: Annotated[str, "Analysis perspective (MUST be chosen by user after STAGE 1): 'developer' (detailed for coding), 'tester' (test scenarios/validation), 'explorer' (quick overview for review). Default: 'developer'"] = "developer",
+        max_tiles: Annotated[int, "Tiled output for very tall pages (mode='full'): max number of image tiles in this response. 0 = no tiling, one full-page image per page. Default: 0"] = 0,
+        max_image_bytes: Annotated[int, "Tiled output (mode='full'): max total image bytes in this response, 0 = unlimited. Remaining tiles are returned with a continuation_token. Default: 0"] = 0,
+        continuation_token: Annotated[str, "Token from a previous tiled response to fetch the remaining tiles (keep url, page_names and mode unchanged)"] = "",
+        since_version: Annotated[str, "Only return pages added or changed since this document version (full version id or its first 8 chars, as shown in the 'Version:' header of earlier responses). In mode='full' changed pages also get a pixel-diff heatmap. Default: '' (no filtering)"] = "",
+        background: Annotated[bool, "Run as a background job and return a job id immediately (recommended for page_names='all' on large documents). Fetch progress/result with lanhu_get_analysis_job. Default: False"] = False,
+        ctx: Context = None
+) -> List[Union[str, Image]]:
+    """
+    [PRD/Requirement Document] Analyze Lanhu Axure prototype pages - GET VISUAL CONTENT
+    
+    USE THIS WHEN user says: 需求文档, 需求, PRD, 产品文档, 原型, 交互稿, Axure, 看看需求, 帮我看需求, 分析需求, 需求分析
+    DO NOT USE for: UI设计图, 设计稿, 视觉设计, 切图 (use lanhu_get_ai_analyze_design_result instead)
+    
+    FOUR-STAGE WORKFLOW (ZERO OMISSION):
+    1. STAGE 1: Call with mode="text_only" and page_names="all" for global text scan
+       - Purpose: Build god's view, understand structure, design grouping strategy
+       - Output: Text only (fast)
+       - ⚠️ IMPORTANT: After STAGE 1, MUST ask user to choose analysis_mode!
+    
+    2. STAGE 2: Call with mode="full" for each group (output format varies by analysis_mode)
+       - developer: Extract ALL details (fields, rules, flows) - for coding
+       - tester: Extract test scenarios, validation points, field rules - for test cases
+       - explorer: Extract core functions only (3-5 points) - for requirement review
+    
+    3. STAGE 3: Reverse validation (format varies by analysis_mode)
+    
+    4. STAGE 4: Generate deliverable (format varies by analysis_mode)
+       - developer: Detailed requirement doc + global flowchart
+       - tester: Test plan + test case list + field validation table
+       - explorer: Review PPT-style doc + module table + dependency diagram
+    
+    VERY TALL PAGES: set max_tiles and/or max_image_bytes to receive fixed-height tiles within
+    the budget; follow the returned continuation_token to get the remaining tiles.
+    
+    LARGE DOCUMENTS: pass background=True to get a job id right away, then poll
+    lanhu_get_analysis_job(job_id) until the result is ready (avoids client timeouts).
+    
+    NEW DOCUMENT VERSION: pass since_version (the version you analyzed before) to get only
+    added/changed pages, plus a list of removed pages and red-highlighted diff heatmaps.
+    
+    Returns:
+        - mode="text_only": Text content only (for fast global scan)
+        - mode="full": Visual + text (format determined by analysis_mode)
+    """
+    # 后台任务在工具返回后继续运行，请求的进度令牌已失效，只记录到任务上
+    tracker = _ProgressTracker(None if background else ctx)
+
+    async def run():
+        return await _analyze_pages_internal(url, page_names, mode, analysis_mode, max_tiles, max_image_bytes,
+                                             continuation_token, since_version, ctx)
+
+    if background:
+        pages_desc = page_names if isinstance(page_names, str) else f"{len(page_names)} pages"
+        job = _analysis_jobs.start(f"{mode} analysis of {pages_desc} ({url})", tracker, run)
+        return [
+            f"🕒 Background job started: {job['id']}\n"
+            f"📋 {job['description']}\n"
+            f"👉 Call lanhu_get_analysis_job(job_id=\"{job['id']}\") to check progress and fetch the result "
+            f"(kept for {ANALYSIS_JOB_TTL // 60} minutes after it finishes)."
+        ]
+
+    token = _progress_callback.set(tracker)
+    try:
+        return await run()
+    finally:
+        _progress_callback.reset(token)
+
+
+@mcp.tool()
+async def lanhu_get_analysis_job(
+        job_id: Annotated[str, "Job id returned by lanhu_get_ai_analyze_page_result(background=True)"]
+) -> List[Union[str, Image]]:
+    """
+    Get progress or result of a background page analysis job
+    
+    USE THIS WHEN: lanhu_get_ai_analyze_page_result returned a background job id
+    
+    Returns:
+        - Running: current stage and progress, call again later
+        - Completed: the same content lanhu_get_ai_analyze_page_result would have returned
+        - Failed: error message
+    """
+    job = _analysis_jobs.get(job_id)
+    if job is None:
+        return [f"⚠️ Job {job_id} not found (unknown id or expired {ANALYSIS_JOB_TTL // 60} minutes after finishing)"]
+
+    if job['status'] == 'running':
+        elapsed = time.monotonic() - job['started']
+        progress = job['progress']
+        status = f"⏳ Job {job_id} is running ({elapsed:.0f}s elapsed)\n📋 {job['description']}\n"
+        if progress:
+            status += f"📊 {progress['message']}\n"
+        else:
+            status += "📊 Preparing document...\n"
+        return [status + "👉 Call lanhu_get_analysis_job again in a few seconds."]
+
+    if job['status'] == 'failed':
+        return [f"❌ Job {job_id} failed: {job['error']}"]
+
+    return job['result']
+
+
 async def _get_designs_internal(extractor: LanhuExtractor, url: str) -> dict:
     """内部函数：获取设计图列表"""
     # 解析URL获取参数
@@ -2974,16 +5657,10 @@ async def lanhu_get_ai_analyze_design_result(
                 # 获取原图URL（去掉OSS处理参数）
                 img_url = design['url'].split('?')[0]
 
-                # 下载图片
-                response = await extractor.client.get(img_url)
-                response.raise_for_status()
-
-                # 保存文件
+                # 流式下载图片到文件（支持大图断点续传）
                 filename = f"{design['name']}.png"
                 filepath = output_dir / filename
-
-                with open(filepath, 'wb') as f:
-                    f.write(response.content)
+                await _download_engine.download_to(extractor.client, img_url, filepath)
 
                 results.append({
                     'success': True,
@@ -2997,6 +5674,11 @@ async def lanhu_get_ai_analyze_design_result(
                     'error': str(e)
                 })
 
+        # 生成压缩后的客户端图片版本
+        for r in results:
+            if r['success']:
+                r['client_image'] = await prepare_client_image(r['screenshot_path'])
+
         # Build return content
         content = []
 
@@ -3009,7 +5691,7 @@ async def lanhu_get_ai_analyze_design_result(
         summary_text += "📋 Design List (display order from top to bottom):\n"
         success_results = [r for r in results if r['success']]
         for idx, r in enumerate(success_results, 1):
-            summary_text += f"{idx}. {r['design_name']}\n"
+            summary_text += f"{idx}. {r['design_name']} ({_format_image_savings([r['client_image']])})\n"
 
         # Show failed designs
         failed_results = [r for r in results if not r['success']]
@@ -3020,10 +5702,10 @@ async def lanhu_get_ai_analyze_design_result(
 
         content.append(summary_text)
 
-        # 添加成功的截图
+        # 添加成功的截图（压缩后的客户端版本）
         for r in results:
-            if r['success'] and 'screenshot_path' in r:
-                content.append(Image(path=r['screenshot_path']))
+            if r['success'] and 'client_image' in r:
+                content.append(Image(path=r['client_image']['path']))
 
         return content
     finally:
@@ -3883,6 +6565,41 @@ async def lanhu_get_members(
     }
 
 
+# ==================== 运行状态监控 ====================
+
+def get_runtime_stats() -> dict:
+    """汇总各子系统的运行统计（用于监控）"""
+    return {
+        'upstream_single_flight': _upstream_flight.snapshot(),
+        'mapping_cache': _mapping_cache.snapshot(),
+        'metadata_cache': _metadata_cache.snapshot(),
+        'blob_store': _blob_store.snapshot(),
+        'download_engine': _download_engine.snapshot(),
+        'jobs': _job_flight.snapshot(),
+        'integrity': _integrity.snapshot(),
+        'browser_pool': _browser_pool.snapshot(),
+        'render': {**_render_stats, 'concurrency': RENDER_CONCURRENCY},
+        'images': {**_image_stats, 'pillow': PIL_AVAILABLE, 'format': SCREENSHOT_FORMAT},
+        'text_store': {**PageTextStore.stats, 'open': len(PageTextStore._instances)},
+        'analysis_jobs': _analysis_jobs.snapshot(),
+    }
+
+
+async def runtime_stats(request):
+    """运行状态监控接口：GET /stats 返回各子系统的统计计数"""
+    from starlette.responses import JSONResponse
+    if STATS_TOKEN:
+        authorization = request.headers.get('authorization', '')
+        if not hmac.compare_digest(authorization.encode(), f"Bearer {STATS_TOKEN}".encode()):
+            return JSONResponse({'error': 'Unauthorized'}, status_code=401)
+    return JSONResponse(get_runtime_stats())
+
+
+# 统计信息暴露缓存规模、任务数等内部运行状态，需显式开启
+if STATS_ENDPOINT_ENABLED:
+    mcp.custom_route("/stats", methods=["GET"])(runtime_stats)
+
+
 if __name__ == "__main__":
     # 运行MCP服务器
     # 使用HTTP传输方式，支持环境变量配置
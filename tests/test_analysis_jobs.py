@@ -0,0 +1,87 @@
+"""Tests for background analysis jobs and their progress tracking"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import lanhu_mcp_server as server  # noqa: E402
+
+
+async def test_analysis_job_result_expires_after_ttl():
+    """Finished jobs stay readable until the TTL passes, then are pruned"""
+    jobs = server.AnalysisJobManager(ttl=60)
+
+    async def run():
+        return ['result']
+
+    job = jobs.start('test job', server._ProgressTracker(None), run)
+    await job['task']
+
+    assert jobs.get(job['id'])['status'] == 'completed'
+    assert jobs.get(job['id'])['result'] == ['result']
+
+    job['finished'] -= 61
+    assert jobs.get(job['id']) is None
+    assert jobs.stats['expired'] == 1
+
+
+async def test_failed_job_records_error():
+    jobs = server.AnalysisJobManager(ttl=60)
+
+    async def run():
+        raise RuntimeError('render failed')
+
+    job = jobs.start('failing job', server._ProgressTracker(None), run)
+    await job['task']
+
+    assert job['status'] == 'failed'
+    assert job['error'] == 'render failed'
+    assert jobs.snapshot() == {'started': 1, 'completed': 0, 'failed': 1, 'expired': 0,
+                               'running': 0, 'retained': 1}
+
+
+async def test_progress_is_recorded_on_the_job():
+    """Stages add up into one monotonic total"""
+    jobs = server.AnalysisJobManager(ttl=60)
+    tracker = server._ProgressTracker(None)
+
+    async def run():
+        await server._report_progress('download', 4, 4, 'downloaded')
+        await server._report_progress('render', 1, 3, 'rendering')
+        return tracker.base + 1
+
+    job = jobs.start('progress job', tracker, run)
+    await job['task']
+
+    assert job['result'] == 5
+    assert job['progress'] == {'stage': 'render', 'done': 1, 'total': 3, 'message': 'rendering'}
+
+
+async def test_when_idle_waits_for_running_jobs():
+    """Deferred cleanup runs once, after the last running job finishes"""
+    jobs = server.AnalysisJobManager(ttl=60)
+    release = asyncio.Event()
+    cleaned = []
+
+    async def run():
+        await release.wait()
+
+    async def cleanup():
+        cleaned.append(jobs.running())
+
+    first = jobs.start('first', server._ProgressTracker(None), run)
+    second = jobs.start('second', server._ProgressTracker(None), run)
+    await jobs.when_idle(cleanup)
+    assert cleaned == []
+
+    release.set()
+    await asyncio.gather(first['task'], second['task'])
+    assert cleaned == [0]
+
+    # Nothing running: the callback runs immediately
+    await jobs.when_idle(cleanup)
+    assert cleaned == [0, 0]
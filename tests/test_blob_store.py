@@ -0,0 +1,87 @@
+"""Tests for the content-addressed blob store for Axure CDN assets"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import httpx
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import lanhu_mcp_server as server  # noqa: E402
+
+SIGN = 'abc/style.css'
+URL = 'https://cdn.example.com/abc/style.css'
+
+
+def counting_client(counter: list, body: bytes = b'body{}') -> httpx.AsyncClient:
+    async def handler(request):
+        counter.append(str(request.url))
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, content=body)
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def test_downloads_once_and_hardlinks(tmp_path):
+    """Each sign_md5 is fetched once and materialized into document folders as a hard link"""
+    store = server.BlobStore(tmp_path / 'blobs', link_mode='hardlink')
+    requests = []
+
+    async with counting_client(requests) as client:
+        blob = await store.ensure(SIGN, URL, client)
+        again = await store.ensure(SIGN, URL, client)
+
+    assert blob == again and len(requests) == 1
+    assert blob.suffix == '.css'
+    assert store.stats['hits'] == 1 and store.stats['fetches'] == 1
+
+    first = tmp_path / 'doc1' / 'style.css'
+    second = tmp_path / 'doc2' / 'style.css'
+    store.materialize(blob, first)
+    store.materialize(blob, second)
+    assert os.path.samefile(first, blob) and os.path.samefile(second, blob)
+    assert first.read_bytes() == b'body{}'
+
+
+async def test_concurrent_ensure_downloads_once(tmp_path):
+    store = server.BlobStore(tmp_path / 'blobs')
+    requests = []
+
+    async with counting_client(requests) as client:
+        paths = await asyncio.gather(*(store.ensure(SIGN, URL, client) for _ in range(4)))
+
+    assert len(set(paths)) == 1 and len(requests) == 1
+
+
+async def test_materialize_replaces_file_without_writing_through(tmp_path):
+    """An existing document file is unlinked first, so the shared blob is never overwritten"""
+    store = server.BlobStore(tmp_path / 'blobs')
+    old_blob = tmp_path / 'old.css'
+    old_blob.write_bytes(b'old')
+    dest = tmp_path / 'doc' / 'style.css'
+    store.materialize(old_blob, dest)
+
+    new_blob = tmp_path / 'new.css'
+    new_blob.write_bytes(b'new')
+    store.materialize(new_blob, dest)
+
+    assert dest.read_bytes() == b'new'
+    assert old_blob.read_bytes() == b'old'
+
+
+def test_copy_mode_and_discard(tmp_path):
+    store = server.BlobStore(tmp_path / 'blobs', link_mode='copy')
+    blob = store.blob_path(SIGN)
+    blob.parent.mkdir(parents=True)
+    blob.write_bytes(b'body{}')
+    dest = tmp_path / 'doc' / 'style.css'
+
+    store.materialize(blob, dest)
+    assert dest.read_bytes() == b'body{}' and not os.path.samefile(dest, blob)
+
+    store.discard(SIGN)
+    assert not blob.exists() and dest.exists()
@@ -0,0 +1,184 @@
+"""Tests for the download engine: retry/backoff, per-host limits and streaming, resumable downloads"""
+
+import asyncio
+import hashlib
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import lanhu_mcp_server as server  # noqa: E402
+
+URL = 'https://cdn.example.com/blob.js'
+BODY = b'0123456789' * 10
+
+
+def make_engine(max_retries: int = 0) -> server.DownloadEngine:
+    return server.DownloadEngine(per_host=2, max_retries=max_retries, base_delay=0, max_delay=0)
+
+
+def leave_part(dest: Path, content: bytes, validator: str = '"v1"'):
+    """Simulate an interrupted download of URL into dest"""
+    tag = hashlib.md5(URL.encode('utf-8')).hexdigest()[:12]
+    dest.with_name(f"{dest.name}.{tag}.part").write_bytes(content)
+    dest.with_name(f"{dest.name}.{tag}.part.validator").write_text(validator, encoding='utf-8')
+
+
+async def download(engine: server.DownloadEngine, handler, dest: Path) -> int:
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        return await engine.download_to(client, URL, dest)
+
+
+async def test_streams_to_file_and_records_no_part(tmp_path):
+    dest = tmp_path / 'blob.js'
+    size = await download(make_engine(), lambda request: httpx.Response(200, content=BODY), dest)
+
+    assert size == len(BODY)
+    assert dest.read_bytes() == BODY
+    assert not list(tmp_path.glob('*.part*'))
+
+
+async def test_resumes_with_range_and_if_range(tmp_path):
+    """A leftover .part file is resumed with Range + If-Range and completed from a 206 response"""
+    dest = tmp_path / 'blob.js'
+    leave_part(dest, BODY[:40])
+    seen = []
+
+    def handler(request):
+        seen.append(dict(request.headers))
+        return httpx.Response(206, content=BODY[40:], headers={'Content-Range': f'bytes 40-99/{len(BODY)}'})
+
+    engine = make_engine()
+    size = await download(engine, handler, dest)
+
+    assert size == len(BODY)
+    assert dest.read_bytes() == BODY
+    assert seen[0]['range'] == 'bytes=40-'
+    assert seen[0]['if-range'] == '"v1"'
+    assert engine.stats['resumed'] == 1
+    assert not list(tmp_path.glob('*.part*'))
+
+
+async def test_restarts_when_server_ignores_range(tmp_path):
+    """A 200 response to a resume request rewrites the file from the start"""
+    dest = tmp_path / 'blob.js'
+    leave_part(dest, b'stale', validator='"old"')
+
+    engine = make_engine()
+    await download(engine, lambda request: httpx.Response(200, content=b'new content'), dest)
+
+    assert dest.read_bytes() == b'new content'
+    assert engine.stats['restarted'] == 1
+
+
+@pytest.mark.parametrize('content_range, content', [
+    ('bytes 0-99/100', BODY),             # whole file sent as 206
+    ('bytes 40-99/120', BODY[40:]),       # total no longer matches
+    (None, BODY[40:]),                    # Content-Range missing
+])
+async def test_restarts_when_content_range_does_not_continue_part(tmp_path, content_range, content):
+    """A 206 that does not start at the .part offset is discarded and the file downloaded from byte 0"""
+    dest = tmp_path / 'blob.js'
+    leave_part(dest, BODY[:40])
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get('Range'))
+        if request.headers.get('Range'):
+            headers = {'Content-Range': content_range} if content_range else {}
+            return httpx.Response(206, content=content, headers=headers)
+        return httpx.Response(200, content=BODY)
+
+    engine = make_engine()
+    size = await download(engine, handler, dest)
+
+    assert seen == ['bytes=40-', None]
+    assert size == len(BODY)
+    assert dest.read_bytes() == BODY
+    assert engine.stats['restarted'] == 1 and engine.stats['resumed'] == 0
+
+
+async def test_rejects_short_body(tmp_path):
+    """A body shorter than Content-Length fails and leaves no destination file"""
+    dest = tmp_path / 'blob.js'
+
+    def handler(request):
+        return httpx.Response(200, headers={'Content-Length': '100'}, stream=httpx.ByteStream(b'truncated'))
+
+    engine = make_engine()
+    with pytest.raises(httpx.TransportError):
+        await download(engine, handler, dest)
+
+    assert not dest.exists()
+    assert engine.stats['failures'] == 1
+    # Small partial files are not kept for resuming
+    assert not list(tmp_path.glob('*.part'))
+
+
+async def test_get_retries_retryable_status(monkeypatch):
+    """503/429 are retried with backoff (Retry-After honoured), then succeed"""
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(server.asyncio, 'sleep', fake_sleep)
+    replies = [httpx.Response(503), httpx.Response(429, headers={'Retry-After': '2'}), httpx.Response(200, text='ok')]
+    engine = server.DownloadEngine(per_host=1, max_retries=3, base_delay=0.5, max_delay=5)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(lambda request: replies.pop(0))) as client:
+        response = await engine.get(client, URL)
+
+    assert response.text == 'ok'
+    assert engine.stats['retries'] == 2 and engine.stats['failures'] == 0
+    assert 0 <= delays[0] <= 0.5 and delays[1] == 2
+
+
+async def test_get_does_not_retry_client_errors():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(404)
+
+    engine = make_engine(max_retries=3)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        with pytest.raises(httpx.HTTPStatusError):
+            await engine.get(client, URL)
+
+    assert len(requests) == 1 and engine.stats['failures'] == 1
+
+
+async def test_get_gives_up_after_max_retries():
+    def handler(request):
+        raise httpx.ConnectError('unreachable', request=request)
+
+    engine = make_engine(max_retries=2)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        with pytest.raises(httpx.ConnectError):
+            await engine.get(client, URL)
+
+    assert engine.stats['requests'] == 3 and engine.stats['retries'] == 2
+
+
+async def test_per_host_concurrency_limit():
+    active = peak = 0
+
+    async def handler(request):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return httpx.Response(200)
+
+    engine = server.DownloadEngine(per_host=2, max_retries=0, base_delay=0, max_delay=0)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        await asyncio.gather(*(engine.get(client, f"{URL}?n={n}") for n in range(6)))
+
+    assert peak == 2
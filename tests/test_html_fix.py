@@ -0,0 +1,46 @@
+"""Tests for per-page HTML fix-up during resource sync"""
+
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import lanhu_mcp_server as server  # noqa: E402
+
+PAGE = '''<html><head><script src="x.js"></script></head>
+<body style="display:none;"><img data-src="images/a.png"></body></html>'''
+
+
+def write_pages(directory: Path, count: int) -> list:
+    paths = []
+    for index in range(count):
+        path = directory / f"page{index}.html"
+        path.write_text(PAGE, encoding='utf-8')
+        paths.append(path)
+    return paths
+
+
+def test_fix_html_file_is_idempotent(tmp_path):
+    path, = write_pages(tmp_path, 1)
+
+    assert server.fix_html_file(str(path)) is True
+    fixed = path.read_text(encoding='utf-8')
+    assert 'src="images/a.png"' in fixed and 'data-src' not in fixed
+    assert 'display:none' not in fixed
+    assert 'function lanhu_Axure_Mapping_Data' in fixed
+
+    assert server.fix_html_file(str(path)) is False
+
+
+async def test_fix_html_pages_in_process_pool(tmp_path, monkeypatch):
+    """Large batches go through the process pool, whose workers are not forked"""
+    monkeypatch.setattr(server, 'HTML_FIX_PROCESS_THRESHOLD', 2)
+    paths = write_pages(tmp_path, 4)
+    try:
+        assert await server.fix_html_pages(paths) == [True] * 4
+        assert server._html_fix_executor._mp_context.get_start_method() != 'fork'
+    finally:
+        server.shutdown_html_fix_executor()
+    assert all('function lanhu_Axure_Mapping_Data' in path.read_text(encoding='utf-8') for path in paths)
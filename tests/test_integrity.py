@@ -0,0 +1,73 @@
+"""Tests for stat-gated content verification of cached files"""
+
+import os
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import lanhu_mcp_server as server  # noqa: E402
+
+
+def write(path: Path, content: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+
+
+async def test_unchanged_files_trust_fingerprint_without_hashing(tmp_path):
+    engine = server.IntegrityEngine(workers=2)
+    write(tmp_path / 'a.js', b'console.log(1)')
+    fingerprints = await engine.fingerprint_many(tmp_path, ['a.js', 'missing.js'])
+    assert list(fingerprints) == ['a.js']
+    hashed = engine.stats['hashed']
+
+    result = await engine.verify(tmp_path, {'a.js': None, 'missing.js': None}, fingerprints)
+
+    assert result == {'missing': ['missing.js'], 'corrupted': [], 'valid': ['a.js']}
+    assert engine.stats['stat_hits'] == 1 and engine.stats['hashed'] == hashed
+    engine.shutdown()
+
+
+async def test_detects_truncated_file(tmp_path):
+    engine = server.IntegrityEngine(workers=2)
+    path = tmp_path / 'app.js'
+    write(path, b'x' * 4096)
+    fingerprints = await engine.fingerprint_many(tmp_path, ['app.js'])
+
+    with open(path, 'r+b') as f:
+        f.truncate(1024)
+
+    result = await engine.verify(tmp_path, {'app.js': None}, fingerprints)
+    assert result['corrupted'] == ['app.js']
+    assert engine.stats['corrupted'] == 1
+    engine.shutdown()
+
+
+async def test_touched_but_identical_file_refreshes_fingerprint(tmp_path):
+    engine = server.IntegrityEngine(workers=2)
+    path = tmp_path / 'app.js'
+    write(path, b'same content')
+    fingerprints = await engine.fingerprint_many(tmp_path, ['app.js'])
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    result = await engine.verify(tmp_path, {'app.js': None}, fingerprints)
+
+    assert result['valid'] == ['app.js']
+    assert fingerprints['app.js'][1] == path.stat().st_mtime_ns
+    engine.shutdown()
+
+
+async def test_executor_is_recreated_after_shutdown(tmp_path):
+    """The lifespan can shut the hash pool down per session; later use recreates it"""
+    engine = server.IntegrityEngine(workers=1)
+    write(tmp_path / 'a.js', b'a')
+    await engine.fingerprint(tmp_path / 'a.js')
+    engine.shutdown()
+    assert engine._executor is None
+
+    write(tmp_path / 'b.js', b'b')
+    assert (await engine.fingerprint(tmp_path / 'b.js'))[2] == server._md5_file(tmp_path / 'b.js')
+    engine.shutdown()
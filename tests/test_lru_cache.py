@@ -0,0 +1,75 @@
+"""Tests for the bounded LRU cache and the per-version mapping cache"""
+
+import sys
+from pathlib import Path
+
+import httpx
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import lanhu_mcp_server as server  # noqa: E402
+
+
+def test_evicts_least_recently_used_by_size():
+    """Entries are evicted oldest-first once the byte limit is exceeded"""
+    cache = server.LRUCache('test', max_bytes=100)
+    cache.set('a', 1, size=40)
+    cache.set('b', 2, size=40)
+    assert cache.get('a') == 1  # 'a' becomes most recently used
+    cache.set('c', 3, size=40)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.total_bytes == 80
+    assert cache.stats['evictions'] == 1
+
+
+def test_evicts_by_entry_count_and_tracks_replaced_sizes():
+    cache = server.LRUCache('test', max_entries=2)
+    cache.set('a', 1, size=10)
+    cache.set('a', 2, size=30)
+    cache.set('b', 3)
+    cache.set('c', 4)
+
+    assert len(cache) == 2
+    assert cache.get('a') is None
+    assert cache.total_bytes == 2
+
+
+def test_expired_entries_are_misses():
+    cache = server.LRUCache('test')
+    cache.set('a', 1, ttl=-1)
+    cache.set('b', 2, ttl=60)
+
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    assert cache.stats['expired'] == 1
+    assert cache.snapshot()['entries'] == 1
+
+
+async def test_project_mapping_fetched_once_per_version(monkeypatch):
+    """Both callers of get_project_mapping share one download per version"""
+    monkeypatch.setattr(server, '_mapping_cache', server.LRUCache('mapping', max_entries=4))
+    body = b'{"pages": []}'
+    requests = []
+
+    def handler(request):
+        requests.append(str(request.url))
+        return httpx.Response(200, content=body)
+
+    extractor = server.LanhuExtractor()
+    extractor.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    doc_info = {'versions': [{'id': 'v1', 'json_url': 'https://cdn.example.com/map_v1.json'}]}
+    try:
+        first = await extractor.get_project_mapping(doc_info)
+        second = await extractor.get_project_mapping(doc_info)
+    finally:
+        await extractor.client.aclose()
+
+    assert first == {'pages': []} and second is first
+    assert requests == ['https://cdn.example.com/map_v1.json']
+    # Sized by the estimated parsed footprint, not the raw bytes
+    assert server._mapping_cache.total_bytes == len(body) * server.MAPPING_MEMORY_FACTOR
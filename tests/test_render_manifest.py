@@ -0,0 +1,90 @@
+"""Tests for the per-page screenshot cache manifest"""
+
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import lanhu_mcp_server as server  # noqa: E402
+
+
+def render_result(output_path: Path, page: str, content: str) -> dict:
+    screenshot = output_path / f"{page}.png"
+    text = output_path / f"{page}.txt"
+    screenshot.write_text(content, encoding='utf-8')
+    text.write_text(content, encoding='utf-8')
+    return {'screenshot_path': str(screenshot), 'text_path': str(text)}
+
+
+def test_record_and_archive(tmp_path):
+    """Recorded pages are reused by signature; a new signature archives the old files and persists"""
+    manifest = server.RenderManifest(tmp_path)
+    manifest.record('home', 'sig1', 'v1', render_result(tmp_path, 'home', 'old'))
+    assert manifest.lookup('home', 'sig1')['screenshot'] == 'home.png'
+    assert manifest.lookup('home', 'sig2') is None
+
+    manifest.archive('home', 'sig2')
+
+    entry = manifest.pages['home']
+    assert 'screenshot' not in entry and not (tmp_path / 'home.png').exists()
+    assert manifest.lookup('home', 'sig1') is None
+    archived = entry['history'][0]
+    assert archived['signature'] == 'sig1'
+    assert (tmp_path / archived['screenshot']).read_text(encoding='utf-8') == 'old'
+
+    # The archive is on disk even if the re-render never finishes
+    reloaded = server.RenderManifest(tmp_path)
+    assert reloaded.pages['home']['history'][0]['screenshot'] == archived['screenshot']
+    assert 'screenshot' not in reloaded.pages['home']
+
+    manifest.record('home', 'sig2', 'v2', render_result(tmp_path, 'home', 'new'))
+    assert manifest.lookup('home', 'sig2')['history'][0]['signature'] == 'sig1'
+
+
+def test_lookup_requires_files_on_disk(tmp_path):
+    manifest = server.RenderManifest(tmp_path)
+    manifest.record('home', 'sig1', 'v1', render_result(tmp_path, 'home', 'content'))
+    (tmp_path / 'home.png').unlink()
+
+    assert manifest.lookup('home', 'sig1') is None
+    assert manifest.lookup('home', None) is None
+
+
+def test_tiles_and_full_page_are_cached_separately(tmp_path):
+    manifest = server.RenderManifest(tmp_path)
+    tiles = []
+    for index in range(2):
+        tile = tmp_path / f"home_tile{index}.png"
+        tile.write_bytes(b'tile')
+        tiles.append(str(tile))
+    text = tmp_path / 'home.txt'
+    text.write_text('text', encoding='utf-8')
+    manifest.record('home', 'sig1', 'v1', {'text_path': str(text), 'tiles': tiles, 'tile_height': 1080})
+
+    assert manifest.lookup('home', 'sig1', tile_height=1080)['tiles'] == ['home_tile0.png', 'home_tile1.png']
+    assert manifest.lookup('home', 'sig1', tile_height=720) is None
+    assert manifest.lookup('home', 'sig1') is None
+
+    # A full-page render under the same signature is merged into the entry
+    manifest.record('home', 'sig1', 'v1', render_result(tmp_path, 'home', 'full'))
+    assert manifest.lookup('home', 'sig1') and manifest.lookup('home', 'sig1', tile_height=1080)
+
+
+def test_history_is_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'SCREENSHOT_HISTORY_LIMIT', 2)
+    manifest = server.RenderManifest(tmp_path)
+    for version in range(4):
+        manifest.archive('home', f"sig{version}")
+        manifest.record('home', f"sig{version}", f"v{version}", render_result(tmp_path, 'home', str(version)))
+
+    history = manifest.pages['home']['history']
+    assert [item['signature'] for item in history] == ['sig2', 'sig1']
+    assert len(list((tmp_path / 'history').glob('*.png'))) == 2
+
+
+def test_open_shares_instance_per_directory(tmp_path):
+    first = server.RenderManifest.open(tmp_path)
+    assert server.RenderManifest.open(tmp_path) is first
+    assert server.RenderManifest.open(tmp_path / 'other') is not first
@@ -0,0 +1,191 @@
+"""Tests for incremental Axure resource sync in download_resources"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import lanhu_mcp_server as server  # noqa: E402
+
+DOC_URL = 'https://lanhuapp.com/web/#/item/project/product?tid=t&pid=p&docId=d1234567890'
+
+
+class FakeLanhu:
+    """
+    In-memory Lanhu API and CDN
+
+    Every page uses the shared axure.css and document.js plus a script and an image of its own.
+    A page mapping (and so its mapping_md5) fixes the sign_md5 of every asset it lists.
+    """
+
+    def __init__(self):
+        self.version = 'v1'
+        self.pages = {f"p{i}.html": (f"h{i}", f"m{i}") for i in range(3)}
+        self.failing = set()
+        self.requests = []
+
+    def mapping(self) -> dict:
+        return {'pages': {name: {'html': {'sign_md5': html}, 'mapping_md5': page_mapping}
+                          for name, (html, page_mapping) in self.pages.items()}}
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        self.requests.append(path)
+        if path == '/api/project/image':
+            return httpx.Response(200, json={'code': '00000', 'result': {
+                'name': 'Doc',
+                'versions': [{'id': self.version, 'json_url': f"{server.CDN_URL}/map_{self.version}.json"}]
+            }})
+        if path.startswith('/map_'):
+            return httpx.Response(200, json=self.mapping())
+        if path in self.failing:
+            return httpx.Response(404)
+        name = path.strip('/')
+        if name.startswith('h'):
+            return httpx.Response(200, text=f'<html><head></head><body>{name}</body></html>')
+        if name.startswith('m'):
+            return httpx.Response(200, json={
+                'styles': {'resources/css/axure.css': {'sign_md5': 'css1'}},
+                'scripts': {'data/document.js': {'sign_md5': 'doc1'},
+                            f"files/{name}/data.js": {'sign_md5': f"js_{name}"}},
+                'images': {f"images/{name}/a.png": {'sign_md5': f"img_{name}"}},
+            })
+        return httpx.Response(200, content=f"asset {name}".encode())
+
+    def fetched(self, prefix: str) -> list:
+        return [path for path in self.requests if path.startswith(prefix)]
+
+
+@pytest.fixture
+def lanhu(tmp_path, monkeypatch):
+    fake = FakeLanhu()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(fake.handler))
+    monkeypatch.setattr(server, '_http_client', client)
+    monkeypatch.setattr(server, '_download_engine',
+                        server.DownloadEngine(per_host=4, max_retries=0, base_delay=0, max_delay=0))
+    monkeypatch.setattr(server, '_blob_store', server.BlobStore(tmp_path / 'blobs'))
+    monkeypatch.setattr(server, '_mapping_cache', server.LRUCache('mapping'))
+    yield fake
+
+
+async def sync(output_dir: Path) -> dict:
+    return await server.LanhuExtractor().download_resources(DOC_URL, str(output_dir))
+
+
+def local_files(output_dir: Path) -> set:
+    return {str(path.relative_to(output_dir)) for path in output_dir.rglob('*')
+            if path.is_file() and not path.name.startswith('.')}
+
+
+async def test_unchanged_version_is_served_from_cache(lanhu, tmp_path):
+    out = tmp_path / 'doc'
+    first = await sync(out)
+    assert first['status'] == 'downloaded' and first['complete']
+    assert set(first['page_index'].values()) == set(lanhu.pages)
+
+    lanhu.requests.clear()
+    second = await sync(out)
+    assert second['status'] == 'cached'
+    assert not lanhu.fetched('/h') and not lanhu.fetched('/m')
+
+
+async def test_new_version_reuses_unchanged_pages_and_prunes_removed(lanhu, tmp_path):
+    out = tmp_path / 'doc'
+    await sync(out)
+
+    lanhu.version = 'v2'
+    lanhu.pages['p1.html'] = ('h1b', 'm1b')
+    del lanhu.pages['p2.html']
+    lanhu.requests.clear()
+    result = await sync(out)
+
+    assert result['status'] == 'updated' and result['reason'] == 'version_changed'
+    assert sorted(lanhu.fetched('/h')) == ['/h1b']
+    assert result['sync']['pages_reused'] == 1 and result['sync']['pages_fetched'] == 1
+    assert local_files(out) == {
+        'p0.html', 'p1.html', 'resources/css/axure.css', 'data/document.js',
+        'files/m0/data.js', 'files/m1b/data.js', 'images/m0/a.png', 'images/m1b/a.png'
+    }
+    # p2.html plus the old script and image of p1 and p2
+    assert result['sync']['files_pruned'] == 5
+
+
+async def test_failed_assets_are_retried_on_next_call(lanhu, tmp_path):
+    out = tmp_path / 'doc'
+    lanhu.failing = {'/img_m1'}
+    first = await sync(out)
+    assert first['complete'] is False
+    assert [item['path'] for item in first['failed_assets']] == ['images/m1/a.png']
+
+    lanhu.failing = set()
+    lanhu.requests.clear()
+    second = await sync(out)
+
+    assert second['reason'] == 'incomplete' and second['complete']
+    assert lanhu.fetched('/img') == ['/img_m1']
+    assert second['sync']['files_downloaded'] == 1
+    assert (out / 'images' / 'm1' / 'a.png').exists()
+
+    assert (await sync(out))['status'] == 'cached'
+
+
+
+async def test_shared_assets_are_claimed_once(lanhu, tmp_path):
+    """Assets shared by pages synced concurrently are downloaded and counted once"""
+    out = tmp_path / 'doc'
+    first = await sync(out)
+    # axure.css + document.js + a script and an image per page
+    assert first['sync']['files_downloaded'] == 2 + 2 * len(lanhu.pages)
+    assert lanhu.fetched('/css1') == ['/css1'] and lanhu.fetched('/doc1') == ['/doc1']
+
+    lanhu.version = 'v2'
+    lanhu.pages = {name: (html + 'b', page_mapping) for name, (html, page_mapping) in lanhu.pages.items()}
+    second = await sync(out)
+    assert second['sync']['pages_fetched'] == len(lanhu.pages)
+    assert second['sync']['files_reused'] == 2 + 2 * len(lanhu.pages)
+    assert second['sync']['files_downloaded'] == 0
+
+
+async def test_pages_are_synced_concurrently(lanhu, tmp_path, monkeypatch):
+    active = peak = 0
+    fetch_html = server.LanhuExtractor._fetch_page_html
+
+    async def tracked(self, html_sign_md5):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        try:
+            return await fetch_html(self, html_sign_md5)
+        finally:
+            active -= 1
+
+    monkeypatch.setattr(server.LanhuExtractor, '_fetch_page_html', tracked)
+    await sync(tmp_path / 'doc')
+    assert peak == len(lanhu.pages)
+
+
+async def test_corrupted_asset_triggers_resync(lanhu, tmp_path):
+    out = tmp_path / 'doc'
+    await sync(out)
+    image = out / 'images' / 'm0' / 'a.png'
+    image.unlink()  # break the hard link before changing the content
+    image.write_bytes(b'x' * len(b'asset img_m0'))
+
+    result = await sync(out)
+    assert result['status'] == 'updated' and result['reason'] == 'files_corrupted'
+    assert image.read_bytes() == b'asset img_m0'
+
+
+async def test_concurrent_syncs_of_a_document_run_once(lanhu, tmp_path):
+    out = tmp_path / 'doc'
+    results = await asyncio.gather(*(sync(out) for _ in range(4)))
+
+    assert [result['status'] for result in results] == ['downloaded'] * 4
+    assert sorted(lanhu.fetched('/h')) == sorted(f"/{html}" for html, _ in lanhu.pages.values())
@@ -0,0 +1,65 @@
+"""Tests for serving Axure resources to the renderer through route interception"""
+
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import lanhu_mcp_server as server  # noqa: E402
+
+
+class FakeRoute:
+    """Minimal stand-in for a Playwright route"""
+
+    def __init__(self, url: str):
+        self.request = type('Request', (), {'url': url})()
+        self.fulfilled = None
+
+    async def fulfill(self, **kwargs):
+        self.fulfilled = kwargs
+
+
+async def serve(handle, path: str) -> dict:
+    route = FakeRoute(f"{server.AXURE_LOCAL_ORIGIN}/{path}")
+    await handle(route)
+    return route.fulfilled
+
+
+async def test_serves_files_in_resource_dir(tmp_path):
+    (tmp_path / 'files').mkdir()
+    (tmp_path / 'files' / 'page.js').write_text('var a;', encoding='utf-8')
+    handle = server._resource_route_handler(str(tmp_path))
+
+    assert await serve(handle, 'files/page.js') == {'path': str((tmp_path / 'files' / 'page.js').resolve())}
+    assert (await serve(handle, 'files/missing.js'))['status'] == 404
+
+
+async def test_serves_assets_symlinked_into_blob_store(tmp_path, monkeypatch):
+    """BLOB_LINK_MODE=symlink (or the hardlink fallback) links assets to DATA_DIR/blobs"""
+    monkeypatch.setattr(server, 'BLOB_STORE_DIR', tmp_path / 'blobs')
+    store = server.BlobStore(tmp_path / 'blobs', link_mode='symlink')
+    blob = store.blob_path('abc/style.css')
+    blob.parent.mkdir(parents=True)
+    blob.write_bytes(b'body{}')
+    doc_dir = tmp_path / 'doc'
+    store.materialize(blob, doc_dir / 'files' / 'style.css')
+    assert (doc_dir / 'files' / 'style.css').is_symlink()
+    handle = server._resource_route_handler(str(doc_dir))
+
+    assert await serve(handle, 'files/style.css') == {'path': str(blob.resolve())}
+
+
+async def test_rejects_paths_outside_resource_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'BLOB_STORE_DIR', tmp_path / 'blobs')
+    doc_dir = tmp_path / 'doc'
+    doc_dir.mkdir()
+    (tmp_path / 'secret.txt').write_text('secret', encoding='utf-8')
+    # Links pointing outside both the document folder and the blob store are refused too
+    (doc_dir / 'link.txt').symlink_to(tmp_path / 'secret.txt')
+    handle = server._resource_route_handler(str(doc_dir))
+
+    assert (await serve(handle, '%2E%2E/secret.txt'))['status'] == 404
+    assert (await serve(handle, 'files/%2E%2E/%2E%2E/secret.txt'))['status'] == 404
+    assert (await serve(handle, 'link.txt'))['status'] == 404
@@ -0,0 +1,111 @@
+"""Tests for single-flight coalescing of concurrent identical calls"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import lanhu_mcp_server as server  # noqa: E402
+
+
+async def test_coalesces_concurrent_calls():
+    """Concurrent calls with the same key share one execution"""
+    flight = server.SingleFlight('test')
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return 'done'
+
+    results = await asyncio.gather(*(flight.do('key', work) for _ in range(5)))
+    assert results == ['done'] * 5
+    assert calls == 1
+    assert flight.snapshot() == {'calls': 5, 'leaders': 1, 'joins': 4, 'errors': 0, 'retries': 0, 'inflight': 0}
+
+
+async def test_does_not_cache_after_completion():
+    """Only in-flight calls are shared; a later call runs again"""
+    flight = server.SingleFlight('test')
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        return calls
+
+    assert await flight.do('key', work) == 1
+    assert await flight.do('key', work) == 2
+
+
+async def test_errors_propagate_to_every_caller():
+    flight = server.SingleFlight('test')
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError('upstream failed')
+
+    results = await asyncio.gather(*(flight.do('key', work) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.stats['errors'] == 1
+
+
+async def test_cancelled_joiner_does_not_cancel_shared_call():
+    flight = server.SingleFlight('test')
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        return 'done'
+
+    leader = asyncio.create_task(flight.do('key', work))
+    joiner = asyncio.create_task(flight.do('key', work))
+    await asyncio.sleep(0)
+    joiner.cancel()
+    release.set()
+
+    assert await leader == 'done'
+    with pytest.raises(asyncio.CancelledError):
+        await joiner
+
+
+async def test_request_key_ignores_param_order():
+    assert (server._request_key('get', 'https://a/api', {'b': 1, 'a': 2}) ==
+            server._request_key('GET', 'https://a/api', {'a': 2, 'b': 1}))
+
+
+async def test_joiners_retry_when_leader_cancelled():
+    """With cancel_with_leader, joiners re-run their own func after the leader is cancelled"""
+    flight = server.SingleFlight('test')
+    started = asyncio.Event()
+
+    async def leader_work():
+        started.set()
+        await asyncio.sleep(10)
+        return 'leader'
+
+    async def joiner_work():
+        return 'joiner'
+
+    leader = asyncio.create_task(flight.do('key', leader_work, cancel_with_leader=True))
+    await started.wait()
+    joiner = asyncio.create_task(flight.do('key', joiner_work, cancel_with_leader=True))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await joiner == 'joiner'
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    assert flight.stats['retries'] == 1
+
+
+def test_document_lock_is_shared_per_directory(tmp_path):
+    lock = server._document_lock(tmp_path)
+    assert server._document_lock(str(tmp_path)) is lock
+    assert server._document_lock(tmp_path / 'other') is not lock
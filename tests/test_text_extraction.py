@@ -0,0 +1,59 @@
+"""Tests for browser-free page text extraction (mode="text_only")"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import lanhu_mcp_server as server  # noqa: E402
+
+FIXTURES_DIR = project_root / 'benchmarks' / 'fixtures'
+
+
+@pytest.mark.parametrize('fixture, expected', [
+    ('login_form.html', '验证码 60 秒内不可重复获取'),
+    ('order_flowchart.html', '支付回调需幂等处理'),
+    ('order_table.html', '金额列保留两位小数，退款中的订单整行标红'),
+])
+def test_fixture_red_text_from_style_element(fixture, expected):
+    """Red set by a class rule in an inline <style> block is reported as a warning"""
+    sections = server.extract_page_sections(FIXTURES_DIR / fixture)
+    assert expected in sections['red_texts']
+    assert '[Important Tips/Warnings]' in server._format_page_sections(sections)
+
+
+def test_fixture_shape_and_full_text():
+    sections = server.extract_page_sections(FIXTURES_DIR / 'order_flowchart.html')
+    assert '用户提交订单' in sections['shape_texts']
+    assert len(sections['shape_texts']) > 5
+    assert '用户提交订单' in sections['full_text']
+
+
+def test_color_rules_cascade(tmp_path):
+    """id beats class beats tag, inline style beats all, and linked stylesheets are read"""
+    (tmp_path / 'page.css').write_text('#u3 { color: #ff0000; }', encoding='utf-8')
+    (tmp_path / 'page.html').write_text('''<html><head>
+<link rel="stylesheet" href="page.css">
+<style>
+  /* .hint { color: red; } is commented out */
+  span { color: #333; }
+  .warn, p.alert { color: rgb(255, 0, 0); }
+  #u2 { color: black; }
+  .warn:hover { color: blue; }
+</style>
+</head><body>
+<span class="warn">class warning</span>
+<p class="alert">tag and class warning</p>
+<div class="alert">tag mismatch</div>
+<span id="u2" class="warn">id overrides class</span>
+<span class="warn" style="color: green">inline overrides class</span>
+<div id="u3">linked stylesheet warning</div>
+<span class="hint">commented out</span>
+</body></html>''', encoding='utf-8')
+
+    red_texts = server.extract_page_sections(tmp_path / 'page.html')['red_texts']
+    assert red_texts == ['class warning', 'tag and class warning', 'linked stylesheet warning']
@@ -0,0 +1,106 @@
+"""Tests for the per-version page text store"""
+
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import lanhu_mcp_server as server  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_instances(monkeypatch):
+    monkeypatch.setattr(server.PageTextStore, '_instances', server.LRUCache('page_text', max_entries=8))
+
+
+def test_get_requires_matching_signature(tmp_path):
+    store = server.PageTextStore.open(tmp_path, 'v1')
+    store.put('home', 'sig1', {'full_text': 'hello'}, 'static')
+
+    assert store.get('home', 'sig1') == {'full_text': 'hello'}
+    assert store.get('home', 'sig2') is None
+    assert store.get('home', None) is None
+    assert store.get('missing', 'sig1') is None
+
+
+def test_static_text_does_not_replace_rendered_text(tmp_path):
+    """Rendered text (computed styles) wins over the static parse for the same signature"""
+    store = server.PageTextStore.open(tmp_path, 'v1')
+    store.put('home', 'sig1', {'full_text': 'rendered'}, 'render')
+    store.put('home', 'sig1', {'full_text': 'static'}, 'static')
+    assert store.get('home', 'sig1') == {'full_text': 'rendered'}
+
+    # A new signature means the page changed, so the static parse is taken
+    store.put('home', 'sig2', {'full_text': 'static'}, 'static')
+    assert store.get('home', 'sig2') == {'full_text': 'static'}
+
+    store.put('home', 'sig2', {'full_text': 'rendered'}, 'render')
+    assert store.get('home', 'sig2') == {'full_text': 'rendered'}
+
+
+def test_entries_without_signature_are_not_stored(tmp_path):
+    store = server.PageTextStore.open(tmp_path, 'v1')
+    store.put('home', None, {'full_text': 'hello'}, 'render')
+    assert store.pages == {} and not store.dirty
+
+
+def test_save_writes_once_and_reloads(tmp_path):
+    store = server.PageTextStore.open(tmp_path, 'v1/2')
+    store.put('home', 'sig', {'full_text': '你好'}, 'render')
+    store.save()
+
+    path = tmp_path / 'v1_2.json'
+    assert json.loads(path.read_text(encoding='utf-8'))['pages']['home']['source'] == 'render'
+    assert not store.dirty
+
+    # Nothing changed: the file is not rewritten
+    os.utime(path, (1, 1))
+    store.save()
+    assert path.stat().st_mtime == 1
+
+    assert server.PageTextStore(path.resolve()).get('home', 'sig') == {'full_text': '你好'}
+
+
+def test_save_prunes_old_versions(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'TEXT_STORE_VERSION_LIMIT', 2)
+    for index, version in enumerate(['v1', 'v2', 'v3']):
+        store = server.PageTextStore.open(tmp_path, version)
+        store.put('home', 'sig', {'full_text': version}, 'render')
+        store.save()
+        os.utime(store.path, (1000 + index, 1000 + index))
+
+    store = server.PageTextStore.open(tmp_path, 'v4')
+    store.put('home', 'sig', {'full_text': 'v4'}, 'render')
+    store.save()
+
+    assert sorted(p.name for p in tmp_path.glob('*.json')) == ['v3.json', 'v4.json']
+    assert str((tmp_path / 'v1.json').resolve()) not in server.PageTextStore._instances
+
+
+def test_corrupted_file_starts_empty(tmp_path):
+    (tmp_path / 'v1.json').write_text('{not json', encoding='utf-8')
+    store = server.PageTextStore.open(tmp_path, 'v1')
+    assert store.pages == {}
+    assert store.get('home', 'sig') is None
+
+
+def test_page_text_store_evicts_open_instances(tmp_path, monkeypatch):
+    """Open stores are capped; an evicted store reloads its saved pages from disk"""
+    monkeypatch.setattr(server.PageTextStore, '_instances', server.LRUCache('page_text', max_entries=2))
+    first = server.PageTextStore.open(tmp_path / 'doc1', 'v1')
+    first.put('home', 'sig', {'full_text': 'hello'}, 'render')
+    first.save()
+
+    server.PageTextStore.open(tmp_path / 'doc2', 'v1')
+    server.PageTextStore.open(tmp_path / 'doc3', 'v1')
+    assert len(server.PageTextStore._instances) == 2
+
+    reopened = server.PageTextStore.open(tmp_path / 'doc1', 'v1')
+    assert reopened is not first
+    assert reopened.get('home', 'sig') == {'full_text': 'hello'}
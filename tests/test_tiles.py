@@ -0,0 +1,93 @@
+"""Tests for budgeted screenshot tiles and their continuation tokens"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import lanhu_mcp_server as server  # noqa: E402
+
+PAGES = ['home', 'detail', 'cart']
+
+
+def test_token_round_trip():
+    token = server._encode_tile_token('v1', PAGES, 1, 3)
+    assert '=' not in token
+    assert server._decode_tile_token(token, 'v1', PAGES) == (1, 3)
+
+
+@pytest.mark.parametrize('version_id, pages', [
+    ('v2', PAGES),            # document changed since the token was issued
+    ('v1', PAGES[:2]),        # different page selection
+])
+def test_token_rejected_for_other_request(version_id, pages):
+    token = server._encode_tile_token('v1', PAGES, 1, 0)
+    with pytest.raises(ValueError, match='does not match'):
+        server._decode_tile_token(token, version_id, pages)
+
+
+@pytest.mark.parametrize('token', ['garbage', '', server._encode_tile_token('v1', PAGES, 5, 0)])
+def test_malformed_or_out_of_range_token(token):
+    with pytest.raises(ValueError):
+        server._decode_tile_token(token, 'v1', PAGES)
+
+
+@pytest.fixture
+def fake_images(monkeypatch):
+    """Every tile compresses to 100 bytes"""
+    async def prepare(path):
+        return {'path': path, 'output_bytes': 100}
+
+    monkeypatch.setattr(server, 'prepare_client_image', prepare)
+
+
+def page_results(*tile_counts) -> list:
+    return [{'success': True, 'tiles': [f"{PAGES[page]}_{tile}.png" for tile in range(count)]}
+            for page, count in enumerate(tile_counts)]
+
+
+async def select(results, start_page=0, start_tile=0, max_tiles=0, max_image_bytes=0):
+    return await server._select_client_tiles(results, 'v1', PAGES, start_page, start_tile,
+                                             max_tiles, max_image_bytes)
+
+
+async def test_budget_by_tile_count(fake_images):
+    results = page_results(3, 2)
+    images, token = await select(results, max_tiles=4)
+
+    assert [image['path'] for image in images] == ['home_0.png', 'home_1.png', 'home_2.png', 'detail_0.png']
+    assert [tile['tile'] for tile in results[1]['client_tiles']] == [1]
+    assert server._decode_tile_token(token, 'v1', PAGES) == (1, 1)
+
+
+async def test_budget_by_bytes_and_continuation(fake_images):
+    images, token = await select(page_results(3, 2), max_image_bytes=250)
+    assert len(images) == 2
+    assert server._decode_tile_token(token, 'v1', PAGES) == (0, 2)
+
+    # Continue: results start at the token's page
+    rest = page_results(3, 2)
+    images, token = await select(rest, start_page=0, start_tile=2, max_image_bytes=250)
+    assert [image['path'] for image in images] == ['home_2.png', 'detail_0.png']
+    assert server._decode_tile_token(token, 'v1', PAGES) == (1, 1)
+
+
+async def test_at_least_one_tile_and_no_token_when_done(fake_images):
+    # A single tile over the byte budget is still returned so every call makes progress
+    images, token = await select(page_results(2), max_image_bytes=10)
+    assert len(images) == 1
+    assert server._decode_tile_token(token, 'v1', PAGES) == (0, 1)
+
+    images, token = await select(page_results(2, 1), max_tiles=10)
+    assert len(images) == 3 and token is None
+
+
+async def test_failed_pages_are_skipped(fake_images):
+    results = page_results(1, 1)
+    results[0] = {'success': False}
+    images, token = await select(results, max_tiles=5)
+    assert [image['path'] for image in images] == ['detail_0.png'] and token is None
@@ -0,0 +1,79 @@
+"""Tests for version history and page-level version comparison"""
+
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import lanhu_mcp_server as server  # noqa: E402
+
+
+def test_diff_page_signatures():
+    old = {'home': 'a', 'cart': 'b', 'legacy': 'c'}
+    new = {'home': 'a', 'cart': 'B', 'search': 'd'}
+
+    assert server.diff_page_signatures(old, new) == {
+        'added': ['search'],
+        'removed': ['legacy'],
+        'changed': ['cart'],
+        'unchanged': ['home']
+    }
+
+
+def test_find_version_by_id_or_unique_prefix():
+    meta = {'versions': [{'version_id': 'abc123'}, {'version_id': 'abd456'}, {'version_id': 'ab'}]}
+
+    assert server._find_version(meta, 'abc123') == {'version_id': 'abc123'}
+    assert server._find_version(meta, 'abd') == {'version_id': 'abd456'}
+    # An exact match wins over the other versions sharing the prefix
+    assert server._find_version(meta, 'ab') == {'version_id': 'ab'}
+    assert server._find_version({'versions': meta['versions'][:2]}, 'ab') is None
+    assert server._find_version(meta, 'zzz') is None
+    assert server._find_version(meta, '') is None
+    assert server._find_version({}, 'abc123') is None
+
+
+def page_meta(html_sign: str) -> dict:
+    return {'pages': {'home.html': {'html': html_sign, 'mapping': 'm', 'assets': {}}}}
+
+
+def test_record_version_puts_newest_first(monkeypatch):
+    monkeypatch.setattr(server, 'VERSION_HISTORY_LIMIT', 2)
+    versions = server.LanhuExtractor._record_version([], 'v1', page_meta('h1'))
+    versions = server.LanhuExtractor._record_version(versions, 'v2', page_meta('h2'))
+
+    assert [v['version_id'] for v in versions] == ['v2', 'v1']
+    assert versions[0]['signatures']['home'] != versions[1]['signatures']['home']
+
+    # Re-syncing an existing version moves it to the front instead of duplicating it
+    versions = server.LanhuExtractor._record_version(versions, 'v1', page_meta('h1'))
+    assert [v['version_id'] for v in versions] == ['v1', 'v2']
+
+    versions = server.LanhuExtractor._record_version(versions, 'v3', page_meta('h3'))
+    assert [v['version_id'] for v in versions] == ['v3', 'v1']
+
+
+def test_record_version_skips_cache_without_page_records():
+    """Old-format caches have no per-page records, so they cannot serve as a baseline"""
+    versions = [{'version_id': 'v1', 'signatures': {'home': 'a'}}]
+    assert server.LanhuExtractor._record_version(versions, 'v2', {'version_id': 'v2'}) == versions
+    assert server.LanhuExtractor._record_version(versions, 'v1', {}) == []
+
+
+def test_render_diff_heatmap(tmp_path):
+    old_path, new_path = tmp_path / 'old.png', tmp_path / 'new.png'
+    Image.new('RGB', (100, 100), 'white').save(old_path)
+    new_image = Image.new('RGB', (100, 120), 'white')
+    new_image.paste((0, 0, 0), (10, 10, 20, 20))
+    new_image.save(new_path)
+
+    heatmap = server._render_diff_heatmap(old_path, new_path, tmp_path / 'diff' / 'home.png')
+
+    # The old page is padded with white to the new height, so only the black block counts
+    assert heatmap['changed_ratio'] == 100 / (100 * 120)
+    assert heatmap['bbox'] == (10, 10, 20, 20)
+    assert Path(heatmap['path']).exists()